@@ -0,0 +1,3 @@
+"""
+Micro benchmarks, run them with ``python -m kade_drive.benchmarks.<name>``.
+"""
@@ -0,0 +1,80 @@
+"""
+Cost of RoutingTable.add_contact churn on full tables.
+
+Fills a table with --contacts contacts, so its buckets are full and have
+replacement nodes, then replays --rounds rounds where a contact leaves and
+a new one arrives, with KBucket.depth computed over integer ids and with the
+bit strings it replaced. Pings of the head of full buckets are skipped, only
+the table is measured.
+
+    python -m kade_drive.benchmarks.churn --contacts 5000
+"""
+import random
+import logging
+import argparse
+import time
+from contextlib import nullcontext
+
+from kade_drive.core import routing
+from kade_drive.core.node import Node
+from kade_drive.core.routing import KBucket, RoutingTable
+from kade_drive.core.utils import digest, shared_prefix, bytes_to_bit_string
+
+
+def string_depth(bucket: KBucket) -> int:
+    """
+    The previous KBucket.depth: shared prefix of the ids as bit strings.
+    """
+    bits = [bytes_to_bit_string(n.id) for n in bucket.nodes.values()]
+    return len(shared_prefix(bits))
+
+
+class NoPing:
+    @staticmethod
+    def call_ping(conn, node_to_ask):
+        return None
+
+
+def churn(table: RoutingTable, contacts: list[Node], rounds: int) -> float:
+    start = time.perf_counter()
+    for i in range(rounds):
+        table.remove_contact(contacts[i % len(contacts)])
+        table.add_contact(Node(digest(f"new {i}"), "10.0.0.1", 8086))
+        table.add_contact(contacts[i % len(contacts)])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--contacts", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--rounds", type=int, default=20000)
+    parser.add_argument("--ksize", type=int, default=20)
+    args = parser.parse_args()
+
+    # full buckets log the head they would ping
+    logging.disable(logging.CRITICAL)
+    routing.ServerSession = lambda ip, port: nullcontext()
+    routing.FileSystemProtocol = NoPing
+    integer_depth = KBucket.depth
+    for size in args.contacts:
+        contacts = [Node(digest(i), "10.0.0.1", 8086) for i in range(size)]
+        times = {}
+        for name, depth in (("integer", integer_depth), ("bit string", string_depth)):
+            KBucket.depth = depth
+            table = RoutingTable(args.ksize, Node(digest("self")))
+            for node in contacts:
+                table.add_contact(node)
+            random.seed(size)
+            times[name] = churn(table, random.sample(contacts, size), args.rounds)
+        KBucket.depth = integer_depth
+        print(
+            f"{size:6} contacts, {len(table.buckets)} buckets: "
+            + ", ".join(
+                f"{name} {t / args.rounds * 1e6:7.2f} us" for name, t in times.items()
+            )
+            + " per round"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Chunk read throughput of the RPC transports and of the data plane.
+
+Serves --chunks chunks of --chunk-size bytes from memory and reads them
+back --rounds times through rpyc, the asyncio transport and the data plane,
+all in this process. Prints the throughput in MB/s and in MB per CPU second,
+the throughput one core sustains for both ends of the transfer.
+
+    python -m kade_drive.benchmarks.dataplane --chunk-size 1048576
+"""
+import os
+import time
+import socket
+import argparse
+import threading
+
+import rpyc
+from rpyc.utils.server import ThreadedServer
+
+from kade_drive.core.dataplane import DataPlaneClient, DataPlaneServer
+from kade_drive.core.transport import AsyncioServer, asyncio_connect
+
+CHUNKS: dict[bytes, bytes] = {}
+
+
+@rpyc.service
+class ChunkService(rpyc.Service):
+    @rpyc.exposed
+    def rpc_get_file_chunk_value(self, key):
+        return CHUNKS.get(key)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port: int):
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+
+def start_rpyc() -> int:
+    port = free_port()
+    server = ThreadedServer(
+        ChunkService,
+        hostname="127.0.0.1",
+        port=port,
+        protocol_config={"allow_pickle": False, "sync_request_timeout": None},
+    )
+    threading.Thread(target=server.start, daemon=True).start()
+    wait_for(port)
+    return port
+
+
+def start_asyncio() -> int:
+    port = free_port()
+    server = AsyncioServer(ChunkService, hostname="127.0.0.1", port=port)
+    threading.Thread(target=server.start, daemon=True).start()
+    wait_for(port)
+    return port
+
+
+def start_data_plane() -> int:
+    server = DataPlaneServer(CHUNKS.get, hostname="127.0.0.1")
+    threading.Thread(target=server.start, daemon=True).start()
+    return server.port
+
+
+def measure(read, rounds: int) -> tuple[float, float, int]:
+    """
+    Wall seconds, CPU seconds and bytes of reading every chunk rounds times.
+    """
+    total = 0
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(rounds):
+        for key in CHUNKS:
+            total += len(read(key))
+    return time.perf_counter() - wall, time.process_time() - cpu, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunk-size", type=int, default=1024 * 1024)
+    parser.add_argument("--chunks", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=4)
+    args = parser.parse_args()
+
+    for i in range(args.chunks):
+        CHUNKS[i.to_bytes(20, "big")] = os.urandom(args.chunk_size)
+
+    rpyc_conn = rpyc.connect(
+        "127.0.0.1", start_rpyc(), config={"sync_request_timeout": None}
+    )
+    asyncio_conn = asyncio_connect("127.0.0.1", start_asyncio())
+    data_port = start_data_plane()
+    data_client = DataPlaneClient()
+    readers = {
+        "rpyc": rpyc_conn.root.rpc_get_file_chunk_value,
+        "asyncio": asyncio_conn.root.rpc_get_file_chunk_value,
+        "data plane": lambda key: data_client.fetch("127.0.0.1", data_port, key),
+    }
+
+    print(
+        f"{args.chunks} chunks of {args.chunk_size} bytes read {args.rounds} times"
+    )
+    for name, read in readers.items():
+        # warm up the connection
+        read(next(iter(CHUNKS)))
+        wall, cpu, total = measure(read, args.rounds)
+        megabytes = total / 1024 / 1024
+        print(
+            f"  {name:>10}: {megabytes / wall:8.1f} MB/s "
+            f"{megabytes / cpu:8.1f} MB/s per core"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Encode/decode throughput of the erasure coded storage class and its storage
+overhead compared to k-way replication.
+"""
+import os
+import time
+import argparse
+
+from kade_drive.core.erasure import ReedSolomon
+
+
+def measure(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(data_shards: int, parity_shards: int, shard_size: int, ksize: int, repeat: int):
+    codec = ReedSolomon(data_shards, parity_shards)
+    data = [os.urandom(shard_size) for _ in range(data_shards)]
+    parity = codec.encode(data)
+    fragments = dict(enumerate(data + parity))
+    # worst case, rebuild after losing as many data fragments as possible
+    lost = min(parity_shards, data_shards)
+    degraded = {i: f for i, f in fragments.items() if i >= lost}
+
+    megabytes = data_shards * shard_size / 2**20
+    encode_time = measure(lambda: codec.encode(data), repeat)
+    decode_time = measure(lambda: codec.decode(degraded), repeat)
+
+    print(f"RS({data_shards}+{parity_shards}) shard {shard_size} bytes")
+    print(f"  encode: {megabytes / encode_time:8.2f} MB/s")
+    print(f"  decode: {megabytes / decode_time:8.2f} MB/s ({lost} fragments lost)")
+    print(
+        f"  storage overhead: {(data_shards + parity_shards) / data_shards:.2f}x"
+        f" erasure vs {ksize:.2f}x replication"
+    )
+    print(
+        f"  tolerated losses: {parity_shards} fragments vs {ksize - 1} replicas"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data-shards", type=int, default=4)
+    parser.add_argument("--parity-shards", type=int, default=2)
+    parser.add_argument("--ksize", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    for shard_size in (500, 64 * 1024, 1024 * 1024):
+        run(args.data_shards, args.parity_shards, shard_size, args.ksize, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
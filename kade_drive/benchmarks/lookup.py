@@ -0,0 +1,169 @@
+"""
+Lookup latency percentiles of a local cluster.
+
+Starts --nodes server processes on consecutive ports, bootstraps every one
+of them from the first, then times `get` of keys that are not stored, which
+crawls the network until the closest peers of the key have been asked.
+--latency-ms adds a delay to every peer RPC to emulate a real network.
+
+    python -m kade_drive.benchmarks.lookup --nodes 50 --latency-ms 20
+    python -m kade_drive.benchmarks.lookup --nodes 50 --transport asyncio
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+import rpyc
+
+from kade_drive.core.transport import asyncio_connect
+
+PEER_RPCS = (
+    "rpc_find_node",
+    "rpc_find_value",
+    "rpc_find_chunk_location",
+    "rpc_ping",
+    "rpc_store",
+    "rpc_check_if_new_value_exists",
+)
+
+
+def add_latency(service, seconds: float):
+    for name in PEER_RPCS:
+        method = getattr(service, name)
+
+        def delayed(*args, _method=method, **kwargs):
+            time.sleep(seconds)
+            return _method(*args, **kwargs)
+
+        setattr(service, name, delayed)
+        setattr(service, "exposed_" + name, delayed)
+
+
+def serve(
+    port: int, bootstrap: int | None, ksize: int, latency_ms: float, transport: str
+):
+    # imported here so the parent process does not start any server thread
+    from kade_drive.core.config import Config
+    from kade_drive.core.network import Server, ServerService
+
+    logging.basicConfig(level=logging.CRITICAL + 1)
+    logging.disable(logging.CRITICAL)
+    if latency_ms:
+        add_latency(ServerService, latency_ms / 1000)
+    Server.init(
+        Config(refresh_sleep=3600),
+        ksize=ksize,
+        ip="127.0.0.1",
+        port=port,
+        transport=transport,
+    )
+    time.sleep(0.5)
+    if bootstrap is not None:
+        Server.bootstrap([("127.0.0.1", bootstrap)])
+    print("ready", flush=True)
+    while True:
+        time.sleep(60)
+
+
+def start_cluster(args) -> list[subprocess.Popen]:
+    processes = []
+    for i in range(args.nodes):
+        port = args.port + i
+        directory = tempfile.mkdtemp(prefix=f"kade-{port}-")
+        command = [
+            sys.executable,
+            "-m",
+            "kade_drive.benchmarks.lookup",
+            "--serve",
+            str(port),
+            "--ksize",
+            str(args.ksize),
+            "--latency-ms",
+            str(args.latency_ms),
+            "--transport",
+            args.transport,
+        ]
+        if i:
+            command += ["--bootstrap", str(args.port)]
+        process = subprocess.Popen(
+            command,
+            cwd=directory,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        )
+        process.stdout.readline()
+        processes.append(process)
+    return processes
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def measure(args) -> list[float]:
+    latencies = []
+    connections = {}
+    for _ in range(args.lookups):
+        port = args.port + random.randrange(args.nodes)
+        if port not in connections and args.transport == "asyncio":
+            connections[port] = asyncio_connect("127.0.0.1", port)
+        elif port not in connections:
+            connections[port] = rpyc.connect(
+                "127.0.0.1",
+                port,
+                config={"allow_pickle": True, "sync_request_timeout": None},
+            )
+        key = f"missing-{random.getrandbits(64)}"
+        start = time.perf_counter()
+        connections[port].root.get(key)
+        latencies.append(time.perf_counter() - start)
+    for conn in connections.values():
+        conn.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--port", type=int, default=9300)
+    parser.add_argument("--ksize", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--settle", type=float, default=5)
+    parser.add_argument("--transport", choices=("rpyc", "asyncio"), default="rpyc")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--bootstrap", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        serve(args.serve, args.bootstrap, args.ksize, args.latency_ms, args.transport)
+        return
+
+    processes = start_cluster(args)
+    try:
+        time.sleep(args.settle)
+        latencies = measure(args)
+    finally:
+        for process in processes:
+            process.kill()
+
+    print(
+        f"{args.nodes} nodes, k={args.ksize}, {args.latency_ms} ms per RPC, "
+        f"{args.lookups} lookups over {args.transport}"
+    )
+    print(f"  mean: {statistics.mean(latencies) * 1000:8.1f} ms")
+    for fraction in (0.5, 0.9, 0.99):
+        print(f"  p{int(fraction * 100)}: {percentile(latencies, fraction) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
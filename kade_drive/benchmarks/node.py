@@ -0,0 +1,77 @@
+"""
+Memory and construction cost of Node.
+
+Builds --nodes nodes with the slotted Node and with the previous Node with
+a __dict__, measuring the memory they take with tracemalloc, then times
+building the nodes of --messages find responses of k peers each, with a
+new Node per peer and with the interned peer_node.
+
+    python -m kade_drive.benchmarks.node --nodes 100000
+"""
+import random
+import argparse
+import time
+import tracemalloc
+
+from kade_drive.core.node import Node, peer_node
+from kade_drive.core.utils import digest
+
+
+class DictNode:
+    """
+    The previous Node: attributes in a __dict__ and ids parsed from hex.
+    """
+
+    def __init__(self, node_id: bytes, ip=None, port=None):
+        self.id = node_id  # pylint: disable=invalid-name
+        self.ip = ip  # pylint: disable=invalid-name
+        self.port = port
+        self.long_id = int(node_id.hex(), 16)
+
+
+def memory_of(node_class, triples) -> tuple[float, list]:
+    tracemalloc.start()
+    nodes = [node_class(*triple) for triple in triples]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / len(triples), nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--peers", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--ksize", type=int, default=20)
+    args = parser.parse_args()
+
+    # ids and addresses are built beforehand, only the nodes are measured
+    triples = [
+        (digest(i), f"10.0.{i // 256 % 256}.{i % 256}", 8086) for i in range(args.nodes)
+    ]
+    print(f"memory of {args.nodes} nodes")
+    for node_class in (Node, DictNode):
+        per_node, _ = memory_of(node_class, triples)
+        print(f"  {node_class.__name__:>8}: {per_node:6.0f} bytes per node")
+
+    peers = triples[: args.peers]
+    messages = [random.sample(peers, args.ksize) for _ in range(args.messages)]
+    print(
+        f"nodes of {args.messages} responses of {args.ksize} out of "
+        f"{args.peers} peers"
+    )
+    for name, build in (
+        ("DictNode", DictNode),
+        ("Node", Node),
+        ("peer_node", peer_node),
+    ):
+        start = time.perf_counter()
+        for message in messages:
+            [build(*triple) for triple in message]
+        elapsed = time.perf_counter() - start
+        total = args.messages * args.ksize
+        print(f"  {name:>9}: {elapsed / total * 1e9:6.0f} ns per node")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Cost of the NodeHeap operations of a crawl with thousands of candidates.
+
+Replays the accesses of a crawl: every round the alpha closest uncontacted
+nodes are asked, each answer pushes k new candidates, peers that did not
+answer are removed and the k closest ids are compared with the previous
+round. Runs until --candidates candidates were pushed, with NodeHeap and
+with the scanning heap it replaced.
+
+    python -m kade_drive.benchmarks.nodeheap --candidates 5000
+"""
+import heapq
+import random
+import argparse
+import time
+
+from kade_drive.core.node import Node, NodeHeap
+from kade_drive.core.utils import digest
+
+
+class ScanningNodeHeap:
+    """
+    The previous NodeHeap: membership and lookups scan the heap, removals
+    rebuild it and every access sorts the k closest again.
+    """
+
+    def __init__(self, node: Node, maxsize: int):
+        self.node = node
+        self.heap: list[tuple[int, Node]] = []
+        self.contacted = set()
+        self.maxsize = maxsize
+
+    def remove(self, peers):
+        peers = set(peers)
+        self.heap = [entry for entry in self.heap if entry[1].id not in peers]
+        heapq.heapify(self.heap)
+
+    def get_node(self, node_id: bytes):
+        return next((n for _, n in self.heap if n.id == node_id), None)
+
+    def get_ids(self):
+        return [n.id for n in self]
+
+    def mark_contacted(self, node):
+        self.contacted.add(node.id)
+
+    def push(self, nodes):
+        for node in nodes:
+            if node not in self:
+                heapq.heappush(self.heap, (self.node.distance_to(node), node))
+
+    def __len__(self):
+        return min(len(self.heap), self.maxsize)
+
+    def __iter__(self):
+        yield from (item[1] for item in heapq.nsmallest(self.maxsize, self.heap))
+
+    def __contains__(self, node: Node):
+        return any(node.id == other.id for _, other in self.heap)
+
+    def get_uncontacted(self):
+        return [n for n in self if n.id not in self.contacted]
+
+
+def crawl(heap_class, target: Node, batches: list[list[Node]], ksize, alpha):
+    heap = heap_class(target, ksize)
+    heap.push(batches[0])
+    last_ids = []
+    for batch in batches[1:]:
+        ids = heap.get_ids()
+        if ids == last_ids:
+            alpha = len(heap)
+        last_ids = ids
+        asked = heap.get_uncontacted()[:alpha]
+        for peer in asked:
+            heap.mark_contacted(peer)
+            assert heap.get_node(peer.id) is peer
+        heap.push(batch)
+        # one in ten peers does not answer
+        heap.remove([peer.id for peer in asked if random.random() < 0.1])
+        heap.get_ids()
+    return heap.get_ids()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--ksize", type=int, default=20)
+    parser.add_argument("--alpha", type=int, default=3)
+    args = parser.parse_args()
+
+    for candidates in args.candidates:
+        target = Node(digest(0))
+        nodes = [Node(digest(random.getrandbits(64))) for _ in range(candidates)]
+        # answers overlap, like the ones of peers close to each other
+        batches = [
+            random.sample(nodes, args.ksize)
+            for _ in range(candidates // args.ksize)
+        ]
+        times = {}
+        for heap_class in (NodeHeap, ScanningNodeHeap):
+            random.seed(candidates)
+            start = time.perf_counter()
+            crawl(heap_class, target, batches, args.ksize, args.alpha)
+            times[heap_class.__name__] = time.perf_counter() - start
+        print(
+            f"{candidates:6} candidates, {len(batches)} rounds: "
+            + ", ".join(f"{name} {t * 1000:8.1f} ms" for name, t in times.items())
+        )
+
+
+if __name__ == "__main__":
+    main()
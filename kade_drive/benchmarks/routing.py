@@ -0,0 +1,50 @@
+"""
+Cost of RoutingTable.get_bucket_for on tables with many buckets.
+
+Splits random buckets of a table until it has --buckets buckets, then times
+--lookups calls of get_bucket_for against the linear scan it replaced.
+
+    python -m kade_drive.benchmarks.routing --buckets 500
+"""
+import random
+import timeit
+import argparse
+
+from kade_drive.core.node import Node
+from kade_drive.core.routing import RoutingTable
+from kade_drive.core.utils import digest
+
+
+def linear_bucket_for(table: RoutingTable, node: Node) -> int:
+    for index, bucket in enumerate(table.buckets):
+        if node.long_id < bucket.range[1]:
+            return index
+    raise ValueError(node)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--buckets", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+
+    for size in args.buckets:
+        table = RoutingTable(20, Node(digest(0)))
+        while len(table.buckets) < size:
+            table.split_bucket(random.randrange(len(table.buckets)))
+        nodes = [Node(digest(random.getrandbits(64))) for _ in range(args.lookups)]
+
+        bisected = timeit.timeit(
+            lambda: [table.get_bucket_for(node) for node in nodes], number=1
+        )
+        linear = timeit.timeit(
+            lambda: [linear_bucket_for(table, node) for node in nodes], number=1
+        )
+        print(
+            f"{size:5} buckets: bisect {bisected / args.lookups * 1e6:7.2f} us, "
+            f"linear scan {linear / args.lookups * 1e6:7.2f} us per lookup"
+        )
+
+
+if __name__ == "__main__":
+    main()
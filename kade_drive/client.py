@@ -1,8 +1,15 @@
 import pickle
 import rpyc
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 from rpyc.core.protocol import PingError
 from message_system.message_system import MessageSystem
+from kade_drive.core.dataplane import DataPlaneClient
+from kade_drive.core.hedging import HedgeBudget, first_answer
+from kade_drive.core.manifest import Manifest, CODEC_REED_SOLOMON
+from kade_drive.core.peerstats import PeerStats
+from kade_drive.core.transport import ServerBusy, asyncio_connect, is_busy
+from kade_drive.core.utils import digest
 
 import logging
 
@@ -12,6 +19,27 @@ except:
     pass
 
 
+class _LazyRoot:
+    """
+    Root of a connection opened on the first call, for reads that the data
+    plane of the replica may answer without one.
+    """
+
+    def __init__(self, open_connection):
+        self._open_connection = open_connection
+        self.connection = None
+
+    def __getattr__(self, name: str):
+        if self.connection is None:
+            self.connection = self._open_connection()
+        return getattr(self.connection.root, name)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
 class ClientSession:
     """
     Class to handle connection to the distributed file system
@@ -20,7 +48,15 @@ class ClientSession:
     """
 
     def __init__(
-        self, bootstrap_nodes: list[tuple[str, int]], log_level=logging.DEBUG
+        self,
+        bootstrap_nodes: list[tuple[str, int]],
+        log_level=logging.DEBUG,
+        transport="rpyc",
+        busy_retries=3,
+        busy_backoff=0.5,
+        hedged_reads=False,
+        hedge_ratio=0.1,
+        read_timeout=30,
     ) -> None:
         logging.basicConfig(
             level=log_level,
@@ -29,6 +65,23 @@ class ClientSession:
         logging.getLogger(__name__)
         self.connection: rpyc.Connection | None = None
         self.bootstrap_nodes: list[tuple[str, int]] = bootstrap_nodes
+        # must match the transport of the servers, "rpyc" or "asyncio"
+        self.transport = transport
+        # calls refused by a busy server are retried after busy_backoff
+        # seconds, doubled on every attempt
+        self.busy_retries = busy_retries
+        self.busy_backoff = busy_backoff
+        # chunks are read from the data plane of the replicas
+        self.data_client = DataPlaneClient()
+        # replicas are tried from the fastest and least loaded
+        self.peer_stats = PeerStats()
+        # with hedged reads, a chunk read not answered after the p95 latency
+        # of its replica is sent to the next replica too, for at most
+        # hedge_ratio of the reads
+        self.hedged_reads = hedged_reads
+        self.hedge_budget = HedgeBudget(ratio=hedge_ratio)
+        self.read_timeout = read_timeout
+        self._hedge_executor: ThreadPoolExecutor | None = None
 
     def connect(
         self,
@@ -68,12 +121,7 @@ class ClientSession:
                 if connection:
                     connection.ping()
                     break
-                connection = rpyc.connect(
-                    ip,
-                    port,
-                    keepalive=True,
-                    config={"allow_pickle": True, "sync_request_timeout": None},
-                )
+                connection = self._open_connection(ip, port)
                 print(f"Connected to {ip}:{port}")
                 break
             except (PingError, EOFError) as e:
@@ -106,6 +154,32 @@ class ClientSession:
             print("Unable to connect to any server known server")
         return connection, nodes_to_try
 
+    def _open_connection(self, ip: str, port: int, timeout: float | None = None):
+        if self.transport == "asyncio":
+            # the replies of the API, such as lists of names, may be pickled
+            return asyncio_connect(ip, port, allow_pickle=True, timeout=timeout)
+        return rpyc.connect(
+            ip,
+            port,
+            keepalive=True,
+            config={"allow_pickle": True, "sync_request_timeout": timeout},
+        )
+
+    def _call(self, method: str, *args, **kwargs):
+        """
+        Call a method of the connected server, retrying while it is busy.
+        """
+        for attempt in range(self.busy_retries + 1):
+            try:
+                return getattr(self.connection.root, method)(*args, **kwargs)
+            except Exception as e:  # pylint: disable=broad-except
+                if not is_busy(e):
+                    raise
+                if attempt == self.busy_retries:
+                    raise ServerBusy(str(e)) from e
+                logger.info(f"server busy in {method}, retrying")
+                sleep(self.busy_backoff * 2**attempt)
+
     def _reconnect(
         self,
         nodes_to_try: list[tuple[str, int]],
@@ -135,25 +209,34 @@ class ClientSession:
             return None, None
 
         try:
-            metadata_list = self.connection.root.get(key)
-        except EOFError as e:
+            encoded_manifest = self._call("get", key)
+        except (EOFError, ServerBusy) as e:
             logger.error(f"Connection lost in get when doing get rpc, exception: {e}")
             return None, None
-        logger.debug(f"METADATAAAAA {metadata_list}")
-        if metadata_list:
-            logger.debug(f"metadata_list received {str(len(metadata_list) > 0)}")
         data_received = []
 
-        if metadata_list is None or len(metadata_list) == 0:
+        if encoded_manifest is None:
             logger.debug(f"No data with key {key}")
             return None, self.connection
 
-        for chunk_key in metadata_list:
+        try:
+            manifest = Manifest.decode(encoded_manifest)
+        except ValueError as e:
+            logger.error(f"Invalid manifest for key {key}, {e}")
+            return None, self.connection
+        logger.debug(f"manifest received with {len(manifest)} entries")
+
+        if manifest.is_inline:
+            return self._load(manifest, manifest.payload)
+        if manifest.codec == CODEC_REED_SOLOMON:
+            return self._get_erasure_coded(manifest)
+
+        for chunk_key in manifest.digests():
             try:
                 locations: list[
                     tuple[str, int]
-                ] = self.connection.root.get_file_chunk_location(chunk_key)
-            except EOFError as e:
+                ] = self._call("get_file_chunk_location", chunk_key)
+            except (EOFError, ServerBusy) as e:
                 logger.error(
                     f"Connection lost in get when doing get_file_chunk_location, exception: {e}"
                 )
@@ -163,6 +246,15 @@ class ClientSession:
                 continue
 
             logger.info(f"locations for chunk_key {chunk_key} are {locations}")
+            locations = self.peer_stats.order(locations)
+
+            if self.hedged_reads:
+                data_to_add = self._hedged_read(locations, chunk_key)
+                if data_to_add is None:
+                    logger.warning("No Servers to get chunk")
+                    break
+                data_received.append(data_to_add)
+                continue
 
             if len(locations) > 0:
                 while len(locations) > 0:
@@ -174,7 +266,10 @@ class ClientSession:
                     )
                     if conn:
                         try:
-                            data_to_add = conn.root.rpc_get_file_chunk_value(chunk_key)
+                            with self.peer_stats.track(*locations[0]):
+                                data_to_add = self.data_client.read(
+                                    conn.root, *locations[0], chunk_key
+                                )
                             if data_to_add is None:
                                 locations.pop(0)
                                 continue
@@ -186,6 +281,12 @@ class ClientSession:
                             )
 
                             continue
+                        except Exception as e:  # pylint: disable=broad-except
+                            if not is_busy(e):
+                                raise
+                            # the replica is busy, try the next one
+                            logger.info(f"{locations[0]} is busy, {e}")
+                            locations.pop(0)
             elif len(locations) == 0:
                 logger.warning("No Servers to get chunk")
                 break
@@ -194,7 +295,40 @@ class ClientSession:
         if len(data_received) == 0:
             logger.error("len of data_received is 0")
             return None, self.connection
-        data_received = b"".join(data_received)
+        return self._load(manifest, b"".join(data_received))
+
+    def _hedged_read(self, locations: list[tuple[str, int]], chunk_key):
+        """
+        Read the chunk from the first replica that answers, asking the next
+        one when the previous is late.
+        """
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(
+                max_workers=8, thread_name_prefix="hedge"
+            )
+        return first_answer(
+            locations,
+            lambda location: self._read_chunk(location, chunk_key),
+            lambda location: self.peer_stats.percentile(*location, 0.95),
+            self.hedge_budget,
+            self._hedge_executor,
+        )
+
+    def _read_chunk(self, location: tuple[str, int], chunk_key):
+        ip, port = location
+        # the RPC connection is only opened to learn the data plane port of
+        # the replica or to read through RPC when it has none
+        root = _LazyRoot(lambda: self._open_connection(ip, port, self.read_timeout))
+        with self.peer_stats.track(ip, port):
+            try:
+                return self.data_client.read(root, ip, port, chunk_key)
+            finally:
+                root.close()
+
+    def _load(self, manifest: Manifest, data_received: bytes) -> tuple:
+        if manifest.has_file_hash and digest(data_received) != manifest.file_hash:
+            logger.error("Data received does not match the hash of the file")
+            return None, self.connection
         try:
             data_to_return = pickle.loads(data_received)
             return data_to_return, self.connection
@@ -202,17 +336,45 @@ class ClientSession:
             logger.error(e)
             return None, self.connection
 
-    def put(self, key, value: bytes) -> tuple:
+    def _get_erasure_coded(self, manifest: Manifest) -> tuple:
+        data_received = []
+        try:
+            for group in manifest.groups():
+                data = self._call("read_erasure_group", manifest.parity_shards, group)
+                if data is None:
+                    logger.error("Not enough fragments to rebuild erasure coded group")
+                    return None, self.connection
+                data_received.append(data)
+        except (EOFError, ServerBusy) as e:
+            logger.error(
+                f"Connection lost in get when doing read_erasure_group, exception: {e}"
+            )
+            return None, None
+
+        return self._load(manifest, b"".join(data_received))
+
+    def put(self, key, value: bytes, storage_class="replicated") -> tuple:
+        """
+        Store value with key, storage_class "erasure" stores it Reed-Solomon
+        encoded instead of replicated in ksize nodes.
+        """
+        # pickled here, the servers refuse pickled requests
+        if not isinstance(value, bytes):
+            value = pickle.dumps(value)
         if self.connection:
             try:
-                response = self.connection.root.upload_file(
-                    key_name=key, key=key, data=value
+                response = self._call(
+                    "upload_file",
+                    key_name=key,
+                    key=key,
+                    data=value,
+                    storage_class=storage_class,
                 )
                 sleep(1)
                 message = "put > Success" if response else "put failed"
                 logger.info(message)
                 return response, self.connection
-            except EOFError as e:
+            except (EOFError, ServerBusy) as e:
                 logger.error(f"Connection lost in put, exception: {e}")
 
         else:
@@ -220,15 +382,96 @@ class ClientSession:
 
         return False, None
 
+    def overwrite(self, key, value: bytes) -> tuple:
+        """
+        Replace the value of an existing key, only the chunks that changed
+        since the current version are stored again.
+        """
+        # pickled here, the servers refuse pickled requests
+        if not isinstance(value, bytes):
+            value = pickle.dumps(value)
+        if self.connection:
+            try:
+                response = self._call(
+                    "overwrite_file", key_name=key, key=key, data=value
+                )
+                message = "overwrite > Success" if response else "overwrite failed"
+                logger.info(message)
+                return response, self.connection
+            except (EOFError, ServerBusy) as e:
+                logger.error(f"Connection lost in overwrite, exception: {e}")
+
+        else:
+            logger.error("No connection stablished to do overwrite")
+
+        return False, None
+
+    def put_resumable(
+        self,
+        key,
+        value: bytes,
+        chunk_size=500,
+        attempts_per_part=3,
+        session_id: str | None = None,
+    ) -> tuple:
+        """
+        Upload value in parts through an upload session. Parts already stored
+        in the network are skipped, failed parts are retried individually and
+        a lost connection resumes the same session when possible.
+
+        Returns:
+            (response, session_id), the session id can be passed back to resume
+            an upload that failed.
+        """
+        if not isinstance(value, bytes):
+            value = pickle.dumps(value)
+        chunks = [value[i : i + chunk_size] for i in range(0, len(value), chunk_size)]
+        digests = tuple(digest(c) for c in chunks)
+        lengths = tuple(len(c) for c in chunks)
+
+        for _ in range(attempts_per_part):
+            if not self.connection and not self.connect():
+                logger.error("No connection stablished to do put_resumable")
+                return False, session_id
+            try:
+                missing = None
+                if session_id is not None:
+                    missing = self._call("upload_status", session_id)
+                if missing is None:
+                    session_id, missing = self._call(
+                        "begin_upload", key, key, digests, lengths, digest(value)
+                    )
+                logger.info(f"session {session_id} has {len(missing)} parts to send")
+
+                for index in missing:
+                    for _ in range(attempts_per_part):
+                        if self._call(
+                            "upload_part", session_id, index, chunks[index]
+                        ):
+                            break
+                    else:
+                        logger.error(f"put_resumable failed to send part {index}")
+                        return False, session_id
+
+                response = self._call("commit_upload", session_id)
+                message = "put > Success" if response else "put failed"
+                logger.info(message)
+                return response, session_id
+            except (EOFError, ServerBusy) as e:
+                logger.error(f"Connection lost in put_resumable, exception: {e}")
+                self.connection = None
+
+        return False, session_id
+
     def delete(self, key):
         if self.connection:
             try:
-                response = self.connection.root.delete(key=key)
+                response = self._call("delete", key=key)
                 sleep(1)
                 message = "Delete > Success" if response else "Delete failed"
                 logger.info(message)
                 return response, self.connection
-            except EOFError as e:
+            except (EOFError, ServerBusy) as e:
                 logger.error(f"Connection lost in delete, exception: {e}")
 
         else:
@@ -239,12 +482,12 @@ class ClientSession:
     def ls(self):
         if self.connection:
             try:
-                response = self.connection.root.get_all_file_names()
+                response = self._call("get_all_file_names")
                 sleep(1)
                 message = "ls > Success" if response else "ls failed"
                 logger.info(message)
                 return response, self.connection
-            except EOFError as e:
+            except (EOFError, ServerBusy) as e:
                 logger.error(f"Connection lost in ls, exception: {e}")
 
         else:
@@ -0,0 +1,114 @@
+"""
+Cache of the results of network lookups.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from kade_drive.core.node import Node
+
+CLOSEST = "closest"
+LOCATIONS = "locations"
+
+
+def _address(ip, port) -> tuple[str, int]:
+    return str(ip), int(port)
+
+
+class LookupCache:
+    """
+    TTL and size bounded LRU cache of lookup results: the k closest nodes
+    to a key (CLOSEST) and the (ip, port) holding a chunk (LOCATIONS).
+
+    Entries expire ttl seconds after they were stored and are dropped as
+    soon as any node they mention is invalidated, the routing table does it
+    when it removes a contact and clears the cache when a bucket splits.
+    """
+
+    def __init__(self, ttl: float = 30, max_entries: int = 4096):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # (kind, key) -> (expiration, value)
+        self._entries: OrderedDict[tuple[str, bytes], tuple[float, tuple]] = (
+            OrderedDict()
+        )
+        # (ip, port) -> cache keys of the entries that mention it
+        self._by_address: dict[tuple[str, int], set[tuple[str, bytes]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, kind: str, key: bytes) -> list | None:
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is not None and entry[0] <= time.monotonic():
+                self._drop((kind, key))
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((kind, key))
+            self.hits += 1
+            return list(entry[1])
+
+    def put(self, kind: str, key: bytes, value):
+        """
+        Store a list of Nodes (CLOSEST) or of (ip, port) tuples (LOCATIONS).
+        """
+        value = tuple(value)
+        if not value:
+            return
+        with self._lock:
+            self._drop((kind, key))
+            self._entries[(kind, key)] = (time.monotonic() + self.ttl, value)
+            for item in value:
+                address = (
+                    _address(item.ip, item.port)
+                    if isinstance(item, Node)
+                    else _address(*item)
+                )
+                self._by_address.setdefault(address, set()).add((kind, key))
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def discard(self, kind: str, key: bytes):
+        with self._lock:
+            self._drop((kind, key))
+
+    def invalidate(self, ip, port):
+        """
+        Drop every entry that mentions the node at ip:port.
+        """
+        with self._lock:
+            for cache_key in self._by_address.pop(_address(ip, port), set()):
+                self._drop(cache_key)
+
+    def invalidate_node(self, node: Node):
+        self.invalidate(node.ip, node.port)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_address.clear()
+
+    def _drop(self, cache_key):
+        """
+        Remove an entry. Must hold the lock.
+        """
+        entry = self._entries.pop(cache_key, None)
+        if entry is None:
+            return
+        for item in entry[1]:
+            address = (
+                _address(item.ip, item.port)
+                if isinstance(item, Node)
+                else _address(*item)
+            )
+            keys = self._by_address.get(address)
+            if keys is not None:
+                keys.discard(cache_key)
+                if not keys:
+                    del self._by_address[address]
@@ -1,4 +1,79 @@
 class Config:
-    def __init__(self, refresh_sleep=60, ttl=120):
+    def __init__(
+        self,
+        refresh_sleep=60,
+        ttl=120,
+        upload_session_ttl=600,
+        erasure_data_shards=4,
+        erasure_parity_shards=2,
+        erasure_placement_attempts=8,
+        chunk_size=500,
+        manifest_max_entries=4096,
+        inline_threshold=1024,
+        store_batch_bytes=4 * 1024 * 1024,
+        republish_batch_size=256,
+        pool_max_idle_per_peer=2,
+        pool_max_connections=128,
+        pool_idle_timeout=60,
+        welcome_rate=5,
+        welcome_cooldown=60,
+        rpc_timeout=10,
+        lookup_deadline=30,
+        lookup_max_rounds=20,
+        lookup_max_stale_rounds=3,
+        lookup_max_in_flight=6,
+        lookup_concurrency=16,
+        server_workers=64,
+        server_max_queued=256,
+        server_queue_timeout=5,
+        lookup_cache_ttl=30,
+        lookup_cache_size=4096,
+        data_plane=True,
+        data_plane_workers=16,
+        peer_min_timeout=2,
+        routing_trie_index=False,
+        routing_snapshot_path="static/routing-{port}.json",
+        routing_snapshot_interval=30,
+        routing_snapshot_max_age=24 * 3600,
+    ):
         self.refresh_sleep = refresh_sleep
         self.ttl = ttl
+        self.upload_session_ttl = upload_session_ttl
+        self.erasure_data_shards = erasure_data_shards
+        self.erasure_parity_shards = erasure_parity_shards
+        self.erasure_placement_attempts = erasure_placement_attempts
+        self.chunk_size = chunk_size
+        self.manifest_max_entries = manifest_max_entries
+        self.inline_threshold = inline_threshold
+        self.store_batch_bytes = store_batch_bytes
+        self.republish_batch_size = republish_batch_size
+        self.pool_max_idle_per_peer = pool_max_idle_per_peer
+        self.pool_max_connections = pool_max_connections
+        self.pool_idle_timeout = pool_idle_timeout
+        self.welcome_rate = welcome_rate
+        self.welcome_cooldown = welcome_cooldown
+        self.rpc_timeout = rpc_timeout
+        self.lookup_deadline = lookup_deadline
+        self.lookup_max_rounds = lookup_max_rounds
+        self.lookup_max_stale_rounds = lookup_max_stale_rounds
+        # the crawl thread pool has room for lookup_concurrency crawls with
+        # lookup_max_in_flight RPCs each
+        self.lookup_max_in_flight = lookup_max_in_flight
+        self.lookup_concurrency = lookup_concurrency
+        self.server_workers = server_workers
+        self.server_max_queued = server_max_queued
+        self.server_queue_timeout = server_queue_timeout
+        self.lookup_cache_ttl = lookup_cache_ttl
+        self.lookup_cache_size = lookup_cache_size
+        self.data_plane = data_plane
+        # with the asyncio transport the data plane gets these workers out of
+        # server_workers, with rpyc both share the request limiter
+        self.data_plane_workers = data_plane_workers
+        self.peer_min_timeout = peer_min_timeout
+        self.routing_trie_index = routing_trie_index
+        # {port} is replaced by the port of the node, so nodes started from
+        # the same directory keep their own snapshot, None disables saving
+        # the routing table and rejoining from it
+        self.routing_snapshot_path = routing_snapshot_path
+        self.routing_snapshot_interval = routing_snapshot_interval
+        self.routing_snapshot_max_age = routing_snapshot_max_age
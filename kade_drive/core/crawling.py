@@ -1,8 +1,9 @@
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from itertools import chain
 import logging
-import rpyc
-from kade_drive.core.node import Node, NodeHeap
+import time
+from kade_drive.core.node import Node, NodeHeap, peer_node
 from kade_drive.core.protocol import FileSystemProtocol, ServerSession
 
 
@@ -13,12 +14,38 @@ formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 # logger.addHandler(file_handler)
 
+# returned by _nodes_found when the crawl must go on with another round
+KEEP_CRAWLING = object()
+
 
 class SpiderCrawl:
     """
     Crawl the network and look for given 160-bit keys.
+
+    The RPCs of every round run concurrently on a thread pool shared by the
+    crawls of the node, at most max_in_flight of them per crawl. A round
+    ends when min_responses peers answered, None meaning all of them, or
+    when rpc_timeout seconds passed without any answer. Peers still running
+    stay in flight and their answers are used by the next rounds.
+
+    A crawl stops after max_rounds rounds, after max_stale_rounds rounds in
+    a row where the answers did not change the k closest nodes, or when
+    deadline seconds passed since it started. The RPCs still in flight are
+    then waited for until the deadline, or, with
+    wait_pending, until each answers or times out, as the partial result of
+    :meth:`_handle_contacts` of those crawls is no result at all. Calls not
+    started yet when the crawl returns are cancelled.
     """
 
+    rpc_timeout: float = 10
+    deadline: float = 30
+    max_rounds: int = 20
+    max_stale_rounds: int = 3
+    max_in_flight: int = 6
+    min_responses: int | None = None
+    wait_pending: bool = True
+    executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="crawl")
+
     def __init__(self, node: Node, peers, ksize: int, alpha):
         """
         Create a new C{SpiderCrawl}er.
@@ -36,6 +63,8 @@ class SpiderCrawl:
         self.node = node
         self.nearest = NodeHeap(self.node, self.ksize)
         self.last_ids_crawled = []
+        # future of every RPC in flight -> (peer, time it was sent)
+        self.in_flight = {}
         logger.debug("creating spider with peers: %s", peers)
         self.nearest.push(peers)
 
@@ -56,60 +85,165 @@ class SpiderCrawl:
           4. repeat, unless nearest list has all been queried, then ur done
         """
 
-        logger.debug("crawling network with nearest: %s", str(tuple(self.nearest)))
-        # define the alpha based on the latest crawled nodes
-        count = self.alpha
-        if self.nearest.get_ids() == self.last_ids_crawled:
-            count = len(self.nearest)
-        # uodate latest crawled nodes
-        self.last_ids_crawled = self.nearest.get_ids()
-
-        response_dict = {}
-        # for each peer in the alpha not visited nodes
-        # perform the rpc protocol method call
-        # return the info from those nodes
-        for peer in self.nearest.get_uncontacted()[:count]:
-            logger.debug("Peer %s %s", type(peer), peer)
-
-            # if peer.ip == "192.168.133.1":
-            #     continue
-
-            try:
-                session = rpyc.connect(host=peer.ip, port=peer.port)
-                conn = session.root
-            except (ConnectionError, OSError) as cu_ex:
-                logger.warning(
-                    "Failed to connect to %s %s, e: %s", peer.id, peer.ip, cu_ex
-                )
-                session = None
-                conn = None
-
+        deadline = time.monotonic() + self.deadline
+        try:
+            result = self._crawl(rpcmethod, is_metadata, deadline)
+            if result is KEEP_CRAWLING:
+                result = self._drain(is_metadata, deadline)
+            if result is KEEP_CRAWLING:
+                result = self._handle_contacts()
+            return result
+        finally:
+            # calls still queued behind other crawls are not needed anymore
+            for future in self.in_flight:
+                future.cancel()
+
+    def _crawl(self, rpcmethod, is_metadata: None | bool, deadline: float):
+        """
+        The rounds of the crawl, returns KEEP_CRAWLING if they ended without
+        a result.
+        """
+        stale_rounds = 0
+        for _ in range(self.max_rounds):
             logger.debug(
-                "Connection is %s and self.node is %s",
-                conn is not None,
-                self.node is not None,
+                "crawling network with nearest: %s", str(tuple(self.nearest))
             )
+            # define the alpha based on the latest crawled nodes
+            count = self.alpha
+            if self.nearest.get_ids() == self.last_ids_crawled:
+                count = len(self.nearest)
+            # uodate latest crawled nodes
+            self.last_ids_crawled = self.nearest.get_ids()
+
+            # for each peer in the alpha not visited nodes
+            # perform the rpc protocol method call concurrently
+            # return the info from those nodes
+            count = min(count, self.max_in_flight) - len(self.in_flight)
+            for peer in self._pick(self.nearest.get_uncontacted(), count):
+                logger.debug("Peer %s %s", type(peer), peer)
+                future = SpiderCrawl.executor.submit(
+                    self._call, rpcmethod, peer, is_metadata
+                )
+                self.in_flight[future] = (peer, time.monotonic())
+                self.nearest.mark_contacted(peer)
+
+            response_dict = self._collect_responses(deadline)
+            logger.debug("response %s", response_dict)
+            result = self._nodes_found(response_dict, is_metadata)
+            if result is not KEEP_CRAWLING:
+                return result
+
+            # no new RPCs are sent after enough stale rounds, the answers
+            # still on the way are handled by _drain
+            if self.nearest.get_ids() == self.last_ids_crawled:
+                stale_rounds += 1
+            else:
+                stale_rounds = 0
+            if stale_rounds >= self.max_stale_rounds:
+                logger.debug("k closest nodes stopped improving")
+                break
+            if time.monotonic() >= deadline:
+                logger.warning("crawl deadline expired, returning partial result")
+                break
+        return KEEP_CRAWLING
+
+    def _drain(self, is_metadata: None | bool, deadline: float):
+        """
+        Handle the answers of the RPCs still in flight once the rounds are
+        over, returns KEEP_CRAWLING if none of them gave a result.
+        """
+        while self.in_flight:
+            limit = deadline
+            if self.wait_pending:
+                latest = max(sent for _, sent in self.in_flight.values())
+                limit = max(limit, latest + self.rpc_timeout)
+            if time.monotonic() >= limit:
+                break
+            response_dict = self._collect_responses(limit)
+            result = self._nodes_found(response_dict, is_metadata)
+            if result is not KEEP_CRAWLING:
+                return result
+        return KEEP_CRAWLING
+
+    def _pick(self, candidates: list[Node], count: int) -> list[Node]:
+        """
+        The count candidates to ask next. The closest ones, peers in the same
+        bucket of the key, equally distant for Kademlia, are ordered by their
+        score so the fastest and least loaded are asked first.
+        """
+        stats = ServerSession.peer_stats
+        candidates.sort(
+            key=lambda peer: (
+                self.node.distance_to(peer).bit_length(),
+                stats.score(peer.ip, peer.port),
+            )
+        )
+        return candidates[: max(count, 0)]
 
-            logger.debug("Calling : %s", rpcmethod)
-
+    def _call(self, rpcmethod, peer: Node, is_metadata: None | bool):
+        with ServerSession(peer.ip, peer.port, self.rpc_timeout) as conn:
+            logger.debug("Calling : %s in %s", rpcmethod, peer)
             if is_metadata is None:
-                response = rpcmethod(conn, peer, self.node)
-            else:
-                response = rpcmethod(conn, peer, self.node, is_metadata)
-            response_dict[peer.id] = response
-            self.nearest.mark_contacted(peer)
-            logger.debug("mark contacted successful")
-        logger.debug("response %s", response_dict)
-        return self._nodes_found(response_dict, is_metadata)
+                return rpcmethod(conn, peer, self.node)
+            return rpcmethod(conn, peer, self.node, is_metadata)
+
+    def _collect_responses(self, deadline: float) -> dict:
+        """
+        Wait for the RPCs in flight until enough of them answered or the
+        deadline expires. RPCs running for more than rpc_timeout are given up
+        as no response.
+        """
+        response_dict = {}
+        needed = len(self.in_flight)
+        if self.min_responses is not None:
+            needed = min(needed, self.min_responses)
+
+        while self.in_flight and len(response_dict) < needed:
+            oldest = min(sent for _, sent in self.in_flight.values())
+            timeout = min(oldest + self.rpc_timeout, deadline) - time.monotonic()
+            if timeout <= 0 and time.monotonic() >= deadline:
+                break
+            timeout = max(timeout, 0)
+            done, _ = wait(self.in_flight, timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                peer, _ = self.in_flight.pop(future)
+                try:
+                    response_dict[peer.id] = future.result()
+                except Exception as e:  # pylint: disable=broad-except
+                    logger.warning("RPC to %s failed, e: %s", peer, e)
+                    response_dict[peer.id] = None
+            if not done:
+                now = time.monotonic()
+                for future, (peer, sent) in list(self.in_flight.items()):
+                    if now - sent >= self.rpc_timeout:
+                        logger.warning("RPC to %s timed out", peer)
+                        del self.in_flight[future]
+                        response_dict[peer.id] = None
+        return response_dict
+
+    def _exhausted(self) -> bool:
+        """
+        True when every peer in the nearest set was contacted and answered.
+        """
+        return self.nearest.have_contacted_all() and not self.in_flight
 
     def _nodes_found(self, response_dict: dict, is_metadata: None | bool):
+        """
+        Handle the responses of a round, returning the result of the crawl
+        or KEEP_CRAWLING to go on with another round.
+        """
         raise NotImplementedError
 
     def _handle_contacts(self):
+        """
+        Result of a crawl that ran out of rounds or time.
+        """
         raise NotImplementedError
 
 
 class ValueSpiderCrawl(SpiderCrawl):
+    min_responses = 1
+
     def __init__(self, node, peers, ksize, alpha):
         SpiderCrawl.__init__(self, node, peers, ksize, alpha)
         # keep track of the single nearest node without value - per
@@ -143,10 +277,10 @@ class ValueSpiderCrawl(SpiderCrawl):
         logger.debug("found values in _nodes_found %s", found_values)
         if len(found_values) > 0:
             return self._handle_found_values(found_values)
-        if self.nearest.have_contacted_all():
+        if self._exhausted():
             # not found!
             return None
-        return self.find()
+        return KEEP_CRAWLING
 
     def _handle_contacts(self):
         # if all nodes were visited but no values were found, return None
@@ -184,6 +318,10 @@ class ValueSpiderCrawl(SpiderCrawl):
 
 
 class NodeSpiderCrawl(SpiderCrawl):
+    min_responses = 1
+    # the nodes found so far are a useful result
+    wait_pending = False
+
     def find(self):
         """
         Find the closest nodes.
@@ -207,9 +345,9 @@ class NodeSpiderCrawl(SpiderCrawl):
                 self.nearest.push(response.get_node_list())
         self.nearest.remove(toremove)
 
-        if self.nearest.have_contacted_all():
+        if self._exhausted():
             return list(self.nearest)
-        return self.find()
+        return KEEP_CRAWLING
 
     def _handle_contacts(self):
         # if all nearest nodes are visited, return them
@@ -217,6 +355,8 @@ class NodeSpiderCrawl(SpiderCrawl):
 
 
 class ChunkLocationSpiderCrawl(SpiderCrawl):
+    min_responses = 1
+
     def find(self):
         return self._find(FileSystemProtocol.call_find_chunk_location, None)
 
@@ -241,10 +381,13 @@ class ChunkLocationSpiderCrawl(SpiderCrawl):
         if len(found_values) > 0:
             logger.critical(f"values of chunkSPider {found_values}")
             return found_values
-        if self.nearest.have_contacted_all():
+        if self._exhausted():
             # not found!
             return None
-        return self.find()
+        return KEEP_CRAWLING
+
+    def _handle_contacts(self):
+        return None
 
 
 class DeleteSpiderCrawl(SpiderCrawl):
@@ -274,10 +417,13 @@ class DeleteSpiderCrawl(SpiderCrawl):
         logger.debug(f"found values in _nodes_found {found_values}")
         if len(found_values) > 0:
             return self._handle_found_values(found_values)
-        if self.nearest.have_contacted_all():
+        if self._exhausted():
             # not found!
             return None
-        return self.find(is_metadata)
+        return KEEP_CRAWLING
+
+    def _handle_contacts(self):
+        return None
 
     def _handle_found_values(self, values):
         values = list(values)
@@ -309,10 +455,13 @@ class ConfirmIntegritySpiderCrawl(SpiderCrawl):
         logger.debug(f"found values in _nodes_found {found_values}")
         if len(found_values) > 0:
             return self._handle_found_values(found_values)
-        if self.nearest.have_contacted_all():
+        if self._exhausted():
             # not found!
             return None
-        return self.find(is_metadata)
+        return KEEP_CRAWLING
+
+    def _handle_contacts(self):
+        return None
 
     def _handle_found_values(self, values):
         logger.info(f"_handle_found_values of integrity {values}")
@@ -344,10 +493,13 @@ class LsSpiderCrawl(SpiderCrawl):
         logger.info(f"found values in _nodes_found {found_values}")
         if len(found_values) > 0:
             return self._handle_found_values(found_values)
-        if self.nearest.have_contacted_all():
+        if self._exhausted():
             # not found!
             return None
-        return self.find(is_metadata)
+        return KEEP_CRAWLING
+
+    def _handle_contacts(self):
+        return None
 
     def _handle_found_values(self, values):
         return values
@@ -386,4 +538,4 @@ class RPCFindResponse:
         """
         nodelist = self.response or []
         # logger.critical(f"Node list is {nodelist}")
-        return [Node(*nodeple) for nodeple in nodelist]
+        return [peer_node(*nodeple) for nodeple in nodelist]
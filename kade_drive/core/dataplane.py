@@ -0,0 +1,254 @@
+"""
+Out of band data plane for chunk bytes.
+
+Chunk values are read over a raw socket of their own instead of through the
+RPC connection, which boxes, frames and copies every byte. A request is a
+REQUEST header with the operation and the key length followed by the key,
+the answer a RESPONSE header with a status and the payload length followed
+by the payload. The server writes the header and the value with one
+sendmsg over memoryviews, the client reads the payload with recv_into in a
+buffer allocated once with the announced length. Connections are kept
+open and reused for the following requests.
+
+The RPC connection stays for the control messages, peers announce the port
+of their data plane with get_data_port.
+"""
+import logging
+import socket
+import struct
+import threading
+import time
+from collections.abc import Callable
+
+from kade_drive.core.transport import RemoteError, RequestLimiter, ServerBusy
+
+logger = logging.getLogger(__name__)
+
+# operation, key length, followed by the key
+REQUEST = struct.Struct(">BB")
+# status, payload length, followed by the payload
+RESPONSE = struct.Struct(">BQ")
+
+OP_GET = 1
+
+STATUS_OK = 0
+STATUS_NOT_FOUND = 1
+STATUS_BUSY = 2
+STATUS_ERROR = 3
+
+MAX_PAYLOAD = 1024 * 1024 * 1024
+CONNECT_TIMEOUT = 10
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytearray | None:
+    """
+    Read size bytes in a preallocated buffer, None if the peer closed the
+    connection before sending anything.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            if received == 0:
+                return None
+            raise EOFError("connection closed in the middle of a message")
+        received += count
+    return buffer
+
+
+def _send_all(sock: socket.socket, buffers: list) -> None:
+    """
+    sendmsg the buffers without copying them, resuming after partial sends.
+    """
+    views = [memoryview(b).cast("B") for b in buffers if len(b)]
+    while views:
+        sent = sock.sendmsg(views)
+        while sent:
+            if sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+
+class DataPlaneServer:
+    """
+    Serves the chunks returned by read(key) on a raw socket, with a thread
+    per connection. Requests are admitted through the limiter, the ones it
+    rejects are answered with a busy status.
+    """
+
+    def __init__(
+        self,
+        read: Callable[[bytes], bytes | None],
+        hostname: str = "0.0.0.0",
+        port: int = 0,
+        limiter: RequestLimiter | None = None,
+    ):
+        self.read = read
+        self.limiter = limiter
+        self.listener = socket.create_server((hostname, port), backlog=128)
+        self.port = self.listener.getsockname()[1]
+        self.served_bytes = 0
+
+    def start(self):
+        """
+        Accept connections until close, blocking.
+        """
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+
+    def close(self):
+        self.listener.close()
+
+    def _serve(self, sock: socket.socket):
+        with sock:
+            try:
+                while True:
+                    header = _recv_exactly(sock, REQUEST.size)
+                    if header is None:
+                        return
+                    operation, key_length = REQUEST.unpack(header)
+                    key = _recv_exactly(sock, key_length)
+                    if key is None:
+                        return
+                    if operation != OP_GET:
+                        _send_all(sock, [RESPONSE.pack(STATUS_ERROR, 0)])
+                        return
+                    self._answer_get(sock, bytes(key))
+            except (OSError, EOFError) as e:
+                logger.debug(f"data plane connection closed, {e}")
+
+    def _answer_get(self, sock: socket.socket, key: bytes):
+        try:
+            if self.limiter is None:
+                value = self.read(key)
+            else:
+                with self.limiter:
+                    value = self.read(key)
+        except ServerBusy:
+            _send_all(sock, [RESPONSE.pack(STATUS_BUSY, 0)])
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"data plane failed to read {key.hex()}, {e}")
+            _send_all(sock, [RESPONSE.pack(STATUS_ERROR, 0)])
+            return
+        if value is None:
+            _send_all(sock, [RESPONSE.pack(STATUS_NOT_FOUND, 0)])
+            return
+        _send_all(sock, [RESPONSE.pack(STATUS_OK, len(value)), value])
+        self.served_bytes += len(value)
+
+
+class DataPlaneClient:
+    """
+    Fetches chunks from the data planes of peers, keeping up to
+    max_idle_per_peer open connections to each one for reuse. Peers whose
+    data plane failed are read through RPC for retry_after seconds before
+    their port is asked again.
+    """
+
+    def __init__(
+        self,
+        max_idle_per_peer: int = 2,
+        timeout: float | None = 30,
+        retry_after: float = 60,
+    ):
+        self.max_idle_per_peer = max_idle_per_peer
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._idle: dict[tuple[str, int], list[socket.socket]] = {}
+        # RPC address -> data plane port, None for peers without one
+        self._ports: dict[tuple[str, int], int | None] = {}
+        # RPC address -> time to ask again for the port of a failed data plane
+        self._retry_at: dict[tuple[str, int], float] = {}
+        self._lock = threading.Lock()
+
+    def read(self, root, ip: str, port, key: bytes):
+        """
+        Get a chunk from the peer at ip:port, through its data plane when it
+        has one and through root, its RPC connection, otherwise.
+        """
+        address = (str(ip), int(port))
+        retry_at = self._retry_at.get(address)
+        if retry_at is not None and time.monotonic() >= retry_at:
+            # the peer may be back, maybe on another port
+            self._retry_at.pop(address, None)
+            self._ports.pop(address, None)
+        if address not in self._ports:
+            try:
+                self._ports[address] = root.get_data_port()
+            except (AttributeError, RemoteError):
+                # the peer does not know get_data_port
+                self._ports[address] = None
+        data_port = self._ports[address]
+        if data_port is not None:
+            try:
+                return self.fetch(ip, data_port, key)
+            except (OSError, EOFError) as e:
+                logger.warning(f"data plane of {ip}:{port} failed, {e}")
+                self._ports[address] = None
+                self._retry_at[address] = time.monotonic() + self.retry_after
+        return root.rpc_get_file_chunk_value(key)
+
+    def fetch(self, ip: str, port: int, key: bytes) -> bytearray | None:
+        """
+        Get the value of a chunk, None if the peer does not have it.
+
+        Raises:
+            ServerBusy: the peer is saturated.
+            OSError, EOFError: the connection failed.
+        """
+        address = (str(ip), int(port))
+        sock = self._acquire(address)
+        try:
+            _send_all(sock, [REQUEST.pack(OP_GET, len(key)), key])
+            header = _recv_exactly(sock, RESPONSE.size)
+            if header is None:
+                raise EOFError("connection closed by the data plane")
+            status, length = RESPONSE.unpack(header)
+            if length > MAX_PAYLOAD:
+                raise EOFError(f"payload of {length} bytes is too big")
+            value = _recv_exactly(sock, length) if length else bytearray()
+        except BaseException:
+            sock.close()
+            raise
+        self._release(address, sock)
+        if status == STATUS_BUSY:
+            raise ServerBusy(f"data plane of {ip}:{port} is busy")
+        if status != STATUS_OK:
+            return None
+        return value
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for sockets in idle.values():
+            for sock in sockets:
+                sock.close()
+
+    def _acquire(self, address: tuple[str, int]) -> socket.socket:
+        with self._lock:
+            sockets = self._idle.get(address)
+            if sockets:
+                return sockets.pop()
+        sock = socket.create_connection(address, timeout=CONNECT_TIMEOUT)
+        sock.settimeout(self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _release(self, address: tuple[str, int], sock: socket.socket):
+        with self._lock:
+            sockets = self._idle.setdefault(address, [])
+            if len(sockets) < self.max_idle_per_peer:
+                sockets.append(sock)
+                return
+        sock.close()
@@ -0,0 +1,171 @@
+"""
+Reed-Solomon erasure coding over GF(256).
+
+The code is systematic: the first ``data_shards`` fragments are the data
+itself and the remaining ``parity_shards`` fragments are computed from a
+Cauchy matrix, so the data can be rebuilt from any ``data_shards`` fragments.
+Byte arithmetic is vectorized with NumPy, which is an optional dependency
+installed with the ``erasure`` extra.
+"""
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+PRIMITIVE_POLYNOMIAL = 0x11D
+
+
+def _build_tables():
+    exp = [0] * 512
+    log = [0] * 256
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= PRIMITIVE_POLYNOMIAL
+    for i in range(255, 512):
+        exp[i] = exp[i - 255]
+    return exp, log
+
+
+GF_EXP, GF_LOG = _build_tables()
+_MUL_TABLE = None
+
+
+def gf_mul(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return GF_EXP[GF_LOG[a] + GF_LOG[b]]
+
+
+def gf_inv(a: int) -> int:
+    if a == 0:
+        raise ZeroDivisionError("0 has no inverse in GF(256)")
+    return GF_EXP[255 - GF_LOG[a]]
+
+
+def gf_invert_matrix(matrix: list[list[int]]) -> list[list[int]]:
+    """
+    Invert a square matrix over GF(256) with Gauss-Jordan elimination.
+    """
+    size = len(matrix)
+    rows = [list(row) + [int(i == j) for j in range(size)] for i, row in enumerate(matrix)]
+    for col in range(size):
+        pivot = next((r for r in range(col, size) if rows[r][col]), None)
+        if pivot is None:
+            raise ValueError("matrix is singular")
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        inv = gf_inv(rows[col][col])
+        rows[col] = [gf_mul(inv, v) for v in rows[col]]
+        for r in range(size):
+            factor = rows[r][col]
+            if r != col and factor:
+                rows[r] = [v ^ gf_mul(factor, p) for v, p in zip(rows[r], rows[col])]
+    return [row[size:] for row in rows]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError(
+            "erasure coding requires numpy, install kade_drive with the erasure extra"
+        )
+
+
+def _mul_table():
+    global _MUL_TABLE  # pylint: disable=global-statement
+    if _MUL_TABLE is None:
+        exp = np.array(GF_EXP, dtype=np.uint8)
+        log = np.array(GF_LOG, dtype=np.int32)
+        table = exp[log[:, None] + log[None, :]]
+        table[0, :] = 0
+        table[:, 0] = 0
+        _MUL_TABLE = table
+    return _MUL_TABLE
+
+
+class ReedSolomon:
+    """
+    Encoder/decoder for ``data_shards`` data fragments plus ``parity_shards``
+    parity fragments of equal size.
+    """
+
+    def __init__(self, data_shards: int, parity_shards: int):
+        if data_shards < 1 or parity_shards < 0:
+            raise ValueError("invalid number of shards")
+        if data_shards + parity_shards > 256:
+            raise ValueError("GF(256) supports at most 256 fragments")
+        _require_numpy()
+        self.data_shards = data_shards
+        self.parity_shards = parity_shards
+        identity = [[int(i == j) for j in range(data_shards)] for i in range(data_shards)]
+        cauchy = [
+            [gf_inv((data_shards + i) ^ j) for j in range(data_shards)]
+            for i in range(parity_shards)
+        ]
+        self.matrix = identity + cauchy
+
+    @property
+    def total_shards(self):
+        return self.data_shards + self.parity_shards
+
+    @staticmethod
+    def _apply(rows: list[list[int]], shards) -> list[bytes]:
+        """
+        Multiply the matrix rows by the stacked shards, every output byte is the
+        GF(256) dot product of a row with a column of the shards.
+        """
+        table = _mul_table()
+        result = []
+        for row in rows:
+            acc = np.zeros(shards.shape[1], dtype=np.uint8)
+            for coefficient, shard in zip(row, shards):
+                if coefficient == 1:
+                    acc ^= shard
+                elif coefficient:
+                    acc ^= table[coefficient].take(shard)
+            result.append(acc.tobytes())
+        return result
+
+    def _stack(self, fragments) -> "np.ndarray":
+        sizes = {len(f) for f in fragments}
+        if len(sizes) != 1:
+            raise ValueError("all fragments must have the same size")
+        return np.frombuffer(b"".join(fragments), dtype=np.uint8).reshape(
+            len(fragments), sizes.pop()
+        )
+
+    def encode(self, data: list[bytes]) -> list[bytes]:
+        """
+        Get the parity fragments of the given data fragments.
+        """
+        if len(data) != self.data_shards:
+            raise ValueError(f"expected {self.data_shards} data fragments")
+        if not self.parity_shards:
+            return []
+        return self._apply(self.matrix[self.data_shards :], self._stack(data))
+
+    def decode(self, fragments: dict[int, bytes]) -> list[bytes]:
+        """
+        Rebuild the data fragments from any ``data_shards`` of the fragments,
+        given as a dict from fragment index to its content.
+        """
+        if all(i in fragments for i in range(self.data_shards)):
+            return [fragments[i] for i in range(self.data_shards)]
+        available = sorted(fragments)[: self.data_shards]
+        if len(available) < self.data_shards:
+            raise ValueError(
+                f"{len(available)} fragments are not enough to rebuild {self.data_shards}"
+            )
+        inverse = gf_invert_matrix([self.matrix[i] for i in available])
+        return self._apply(inverse, self._stack([fragments[i] for i in available]))
+
+
+def pad_fragments(chunks: list[bytes]) -> tuple[list[bytes], int]:
+    """
+    Pad the chunks with zeros to the size of the largest one.
+    """
+    shard_size = max(len(c) for c in chunks)
+    return [c.ljust(shard_size, b"\0") for c in chunks], shard_size
@@ -0,0 +1,90 @@
+"""
+Hedged requests: ask a second replica when the first one is late.
+"""
+import logging
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeBudget:
+    """
+    Token bucket capping the hedged requests to ratio of the requests: every
+    request earns ratio tokens, up to burst, and every hedge spends one.
+    """
+
+    def __init__(self, ratio: float = 0.1, burst: float = 10):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def on_request(self):
+        with self._lock:
+            self.requests += 1
+            self.tokens = min(self.tokens + self.ratio, self.burst)
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            self.hedges += 1
+            return True
+
+
+def first_answer(
+    candidates: list,
+    read: Callable,
+    delay_of: Callable[..., float],
+    budget: HedgeBudget,
+    executor: Executor,
+):
+    """
+    Call read(candidate) on the candidates in order until one returns
+    something other than None, calls that raise count as None. When the
+    latest call in flight has not answered after delay_of(candidate)
+    seconds, and the budget allows it, the next candidate is asked too and
+    the first answer wins. The calls that lose are left to finish.
+    """
+    remaining = list(candidates)
+    # future -> (candidate, time it was sent)
+    pending: dict[Future, tuple] = {}
+
+    def launch():
+        candidate = remaining.pop(0)
+        pending[executor.submit(read, candidate)] = (candidate, time.monotonic())
+
+    budget.on_request()
+    hedging = True
+    while remaining or pending:
+        if not pending:
+            launch()
+        timeout = None
+        if hedging and remaining:
+            candidate, sent = max(pending.values(), key=lambda entry: entry[1])
+            timeout = max(sent + delay_of(candidate) - time.monotonic(), 0)
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            if budget.try_hedge():
+                logger.debug(f"hedging the read with {remaining[0]}")
+                launch()
+            else:
+                # out of budget, wait for the calls in flight
+                hedging = False
+            continue
+        for future in done:
+            candidate, _ = pending.pop(future)
+            try:
+                value = future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.warning(f"read from {candidate} failed, {e}")
+                continue
+            if value is not None:
+                return value
+    return None
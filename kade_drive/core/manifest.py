@@ -0,0 +1,248 @@
+"""
+Binary format of the metadata of a file.
+
+A manifest is a fixed size header followed by a packed array of entries, one
+per chunk (or per erasure coded fragment), holding the 20 bytes digest of the
+chunk and its length. Entries are parsed lazily from a memoryview, so reading
+any of them is O(1) and no untrusted data goes through pickle.
+
+Manifests with too many entries are split in sub-manifests, stored as regular
+chunks, and the metadata record keeps an index manifest whose entries are the
+digests of the sub-manifests and the number of entries of each one.
+
+Small files are inlined: the manifest has no entries and the content of the
+file follows the header, so reading it takes a single metadata lookup.
+"""
+import struct
+
+from kade_drive.core.utils import digest
+
+
+MAGIC = b"KDMF"
+VERSION = 1
+
+CODEC_PLAIN = 0
+CODEC_REED_SOLOMON = 1
+
+FLAG_INDEX = 1
+FLAG_INLINE = 2
+
+# magic, version, codec, flags, data shards, parity shards, chunk size,
+# entries count, total length, file hash
+HEADER = struct.Struct(">4sBBBBBIIQ20s")
+ENTRY = struct.Struct(">20sI")
+NO_HASH = bytes(20)
+
+
+class Manifest:
+    def __init__(
+        self,
+        entries: bytes | memoryview,
+        total_length: int,
+        file_hash: bytes = NO_HASH,
+        codec: int = CODEC_PLAIN,
+        flags: int = 0,
+        chunk_size: int = 0,
+        data_shards: int = 0,
+        parity_shards: int = 0,
+        payload: bytes = b"",
+    ):
+        """
+        Args:
+            entries: The packed entries, see :meth:`pack_entries`
+            total_length: Length in bytes of the whole file
+            file_hash: Digest of the whole file, zeros if unknown
+            codec: How the file is rebuilt from its entries
+            flags: FLAG_INDEX if the entries are sub-manifests
+            chunk_size: Size of the chunks the file was split in
+            data_shards: Data fragments per group, for erasure coded files
+            parity_shards: Parity fragments per group, for erasure coded files
+            payload: Content of the file, for inline manifests
+        """
+        if len(entries) % ENTRY.size:
+            raise ValueError("entries are not a whole number of records")
+        self.entries = memoryview(entries)
+        self.total_length = total_length
+        self.file_hash = file_hash
+        self.codec = codec
+        self.flags = flags
+        self.chunk_size = chunk_size
+        self.data_shards = data_shards
+        self.parity_shards = parity_shards
+        self.payload = payload
+
+    @staticmethod
+    def pack_entries(digests, lengths) -> bytes:
+        return b"".join(ENTRY.pack(d, length) for d, length in zip(digests, lengths))
+
+    @staticmethod
+    def for_chunks(chunks: list[bytes], chunk_size: int = 0) -> "Manifest":
+        """
+        Build the manifest of a file stored as the given chunks.
+        """
+        return Manifest(
+            Manifest.pack_entries([digest(c) for c in chunks], map(len, chunks)),
+            total_length=sum(map(len, chunks)),
+            file_hash=digest(b"".join(chunks)),
+            chunk_size=chunk_size,
+        )
+
+    @staticmethod
+    def inline(data: bytes) -> "Manifest":
+        """
+        Build the manifest of a small file stored inside its metadata record.
+        """
+        return Manifest(
+            b"",
+            total_length=len(data),
+            file_hash=digest(data),
+            flags=FLAG_INLINE,
+            payload=data,
+        )
+
+    @property
+    def is_inline(self) -> bool:
+        return bool(self.flags & FLAG_INLINE)
+
+    @property
+    def is_index(self) -> bool:
+        return bool(self.flags & FLAG_INDEX)
+
+    @property
+    def has_file_hash(self) -> bool:
+        return self.file_hash != NO_HASH
+
+    def __len__(self):
+        return len(self.entries) // ENTRY.size
+
+    def entry(self, index: int) -> tuple[bytes, int]:
+        if not 0 <= index < len(self):
+            raise IndexError("manifest entry out of range")
+        return ENTRY.unpack_from(self.entries, index * ENTRY.size)
+
+    def __iter__(self):
+        return ENTRY.iter_unpack(self.entries)
+
+    def digests(self) -> list[bytes]:
+        return [d for d, _ in self]
+
+    def encode(self) -> bytes:
+        header = HEADER.pack(
+            MAGIC,
+            VERSION,
+            self.codec,
+            self.flags,
+            self.data_shards,
+            self.parity_shards,
+            self.chunk_size,
+            len(self),
+            self.total_length,
+            self.file_hash,
+        )
+        if self.is_inline:
+            return header + bytes(self.payload)
+        return header + self.entries.tobytes()
+
+    @staticmethod
+    def decode(data: bytes) -> "Manifest":
+        view = memoryview(data)
+        if len(view) < HEADER.size:
+            raise ValueError("manifest is too short")
+        (
+            magic,
+            version,
+            codec,
+            flags,
+            data_shards,
+            parity_shards,
+            chunk_size,
+            count,
+            total_length,
+            file_hash,
+        ) = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("not a manifest")
+        if version != VERSION:
+            raise ValueError(f"unsupported manifest version {version}")
+        entries = view[HEADER.size :]
+        if flags & FLAG_INLINE:
+            if count or len(entries) != total_length:
+                raise ValueError("inline manifest does not match the header")
+            return Manifest(
+                b"", total_length, file_hash, codec, flags, payload=entries.tobytes()
+            )
+        if len(entries) != count * ENTRY.size:
+            raise ValueError("manifest entries do not match the header")
+        return Manifest(
+            entries,
+            total_length,
+            file_hash,
+            codec,
+            flags,
+            chunk_size,
+            data_shards,
+            parity_shards,
+        )
+
+    def _with_entries(self, entries, flags: int) -> "Manifest":
+        return Manifest(
+            entries,
+            self.total_length,
+            self.file_hash,
+            self.codec,
+            flags,
+            self.chunk_size,
+            self.data_shards,
+            self.parity_shards,
+        )
+
+    def split(self, max_entries: int) -> tuple["Manifest", list[bytes]]:
+        """
+        Split the manifest so no record has more than max_entries entries.
+
+        Returns:
+            The manifest to store in the metadata record, and the encoded
+            sub-manifests that it references, empty if no split was needed.
+        """
+        if len(self) <= max_entries:
+            return self, []
+        step = max_entries * ENTRY.size
+        subs = [
+            self._with_entries(self.entries[i : i + step], 0).encode()
+            for i in range(0, len(self.entries), step)
+        ]
+        counts = [(len(s) - HEADER.size) // ENTRY.size for s in subs]
+        index = self._with_entries(
+            Manifest.pack_entries(map(digest, subs), counts), self.flags | FLAG_INDEX
+        )
+        if len(index) > max_entries:
+            raise ValueError("manifest too large for two levels of sub-manifests")
+        return index, subs
+
+    def join(self, subs: list["Manifest"]) -> "Manifest":
+        """
+        Rebuild the whole manifest of an index from its sub-manifests.
+        """
+        if not self.is_index:
+            return self
+        entries = b"".join(s.entries.tobytes() for s in subs)
+        return self._with_entries(entries, self.flags & ~FLAG_INDEX)
+
+    def groups(self):
+        """
+        Yield the (data count, shard size, length, fragment keys) of every
+        group of an erasure coded file.
+        """
+        remaining_chunks = -(-self.total_length // self.chunk_size) if self.chunk_size else 0
+        offset = 0
+        index = 0
+        while remaining_chunks > 0:
+            data_count = min(self.data_shards, remaining_chunks)
+            size = data_count + self.parity_shards
+            keys = tuple(self.entry(i)[0] for i in range(index, index + size))
+            shard_size = self.entry(index)[1]
+            length = min(data_count * self.chunk_size, self.total_length - offset)
+            yield data_count, shard_size, length, keys
+            remaining_chunks -= data_count
+            offset += length
+            index += size
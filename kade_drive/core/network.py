@@ -9,14 +9,31 @@ from time import sleep
 import rpyc
 import pickle
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 from rpyc.utils.server import ThreadedServer
 from kade_drive.core.config import Config
-from kade_drive.core.protocol import FileSystemProtocol, ServerSession
+from kade_drive.core.pool import ConnectionPool
+from kade_drive.core.protocol import FileSystemProtocol, ServerSession, WelcomeQueue
 from kade_drive.core.routing import RoutingTable
+from kade_drive.core.singleflight import SingleFlight
+from kade_drive.core.snapshot import RoutingSnapshot
 from kade_drive.core.utils import digest
 from kade_drive.core.storage import PersistentStorage
-from kade_drive.core.node import Node
+from kade_drive.core.node import Node, peer_node
+from kade_drive.core.transport import (
+    AsyncioServer,
+    MultiplexedPool,
+    RequestLimiter,
+    is_busy,
+)
+from kade_drive.core import wire
+from kade_drive.core.cache import CLOSEST, LOCATIONS, LookupCache
+from kade_drive.core.dataplane import DataPlaneClient, DataPlaneServer
+from kade_drive.core.peerstats import PeerStats
+from kade_drive.core.upload import UploadSessions
+from kade_drive.core.erasure import ReedSolomon, pad_fragments
+from kade_drive.core.manifest import Manifest, CODEC_PLAIN, CODEC_REED_SOLOMON
 
 from message_system.message_system import MessageSystem
 
@@ -28,8 +45,14 @@ from kade_drive.core.crawling import (
     ValueSpiderCrawl,
 )
 
-from kade_drive.core.crawling import NodeSpiderCrawl
-from kade_drive.core.utils import is_port_in_use, it_is_necessary_to_write
+from kade_drive.core.crawling import NodeSpiderCrawl, SpiderCrawl
+from kade_drive.core.utils import (
+    batched,
+    from_timestamp,
+    is_port_in_use,
+    it_is_necessary_to_write,
+    to_timestamp,
+)
 
 # from models.file import File
 
@@ -43,6 +66,19 @@ class Server:
     storage: PersistentStorage
     node: Node
     routing: RoutingTable
+    config: Config
+    upload_sessions: UploadSessions
+    transport: str = "rpyc"
+    limiter: RequestLimiter | None = None
+    # concurrent lookups of the same key share one crawl
+    single_flight = SingleFlight()
+    # recent lookups are answered without a crawl
+    lookup_cache: LookupCache
+    # chunk bytes travel out of band
+    data_plane: DataPlaneServer | None = None
+    data_client = DataPlaneClient()
+    # the routing table is saved to rejoin quickly after a restart
+    routing_snapshot: RoutingSnapshot | None = None
 
     @staticmethod
     def init(
@@ -53,6 +89,7 @@ class Server:
         port: int = 8086,
         node_id: bytes | None = None,
         storage: PersistentStorage | None = None,
+        transport: str = "rpyc",
     ):
         """
         Args:
@@ -61,23 +98,99 @@ class Server:
             node_id: The id for this node on the network.
             storage: An instance that implements the interface
                      :class:`~kademlia.storage.PersistenceStorage`
+            transport: "rpyc" or "asyncio", every node of a network and its
+                       clients must use the same one
         """
+        if transport not in ("rpyc", "asyncio"):
+            raise ValueError(f"unknown transport {transport}")
         while is_port_in_use(ip, port):
             port += 1
 
         logging.getLogger(f"SERVER/{port}").setLevel(logging.CRITICAL + 1)
+        Server.config = config
         Server.ksize = ksize
         Server.alpha = alpha
+        Server.upload_sessions = UploadSessions(config.upload_session_ttl)
+        Server.transport = transport
+        if transport == "asyncio":
+            ServerSession.pool = MultiplexedPool(idle_timeout=config.pool_idle_timeout)
+            # the asyncio server queues and rejects requests by itself
+            Server.limiter = None
+        else:
+            Server.limiter = RequestLimiter(
+                workers=config.server_workers,
+                max_queued=config.server_max_queued,
+                queue_timeout=config.server_queue_timeout,
+            )
+            ServerSession.pool = ConnectionPool(
+                max_idle_per_peer=config.pool_max_idle_per_peer,
+                max_connections=config.pool_max_connections,
+                idle_timeout=config.pool_idle_timeout,
+            )
         Server.storage = storage or PersistentStorage(config.ttl)
+        contacts = []
+        if config.routing_snapshot_path:
+            Server.routing_snapshot = RoutingSnapshot(
+                config.routing_snapshot_path.format(port=port),
+                max_age=config.routing_snapshot_max_age,
+            )
+            saved, contacts = Server.routing_snapshot.load()
+            # the id is kept so the peers of the snapshot still know this
+            # node, only when the snapshot is its own and not the one of
+            # another node started from the same directory
+            if saved is not None and (saved.ip, str(saved.port)) == (ip, str(port)):
+                node_id = node_id or saved.id
         Server.node = Node(
             node_id or digest(random.getrandbits(255)), ip=ip, port=str(port)
         )
         logger.info(f"NODE ID: {Server.node.id}")
-        Server.routing = RoutingTable(Server.ksize, Server.node)
-        FileSystemProtocol.init(Server.routing, Server.storage)
+        Server.lookup_cache = LookupCache(
+            ttl=config.lookup_cache_ttl, max_entries=config.lookup_cache_size
+        )
+        ServerSession.lookup_cache = Server.lookup_cache
+        ServerSession.peer_stats = PeerStats(min_timeout=config.peer_min_timeout)
+        Server.routing = RoutingTable(
+            Server.ksize,
+            Server.node,
+            Server.lookup_cache,
+            trie_index=config.routing_trie_index,
+        )
+        SpiderCrawl.rpc_timeout = config.rpc_timeout
+        SpiderCrawl.deadline = config.lookup_deadline
+        SpiderCrawl.max_rounds = config.lookup_max_rounds
+        SpiderCrawl.max_stale_rounds = config.lookup_max_stale_rounds
+        SpiderCrawl.max_in_flight = config.lookup_max_in_flight
+        SpiderCrawl.executor = ThreadPoolExecutor(
+            max_workers=config.lookup_max_in_flight * config.lookup_concurrency,
+            thread_name_prefix="crawl",
+        )
+        welcome_queue = WelcomeQueue(
+            FileSystemProtocol.welcome,
+            rate=config.welcome_rate,
+            cooldown=config.welcome_cooldown,
+        )
+        FileSystemProtocol.init(Server.routing, Server.storage, welcome_queue)
+        welcome_queue.start()
         logger.debug(f"{port}, {ip}")
+        if config.data_plane:
+            # the node admits server_workers requests at once in total
+            limiter = Server.limiter or RequestLimiter(
+                workers=config.data_plane_workers,
+                max_queued=config.server_max_queued,
+                queue_timeout=config.server_queue_timeout,
+            )
+            Server.data_plane = DataPlaneServer(
+                lambda key: Server.storage.get(key, metadata=False),
+                hostname=ip,
+                limiter=limiter,
+            )
+            threading.Thread(target=Server.data_plane.start, daemon=True).start()
         threading.Thread(target=Server.listen, args=(port, ip)).start()
-        threading.Thread(target=Server._detect_alone).start()
+        threading.Thread(target=Server._detect_alone, args=(contacts,)).start()
+        if Server.routing_snapshot is not None:
+            threading.Thread(
+                target=Server._save_table, args=(config.routing_snapshot_interval,)
+            ).start()
 
         refresh_thread = threading.Thread(
             target=Server._refresh_table, args=(config.refresh_sleep,)
@@ -96,16 +209,29 @@ class Server:
                 print(interface, port)
                 Server.node.ip = interface
                 Server.node.port = port
-                t = ThreadedServer(
-                    ServerService,
-                    port=port,
-                    hostname=interface,
-                    protocol_config={
-                        "allow_public_attrs": True,
-                        "allow_pickle": True,
-                        "sync_request_timeout": None,
-                    },
-                )
+                if Server.transport == "asyncio":
+                    workers = Server.config.server_workers
+                    if Server.data_plane is not None:
+                        workers = max(workers - Server.config.data_plane_workers, 1)
+                    t = AsyncioServer(
+                        ServerService,
+                        hostname=interface,
+                        port=port,
+                        max_workers=workers,
+                        max_queued=Server.config.server_max_queued,
+                        allow_pickle=False,
+                    )
+                else:
+                    t = ThreadedServer(
+                        ServerService,
+                        port=port,
+                        hostname=interface,
+                        protocol_config={
+                            "allow_public_attrs": True,
+                            "allow_pickle": False,
+                            "sync_request_timeout": None,
+                        },
+                    )
                 t.start()
             except Exception as e:
                 logger.critical(f"Server Listen failed: {e}")
@@ -131,6 +257,37 @@ class Server:
 
         return res
 
+    @staticmethod
+    def rejoin(contacts: list[tuple[Node, float, float | None]]) -> int:
+        """
+        Ping all the (node, last seen, round trip time) contacts of a routing
+        table snapshot at once, the ones that answer are added back to the
+        table and the others dropped, in about one round trip.
+
+        Returns the number of contacts in the table afterwards.
+        """
+        if not contacts:
+            return 0
+        for node, _, rtt in contacts:
+            # dead peers time out after a few of their round trips
+            if rtt is not None:
+                ServerSession.peer_stats.seed(node.ip, node.port, rtt)
+
+        def ping(node: Node):
+            try:
+                with ServerSession(
+                    node.ip, node.port, Server.config.rpc_timeout
+                ) as conn:
+                    FileSystemProtocol.call_ping(conn, node)
+            except Exception as e:  # pylint: disable=broad-except
+                # like a peer that did not answer, the others are still asked
+                logger.info(f"{node} did not answer the rejoin ping, {e}")
+
+        logger.info(f"Rejoining with {len(contacts)} contacts of the last run")
+        with ThreadPoolExecutor(max_workers=min(len(contacts), 32)) as executor:
+            list(executor.map(ping, [node for node, _, _ in contacts]))
+        return sum(len(bucket) for bucket in FileSystemProtocol.router.buckets)
+
     @staticmethod
     def bootstrap_node(addr: tuple[str, str]):
         response = None
@@ -184,78 +341,142 @@ class Server:
         if value is None:
             return
 
-        # logger.warning(f"Set diges with value {value}")
-        node = Node(dkey)
-        assert node is not None
-        nearest = FileSystemProtocol.router.find_neighbors(node)
-        # logger.info(f"nearest in set_digest is {nearest}")
+        stored = Server.set_digest_many(
+            [(dkey, value, metadata, local_last_write, key_name)],
+            exclude_current,
+            do_confirmation,
+        )
+        # return true only if at least one store call succeeded
+        return dkey in stored
 
-        if not nearest or len(nearest) == 0:
-            return Server._handle_empty_neighbors(
-                dkey, metadata, value, exclude_current, local_last_write, key_name
-            )
-        spider = NodeSpiderCrawl(node, nearest, Server.ksize, Server.alpha)
-        nodes = spider.find()
-        # logger.debug("setting '%s' on %s", dkey, list(map(str, nodes)))
+    @staticmethod
+    def set_digest_many(entries, exclude_current=False, do_confirmation=False):
+        """
+        Set many keys in the network, entries are (dkey, value, is_metadata,
+        last_write, key_name) tuples. The work is grouped by destination node,
+        so every node gets one check call and as few store calls as the
+        size of the values allows.
 
-        if not nodes or len(nodes) == 0:
-            return Server._handle_empty_neighbors(
-                dkey, metadata, value, exclude_current, local_last_write, key_name
-            )
+        Returns:
+            The set of keys stored in at least one node.
+        """
+        stored: set[bytes] = set()
+        targets: dict[bytes, tuple[Node, list]] = {}
+        for dkey, value, metadata, local_last_write, key_name in entries:
+            if value is None:
+                continue
+            node = Node(dkey)
+            nodes = Server.find_closest(dkey)
+            if not nodes:
+                if Server._handle_empty_neighbors(
+                    dkey, metadata, value, exclude_current, local_last_write, key_name
+                ):
+                    stored.add(dkey)
+                continue
 
-        # if this node is close too, then store here as well
-        biggest = max([n.distance_to(node) for n in nodes])
-        responses = []
-        if Server.node.distance_to(node) < biggest and not exclude_current:
-            contains, date = Server.storage.check_if_new_value_exists(dkey, metadata)
-            if it_is_necessary_to_write(local_last_write, contains, date):
-                if metadata:
-                    Server.storage.set_metadata(
-                        dkey,
-                        value,
-                        False,
-                        key_name=key_name,
-                        last_write=local_last_write,
-                    )
-                else:
-                    Server.storage.set_value(
-                        dkey, value, False, last_write=local_last_write
+            # if this node is close too, then store here as well
+            biggest = max([n.distance_to(node) for n in nodes])
+            if Server.node.distance_to(node) < biggest and not exclude_current:
+                contains, date = Server.storage.check_if_new_value_exists(
+                    dkey, metadata
+                )
+                if it_is_necessary_to_write(local_last_write, contains, date):
+                    Server._store_locally(
+                        dkey, value, metadata, local_last_write, key_name
                     )
-                responses.append(True)
+                    stored.add(dkey)
 
-        for n in nodes:
-            address = (n.ip, n.port)
-            with ServerSession(address[0], address[1]) as conn:
-                response = FileSystemProtocol.call_check_if_new_value_exists(
-                    conn, n, node, metadata
+            entry = (
+                dkey,
+                value,
+                to_timestamp(local_last_write),
+                metadata,
+                key_name,
+                "replicated",
+            )
+            for n in nodes:
+                targets.setdefault(n.id, (n, []))[1].append(entry)
+
+        for n, node_entries in targets.values():
+            with ServerSession(n.ip, n.port) as conn:
+                held = FileSystemProtocol.store_many(
+                    conn,
+                    n,
+                    node_entries,
+                    do_confirmation,
+                    Server.config.store_batch_bytes,
                 )
-                contains, date = None, None
-                if response is None:
-                    responses.append(False)
-                    continue
+            if held is not None:
+                stored.update(held)
+        return stored
 
-                if response is not None:
-                    contains, date = response
+    @staticmethod
+    def find_closest(dkey: bytes) -> list[Node]:
+        """
+        The k closest nodes to dkey, from the lookup cache or a node crawl.
+        """
+        nodes = Server.lookup_cache.get(CLOSEST, dkey)
+        if nodes is not None:
+            return nodes
+        node = Node(dkey)
+        nearest = FileSystemProtocol.router.find_neighbors(node)
+        if not nearest:
+            return []
+        spider = NodeSpiderCrawl(node, nearest, Server.ksize, Server.alpha)
+        nodes = spider.find() or []
+        Server.lookup_cache.put(CLOSEST, dkey, nodes)
+        return nodes
 
-                if it_is_necessary_to_write(local_last_write, contains, date):
-                    result = FileSystemProtocol.call_store(
-                        conn, n, node, value, metadata, key_name, local_last_write
-                    )
-                    if result:
-                        if do_confirmation:
-                            r = FileSystemProtocol.call_confirm_integrity(
-                                conn, n, node, metadata
-                            )
-                            responses.append(r)
-                        else:
-                            responses.append(True)
-                    else:
-                        responses.append(False)
-                else:
-                    if response:
-                        responses.append(True)
-        # return true only if at least one store call succeeded
-        return any(responses)
+    @staticmethod
+    def find_chunk_locations(dkey: bytes) -> list[tuple[str, int]] | None:
+        """
+        The (ip, port) of the nodes holding the chunk, from the lookup cache
+        or a chunk location crawl. None if there are no known neighbors.
+        """
+        locations = Server.lookup_cache.get(LOCATIONS, dkey)
+        if locations is not None:
+            return locations
+        node = Node(dkey)
+        nearest = FileSystemProtocol.router.find_neighbors(node)
+        if not nearest:
+            return None
+        spider = ChunkLocationSpiderCrawl(node, nearest, Server.ksize, Server.alpha)
+        locations = Server.single_flight.do("chunk_location", dkey, spider.find)
+        if locations:
+            Server.lookup_cache.put(LOCATIONS, dkey, locations)
+        # coalesced callers get their own copy, clients pop from it
+        return None if locations is None else list(locations)
+
+    @staticmethod
+    def _find_value_in_cached(dkey: bytes) -> bytes | None:
+        """
+        Ask the cached closest nodes of dkey for its metadata, None if the
+        key is not cached or none of them has it.
+        """
+        node = Node(dkey)
+        for peer in Server.lookup_cache.get(CLOSEST, dkey) or []:
+            with ServerSession(peer.ip, peer.port, Server.config.rpc_timeout) as conn:
+                response = FileSystemProtocol.call_find_value(conn, peer, node)
+            if isinstance(response, dict) and response.get("value") is not None:
+                return response["value"]
+        return None
+
+    @staticmethod
+    def _store_locally(
+        dkey, value, metadata, local_last_write, key_name, storage_class="replicated"
+    ):
+        if metadata:
+            Server.storage.set_metadata(
+                dkey, value, False, key_name=key_name, last_write=local_last_write
+            )
+        else:
+            Server.storage.set_value(
+                dkey,
+                value,
+                False,
+                last_write=local_last_write,
+                storage_class=storage_class,
+            )
 
     @staticmethod
     def _handle_empty_neighbors(
@@ -267,18 +488,13 @@ class Server:
             local_last_write, contains, date
         ):
             logger.info("storing in current server")
-            if metadata:
-                Server.storage.set_metadata(
-                    dkey, value, False, key_name=key_name, last_write=local_last_write
-                )
-            else:
-                Server.storage.set_value(
-                    dkey, value, False, last_write=local_last_write
-                )
+            Server._store_locally(dkey, value, metadata, local_last_write, key_name)
         return True
 
     @staticmethod
     def delete_data_from_network(key: bytes, is_metadata=True):
+        if not is_metadata:
+            Server.lookup_cache.discard(LOCATIONS, key)
         node = Node(key)
         nearest = FileSystemProtocol.router.find_neighbors(node)
         if not nearest or len(nearest) == 0:
@@ -308,11 +524,359 @@ class Server:
         result = spider.find(is_metadata)
         return result
 
+    @staticmethod
+    def find_metadata(dkey: bytes) -> Manifest | None:
+        """
+        Get the manifest of the file stored with the given key, sub-manifests
+        are fetched and joined.
+
+        Returns:
+            :class:`None` if not found, the manifest otherwise.
+        """
+        node = Node(dkey)
+        nearest = FileSystemProtocol.router.find_neighbors(node)
+        data = None
+        if not nearest or len(nearest) == 0:
+            logger.debug(f"There are no known neighbors to get key {dkey}")
+            if Server.storage.contains(dkey):
+                logger.debug("Getting key from this same node")
+                data = Server.storage.get(dkey, True)
+        else:
+            data = Server._find_value_in_cached(dkey)
+            if data is None:
+                spider = ValueSpiderCrawl(node, nearest, Server.ksize, Server.alpha)
+                data = spider.find()
+        if data is None:
+            logger.debug("NONE DATA")
+            return None
+
+        try:
+            manifest = Manifest.decode(data)
+            if not manifest.is_index:
+                return manifest
+            subs = []
+            for sub_key, _ in manifest:
+                sub = Server.fetch_chunk(sub_key)
+                if sub is None or digest(sub) != sub_key:
+                    logger.error("sub-manifest of metadata not found")
+                    return None
+                subs.append(Manifest.decode(sub))
+            return manifest.join(subs)
+        except ValueError as e:
+            logger.error(f"exception when decoding manifest {e}")
+            return None
+
+    @staticmethod
+    def publish_manifest(
+        dkey: bytes, manifest: Manifest, key_name: str, local_last_write=None
+    ) -> bool:
+        """
+        Store the manifest of a file in the metadata record of dkey. Manifests
+        with more than manifest_max_entries entries are split and their
+        sub-manifests are stored as chunks before the metadata record.
+
+        Raises ValueError, before storing anything, when the manifest does not
+        fit in two levels of sub-manifests.
+        """
+        root, subs = manifest.split(Server.config.manifest_max_entries)
+        for sub in subs:
+            sub_key = digest(sub)
+            if not Server.set_digest(sub_key, sub, metadata=False):
+                logger.warning("Failed set_digest of sub-manifest")
+                return False
+            if not Server.confirm_integrity_of_data(sub_key, False):
+                logger.warning("It was not possible to confirm integrity of sub-manifest")
+        return Server.set_digest(
+            dkey, root.encode(), key_name=key_name, local_last_write=local_last_write
+        )
+
+    @staticmethod
+    def store_inline(key_name: str, key: str, data: bytes, local_last_write=None):
+        """
+        Store a file below the inline threshold inside its metadata record,
+        without chunks.
+        """
+        dkey = digest(key)
+        if not Server.publish_manifest(
+            dkey, Manifest.inline(data), key_name, local_last_write
+        ):
+            logger.warning("Failed set_digest of inline metadata")
+            return False
+        if not Server.confirm_integrity_of_data(dkey, True):
+            logger.warning("It was not possible to confirm integrity of metadata")
+        logger.info(f"File {key_name} stored inline")
+        return True
+
+    @staticmethod
+    def next_last_write(dkey: bytes, is_metadata=True):
+        """
+        Get a last_write date newer than every copy of the key held by this
+        node and its closest known peers, so the new version replaces them.
+        """
+        dates = []
+        _, date = Server.storage.check_if_new_value_exists(dkey, is_metadata)
+        if date is not None:
+            dates.append(date)
+
+        node = Node(dkey)
+        for n in FileSystemProtocol.router.find_neighbors(node):
+            with ServerSession(n.ip, n.port) as conn:
+                response = FileSystemProtocol.call_check_if_new_value_exists(
+                    conn, n, node, is_metadata
+                )
+                if response is None:
+                    continue
+                contains, date = response
+                if contains and date is not None:
+                    dates.append(
+                        datetime.datetime.strptime(
+                            date.strftime("%m/%d/%y %H:%M:%S"), "%m/%d/%y %H:%M:%S"
+                        )
+                    )
+
+        now = datetime.datetime.now().replace(microsecond=0)
+        if dates and max(dates) >= now:
+            return max(dates) + datetime.timedelta(seconds=1)
+        return now
+
+    @staticmethod
+    def probe_chunks(dkeys) -> set[bytes]:
+        """
+        Return the subset of the given chunk digests that are already stored,
+        with integrity confirmed, in this node or in the closest known peers.
+
+        Keys are grouped by peer, so every peer is probed over a single session.
+        """
+        present: set[bytes] = set()
+        by_peer: dict[tuple[str, str], tuple[Node, list[bytes]]] = {}
+        for dkey in dkeys:
+            if dkey in present:
+                continue
+            if Server.storage.contains(dkey, False):
+                present.add(dkey)
+                continue
+            for n in FileSystemProtocol.router.find_neighbors(Node(dkey)):
+                by_peer.setdefault((n.ip, n.port), (n, []))[1].append(dkey)
+
+        for n, keys in by_peer.values():
+            with ServerSession(n.ip, n.port) as conn:
+                for dkey in keys:
+                    if dkey in present:
+                        continue
+                    response = FileSystemProtocol.call_contains(
+                        conn, n, Node(dkey), False
+                    )
+                    if response is None:
+                        break
+                    if response["value"]:
+                        present.add(dkey)
+        return present
+
+    @staticmethod
+    def closest_node(dkey: bytes) -> Node:
+        """
+        Get the node of the network closest to the given key, which can be this
+        same node.
+        """
+        node = Node(dkey)
+        candidates = [Server.node]
+        nearest = FileSystemProtocol.router.find_neighbors(node)
+        if nearest:
+            spider = NodeSpiderCrawl(node, nearest, Server.ksize, Server.alpha)
+            candidates.extend(spider.find() or [])
+        return min(candidates, key=node.distance_to)
+
+    @staticmethod
+    def store_fragment(dkey: bytes, fragment: bytes, target: Node | None = None):
+        """
+        Store an erasure coded fragment only in the target node, by default the
+        closest node to the key, with its integrity confirmed.
+        """
+        target = target or Server.closest_node(dkey)
+        if target.id == Server.node.id:
+            Server.storage.set_value(
+                dkey, fragment, metadata=False, storage_class="erasure"
+            )
+            Server.storage.confirm_integrity(dkey, False)
+            return True
+
+        node = Node(dkey)
+        with ServerSession(target.ip, target.port) as conn:
+            stored = FileSystemProtocol.call_store(
+                conn, target, node, fragment, False, storage_class="erasure"
+            )
+            if not stored:
+                return False
+            return bool(
+                FileSystemProtocol.call_confirm_integrity(conn, target, node, False)
+            )
+
+    @staticmethod
+    def place_fragments(fragments: list[bytes]) -> list[bytes] | None:
+        """
+        Store every fragment of a group in a different node. The key of a
+        fragment is salted until it falls on a node that does not hold another
+        fragment of the group, if the network is too small to find one the
+        collision is accepted.
+
+        Returns:
+            The keys of the stored fragments, None if some store failed.
+        """
+        used: set[bytes] = set()
+        keys: list[bytes] = []
+        for fragment in fragments:
+            for attempt in range(Server.config.erasure_placement_attempts):
+                salt = attempt.to_bytes(2, byteorder="big") if attempt else b""
+                dkey = digest(salt + fragment)
+                target = Server.closest_node(dkey)
+                if target.id not in used:
+                    break
+            if not Server.store_fragment(dkey, fragment, target):
+                logger.warning("Failed to store fragment, rolling back group")
+                for stored in keys:
+                    Server.delete_data_from_network(key=stored, is_metadata=False)
+                return None
+            used.add(target.id)
+            keys.append(dkey)
+        return keys
+
+    @staticmethod
+    def store_erasure_coded(key_name: str, key: str, data: bytes) -> bool:
+        """
+        Store data Reed-Solomon encoded instead of replicated. Every group of
+        erasure_data_shards chunks gets erasure_parity_shards parity fragments
+        and each fragment is stored once, in a distinct node.
+        """
+        data_shards = Server.config.erasure_data_shards
+        parity_shards = Server.config.erasure_parity_shards
+        chunks = Server.split_data(data, Server.config.chunk_size)
+
+        digests: list[bytes] = []
+        lengths: list[int] = []
+        stored: list[bytes] = []
+        for start in range(0, len(chunks), data_shards):
+            group_chunks = chunks[start : start + data_shards]
+            fragments, shard_size = pad_fragments(group_chunks)
+            codec = ReedSolomon(len(fragments), parity_shards)
+            keys = Server.place_fragments(fragments + codec.encode(fragments))
+            if keys is None:
+                break
+            stored.extend(keys)
+            digests.extend(keys)
+            lengths.extend([shard_size] * len(keys))
+        else:
+            dkey = digest(key)
+            manifest = Manifest(
+                Manifest.pack_entries(digests, lengths),
+                total_length=sum(map(len, chunks)),
+                file_hash=digest(b"".join(chunks)),
+                codec=CODEC_REED_SOLOMON,
+                chunk_size=Server.config.chunk_size,
+                data_shards=data_shards,
+                parity_shards=parity_shards,
+            )
+            try:
+                published = Server.publish_manifest(
+                    dkey, manifest, key_name, Server.next_last_write(dkey)
+                )
+            except ValueError as e:
+                logger.warning(f"Metadata of {key_name} can not be stored, {e}")
+                published = False
+            if published:
+                if not Server.confirm_integrity_of_data(dkey, True):
+                    logger.warning("It was not possible to confirm integrity of metadata")
+                logger.info("File uploaded with erasure coding successfully")
+                return True
+
+        logger.warning("Failed to store erasure coded file, rolling back changes")
+        for dkey in stored:
+            Server.delete_data_from_network(key=dkey, is_metadata=False)
+        return False
+
+    @staticmethod
+    def fetch_chunk(dkey: bytes) -> bytes | None:
+        """
+        Get the value of a chunk from this node or from any node that has it.
+        """
+        if Server.storage.contains(dkey, False):
+            return Server.storage.get(dkey, metadata=False)
+
+        locations = Server.find_chunk_locations(dkey) or []
+        for ip, port in ServerSession.peer_stats.order(locations):
+            try:
+                with ServerSession(ip, port) as conn:
+                    if conn is None:
+                        continue
+                    value = Server.data_client.read(conn, ip, port, dkey)
+            except (EOFError, ConnectionError) as e:
+                logger.warning(f"Failed to fetch chunk from {ip}:{port}, {e}")
+                continue
+            except Exception as e:  # pylint: disable=broad-except
+                if not is_busy(e):
+                    raise
+                # try the next replica
+                logger.info(f"{ip}:{port} is busy, fetching chunk elsewhere")
+                continue
+            if value is not None:
+                return value
+            # the replica lost the chunk
+            Server.lookup_cache.invalidate(ip, port)
+        return None
+
+    @staticmethod
+    def read_erasure_group(parity_shards: int, group: tuple) -> bytes | None:
+        """
+        Rebuild the data of an erasure coded group from the first fragments
+        that can be fetched, fragments found missing are stored again.
+        """
+        data_count, shard_size, length, keys = group
+        codec = ReedSolomon(data_count, parity_shards)
+        fragments: dict[int, bytes] = {}
+        missing: list[int] = []
+        for index, dkey in enumerate(keys):
+            if len(fragments) == data_count:
+                break
+            value = Server.fetch_chunk(dkey)
+            if value is None or len(value) != shard_size:
+                missing.append(index)
+                continue
+            fragments[index] = value
+
+        if len(fragments) < data_count:
+            logger.error(f"Only {len(fragments)} of {data_count} fragments available")
+            return None
+
+        data = codec.decode(fragments)
+        if missing:
+            logger.info(f"Repairing fragments {missing} of erasure coded group")
+            rebuilt = data + codec.encode(data)
+            for index in missing:
+                if not Server.store_fragment(keys[index], rebuilt[index]):
+                    logger.warning(f"Failed to repair fragment {index}")
+        return b"".join(data)[:length]
+
+    @staticmethod
+    def collect_upload_sessions():
+        """
+        Drop the upload sessions that were abandoned by their clients and
+        remove the parts they stored from the network.
+        """
+        for session in Server.upload_sessions.collect_expired():
+            logger.info(
+                f"upload session {session.id} of {session.key_name} expired, rolling back"
+            )
+            for dkey in session.stored:
+                if not Server.delete_data_from_network(key=dkey, is_metadata=False):
+                    logger.warning("Rolling back part of expired session failed")
+
     @staticmethod
     def find_replicas():
         keys_to_find = Server.storage.keys()
         keys_dict = {}
         for k, is_metadata in keys_to_find:
+            if Server.storage.get_storage_class(k, is_metadata) == "erasure":
+                # erasure coded fragments live in a single node by design
+                continue
             node_created = Node(k)
 
             nearest = FileSystemProtocol.router.find_neighbors(
@@ -376,7 +940,13 @@ class Server:
         return return_list
 
     @staticmethod
-    def _detect_alone():
+    def _detect_alone(contacts=()):
+        # the peers of the last run are asked first, the broadcast is only
+        # needed when none of them answers
+        try:
+            Server.rejoin(list(contacts))
+        except Exception as e:
+            logger.error(f"Exception throwed rejoining: {e}")
         while True:
             try:
                 node = Node(digest("test"))
@@ -415,6 +985,17 @@ class Server:
                         target_host, target_port = bootstrap_nodes.split(" ")
                         Server.bootstrap([(target_host, target_port)])
 
+    @staticmethod
+    def _save_table(interval=30):
+        while True:
+            sleep(interval)
+            try:
+                Server.routing_snapshot.save(
+                    Server.node, FileSystemProtocol.router, ServerSession.peer_stats
+                )
+            except Exception as e:
+                logger.error(f"Exception throwed saving the routing table: {e}")
+
     @staticmethod
     def _refresh_table(refresh_sleep=60):
         while True:
@@ -422,6 +1003,9 @@ class Server:
             try:
                 logger.info("Checking corrupted data")
                 Server.storage.delete_corrupted_data()
+                logger.info("Collecting expired upload sessions")
+                Server.collect_upload_sessions()
+                ServerSession.pool.sweep()
                 logger.info("Refreshing table")
                 results = []
                 for node_id in FileSystemProtocol.get_refresh_ids():
@@ -434,26 +1018,17 @@ class Server:
                 # Republishing keys to mantain the network updated
 
                 logger.info("Republishing old keys")
-                for (
-                    key,
-                    value,
-                    is_metadata,
-                    last_write,
-                    key_name,
-                ) in Server.storage.iter_older_than(refresh_sleep):
-                    digest_response = Server.set_digest(
-                        key,
-                        value,
-                        is_metadata,
-                        exclude_current=True,
-                        local_last_write=last_write,
-                        key_name=key_name,
-                        do_confirmation=True,
+                for entries in batched(
+                    Server.storage.iter_older_than(refresh_sleep),
+                    Server.config.republish_batch_size,
+                ):
+                    stored = Server.set_digest_many(
+                        entries, exclude_current=True, do_confirmation=True
                     )
-                    if not digest_response:
-                        logger.warning("Failed set_digest in iter_older than")
-
-                    Server.storage.update_republish(key)
+                    for key, *_ in entries:
+                        if key not in stored:
+                            logger.warning("Failed set_digest in iter_older than")
+                        Server.storage.update_republish(key)
             
             except Exception as e:
                 logger.error("Thrown Exception %s in republish old keys", str(e))
@@ -467,28 +1042,34 @@ class Server:
                     "Republishing keys that have less replicas than the replication factor"
                 )
 
-                if len(keys_to_replicate) > 0:
-                    for key, is_metadata in keys_to_replicate:
+                for keys in batched(
+                    keys_to_replicate, Server.config.republish_batch_size
+                ):
+                    entries = []
+                    for key, is_metadata in keys:
                         _, local_last_write = Server.storage.check_if_new_value_exists(
                             key, is_metadata
                         )
                         logger.info("replicating key %s", key)
                         # check for value4 lock
-                        response = Server.set_digest(
-                            key,
-                            Server.storage.get(
-                                key, metadata=is_metadata, update_timestamp=False
-                            ),
-                            is_metadata,
-                            exclude_current=True,
-                            local_last_write=local_last_write,
-                            key_name=Server.storage.get_key_name(
-                                key, metadata=is_metadata, update_timestamp=False
-                            ),
-                            do_confirmation=True,
+                        entries.append(
+                            (
+                                key,
+                                Server.storage.get(
+                                    key, metadata=is_metadata, update_timestamp=False
+                                ),
+                                is_metadata,
+                                local_last_write,
+                                Server.storage.get_key_name(
+                                    key, metadata=is_metadata, update_timestamp=False
+                                ),
+                            )
                         )
-                        if not response:
-                            logger.warning("Failed set keys_to_replicate in refresh")
+                    stored = Server.set_digest_many(
+                        entries, exclude_current=True, do_confirmation=True
+                    )
+                    if len(stored) < len(entries):
+                        logger.warning("Failed set keys_to_replicate in refresh")
                 logger.info("Finishied replication")
             except Exception as e:
                 logger.error("Thrown Exception %s in republish under replicated data", str(e))
@@ -497,6 +1078,32 @@ class Server:
 
 @rpyc.service
 class ServerService(Service):
+    # answered from local state without calling other peers, they never wait
+    # for a worker, so a node whose workers are all blocked on crawls still
+    # answers the pings and lookups of its peers
+    unlimited = frozenset(
+        {
+            "rpc_ping",
+            "rpc_find_node",
+            "rpc_find_value",
+            "rpc_find_chunk_location",
+            "rpc_contains",
+            "rpc_check_if_new_value_exists",
+            "get_data_port",
+        }
+    )
+
+    def _rpyc_getattr(self, name: str):
+        """
+        Resolve the exposed methods for rpyc, passing them through the
+        request limiter of the server, but for the unlimited ones.
+        """
+        name = name.removeprefix("exposed_")
+        method = getattr(self, "exposed_" + name)
+        if Server.limiter is None or name in ServerService.unlimited:
+            return method
+        return Server.limiter.wrap(method)
+
     #
     # RPC accessed by clients
     #
@@ -504,42 +1111,31 @@ class ServerService(Service):
     def rpc_get_file_chunk_value(self, key):
         return Server.storage.get(key, metadata=False)
 
+    @rpyc.exposed
+    def get_data_port(self):
+        """
+        Port of the data plane serving the chunks of this node, if any.
+        """
+        if Server.data_plane is None:
+            return None
+        return Server.data_plane.port
+
     @rpyc.exposed
     def get(self, key):
         """
-        Get a key if the network has it.
+        Get the manifest of a key if the network has it.
 
         Returns:
-            :class:`None` if not found, the value otherwise.
+            :class:`None` if not found, the encoded manifest otherwise.
         """
 
         logger.debug(f"Looking up key {key}")
 
         dkey = digest(key)
-
-        node = Node(dkey)
-        nearest = FileSystemProtocol.router.find_neighbors(node)
-        if not nearest or len(nearest) == 0:
-            logger.debug(f"There are no known neighbors to get key {dkey}")
-            if Server.storage.contains(dkey):
-                logger.debug("Getting key from this same node")
-                data = Server.storage.get(dkey, True)
-                if data is None:
-                    return None
-                return pickle.loads(data)
-            return None
-        spider = ValueSpiderCrawl(node, nearest, Server.ksize, Server.alpha)
-        data = spider.find()
-        if data is None:
-            logger.debug("NONE DATA")
+        manifest = Server.single_flight.do("get", dkey, Server.find_metadata, dkey)
+        if manifest is None:
             return None
-        logger.debug(f"DATA {data}")
-        try:
-            metadata_list = pickle.loads(data)
-        except pickle.UnpicklingError as e:
-            logger.error(f"exception when returning metadata_list {e}")
-            return None
-        return metadata_list
+        return manifest.encode()
 
     @rpyc.exposed
     def delete(self, key, is_metadata=True):
@@ -550,18 +1146,24 @@ class ServerService(Service):
         ) and Server.delete_data_from_network(key, is_metadata)
 
     @rpyc.exposed
-    def upload_file(self, key_name: str, key: str, data: bytes) -> bool:
-        chunks = Server.split_data(data, 500)
+    def upload_file(
+        self, key_name: str, key: str, data: bytes, storage_class="replicated"
+    ) -> bool:
+        if storage_class == "erasure":
+            return Server.store_erasure_coded(key_name, key, data)
+
+        chunks = Server.split_data(data, Server.config.chunk_size)
+        if sum(map(len, chunks)) <= Server.config.inline_threshold:
+            return Server.store_inline(key_name, key, b"".join(chunks))
         logger.debug(f"chunks {len(chunks)}, {chunks}")
-        digested_chunks = [digest(c) for c in chunks]
-        metadata_list = pickle.dumps(digested_chunks)
+        manifest = Manifest.for_chunks(chunks, Server.config.chunk_size)
         processed_chunks = list((digest(c), c) for c in chunks)
 
-        chunks_responses = []
-        for c in processed_chunks:
-            chunks_responses.append(Server.set_digest(c[0], c[1], metadata=False))
+        stored = Server.set_digest_many(
+            [(dkey, c, False, None, "NOT DEFINED") for dkey, c in processed_chunks]
+        )
 
-        if not all(chunks_responses):
+        if any(dkey not in stored for dkey, _ in processed_chunks):
             logger.info("Failed to set chunks, rolling back changes")
             responses = []
             for c in processed_chunks:
@@ -575,9 +1177,11 @@ class ServerService(Service):
 
         dkey = digest(key)
 
-        set_metadata_response = Server.set_digest(
-            dkey, metadata_list, key_name=key_name
-        )
+        try:
+            set_metadata_response = Server.publish_manifest(dkey, manifest, key_name)
+        except ValueError as e:
+            logger.warning(f"Metadata of {key_name} can not be stored, {e}")
+            set_metadata_response = False
 
         if not set_metadata_response:
             logger.warning("Failed set_digest of metadata, rolling back changes")
@@ -610,6 +1214,160 @@ class ServerService(Service):
         logger.info("File uploaded successfully")
         return True
 
+    @rpyc.exposed
+    def read_erasure_group(self, parity_shards: int, group: tuple):
+        return Server.read_erasure_group(parity_shards, group)
+
+    @rpyc.exposed
+    def overwrite_file(self, key_name: str, key: str, data: bytes) -> bool:
+        """
+        Replace the file stored with key, storing only the chunks that are not
+        part of the current version. The new metadata is published with a
+        newer last_write so it replaces the old one in every replica.
+        """
+        chunks = Server.split_data(data, Server.config.chunk_size)
+        if sum(map(len, chunks)) <= Server.config.inline_threshold:
+            return Server.store_inline(
+                key_name, key, b"".join(chunks), Server.next_last_write(digest(key))
+            )
+        manifest = Manifest.for_chunks(chunks, Server.config.chunk_size)
+        digests = manifest.digests()
+        previous = Server.find_metadata(digest(key))
+        reusable = set()
+        if previous is not None and previous.codec == CODEC_PLAIN:
+            reusable = set(previous.digests()) & set(digests)
+
+        session = Server.upload_sessions.begin(
+            key_name, key, digests, map(len, chunks), manifest.file_hash
+        )
+        session.mark_present(Server.probe_chunks(reusable))
+        missing = session.missing_parts()
+        logger.info(f"overwrite of {key_name} stores {len(missing)} of {len(chunks)} chunks")
+
+        for index in missing:
+            if not self.upload_part(session.id, index, chunks[index]):
+                logger.warning("Failed to store chunk in overwrite, rolling back changes")
+                self.abort_upload(session.id)
+                return False
+
+        if not self.commit_upload(session.id):
+            self.abort_upload(session.id)
+            return False
+        return True
+
+    @rpyc.exposed
+    def begin_upload(
+        self, key_name: str, key: str, digests, lengths, file_hash=None
+    ) -> tuple:
+        """
+        Open a resumable upload of a file split in chunks with the given digests
+        and lengths, file_hash is the digest of the whole file if known.
+
+        Returns:
+            The session id and the indexes of the parts that must be sent,
+            chunks already stored in the network are skipped.
+        """
+        if len(digests) != len(lengths):
+            raise ValueError("every part needs a digest and a length")
+        session = Server.upload_sessions.begin(
+            key_name, key, digests, lengths, file_hash
+        )
+        session.mark_present(Server.probe_chunks(session.digests))
+        missing = session.missing_parts()
+        logger.info(
+            f"upload session {session.id} needs {len(missing)} of {len(session.digests)} parts"
+        )
+        return session.id, tuple(missing)
+
+    @rpyc.exposed
+    def upload_status(self, session_id: str):
+        """
+        Get the indexes of the parts still missing in the session, or None if
+        the session does not exist or expired.
+        """
+        session = Server.upload_sessions.get(session_id)
+        if session is None:
+            return None
+        return tuple(session.missing_parts())
+
+    @rpyc.exposed
+    def upload_part(self, session_id: str, index: int, data: bytes) -> bool:
+        session = Server.upload_sessions.get(session_id)
+        if session is None:
+            logger.warning(f"upload_part to unknown session {session_id}")
+            return False
+        if not 0 <= index < len(session.digests):
+            return False
+
+        dkey = session.digests[index]
+        if len(data) != session.lengths[index] or digest(data) != dkey:
+            logger.warning(f"part {index} of session {session_id} is corrupted")
+            return False
+        if dkey in session.present or dkey in session.stored:
+            return True
+
+        with session.lock:
+            if not Server.set_digest(dkey, data, metadata=False):
+                return False
+            session.mark_stored(dkey)
+
+        if not Server.confirm_integrity_of_data(dkey, False):
+            logger.warning(f"It was not possible to confirm integrity of part {index}")
+        return True
+
+    @rpyc.exposed
+    def commit_upload(self, session_id: str) -> bool:
+        """
+        Publish the metadata of the file once every part is stored. Nothing is
+        visible to readers until this call succeeds.
+        """
+        session = Server.upload_sessions.get(session_id)
+        if session is None:
+            logger.warning(f"commit of unknown session {session_id}")
+            return False
+
+        with session.lock:
+            missing = session.missing_parts()
+            if missing:
+                logger.warning(f"commit of session {session_id} missing parts {missing}")
+                return False
+
+            dkey = digest(session.key)
+            try:
+                published = Server.publish_manifest(
+                    dkey,
+                    session.manifest(),
+                    session.key_name,
+                    Server.next_last_write(dkey),
+                )
+            except ValueError as e:
+                # retrying the commit can not help, the parts are removed
+                logger.warning(f"Metadata of session {session_id} can not be stored, {e}")
+                self.abort_upload(session_id)
+                return False
+            if not published:
+                logger.warning("Failed set_digest of metadata in commit")
+                return False
+            if not Server.confirm_integrity_of_data(dkey, True):
+                logger.warning("It was not possible to confirm integrity of metadata")
+
+            Server.upload_sessions.finish(session_id)
+        logger.info(f"upload session {session_id} committed")
+        return True
+
+    @rpyc.exposed
+    def abort_upload(self, session_id: str) -> bool:
+        session = Server.upload_sessions.finish(session_id)
+        if session is None:
+            return False
+        responses = [
+            Server.delete_data_from_network(key=dkey, is_metadata=False)
+            for dkey in session.stored
+        ]
+        if not all(responses):
+            logger.warning("Rolling back changes of aborted upload was not completed")
+        return True
+
     @rpyc.exposed
     def get_all_file_names(self):
         logging.info("Getting all file names")
@@ -625,9 +1383,7 @@ class ServerService(Service):
     @rpyc.exposed
     def get_file_chunk_location(self, chunk_key):
         logger.info("looking file chunk location")
-        node = Node(chunk_key)
-        nearest = FileSystemProtocol.router.find_neighbors(node)
-        if not nearest:
+        if not FileSystemProtocol.router.find_neighbors(Node(chunk_key)):
             logger.info(
                 f"There are no known neighbors to get file chunk location {chunk_key}"
             )
@@ -638,9 +1394,7 @@ class ServerService(Service):
                 return [(Server.node.ip, Server.node.port)]
             return None
 
-        logger.info("Initiating ChunkLocationSpiderCrawl")
-        spider = ChunkLocationSpiderCrawl(node, nearest, Server.ksize, Server.alpha)
-        results = spider.find()
+        results = Server.find_chunk_locations(chunk_key)
         logger.info(f"results of ChunkLocationSpider {results}")
         return results
 
@@ -650,17 +1404,35 @@ class ServerService(Service):
     ):
         logger.debug("entry in rpc_find_chunk_location")
 
-        source = Node(nodeid, sender[0], sender[1])
-        # if a new node is sending the request, give all data it should contain
-        address = (source.ip, source.port)
-        with ServerSession(address[0], address[1]) as conn:
-            FileSystemProtocol.wellcome_if_new(conn, source)
+        source = peer_node(nodeid, sender[0], sender[1])
+        # new contacts are welcomed in the background
+        FileSystemProtocol.record_contact(source)
         # get value from storage
         if Server.storage.contains(key, False):
             logger.critical("find node contains 1")
-            return {"value": (Server.node.ip, Server.node.port)}
+            return wire.encode_location(Server.node.ip, Server.node.port)
         return self.rpc_find_node(sender, nodeid, key)
 
+    @rpyc.exposed
+    def get_coalescing_metrics(self):
+        """
+        Requests, crawls run and ratio of coalesced requests of get and
+        get_file_chunk_location, as (operation, requests, executions,
+        coalesced, ratio) tuples.
+        """
+        return tuple(
+            (op, m["requests"], m["executions"], m["coalesced"], m["ratio"])
+            for op, m in Server.single_flight.metrics().items()
+        )
+
+    @rpyc.exposed
+    def get_lookup_cache_metrics(self):
+        """
+        Entries, hits and misses of the lookup cache.
+        """
+        cache = Server.lookup_cache
+        return (len(cache), cache.hits, cache.misses)
+
     @rpyc.exposed
     def find_neighbors(self):
         nearest = FileSystemProtocol.router.find_neighbors(
@@ -682,15 +1454,12 @@ class ServerService(Service):
         metadata=True,
         key_name="NOT DEFINED",
         local_last_write=None,
+        storage_class="replicated",
     ):
         logger.debug("Entry in rpc_store")
-        source = Node(nodeid, sender[0], sender[1])
-        # if a new node is sending the request, give all data it should contain
-
-        address = (source.ip, source.port)
-        with ServerSession(address[0], address[1]) as conn:
-            # logger.info(f"wellcome_If_new in rpc_store {address}")
-            FileSystemProtocol.wellcome_if_new(conn, source)
+        source = peer_node(nodeid, sender[0], sender[1])
+        # new contacts are welcomed in the background
+        FileSystemProtocol.record_contact(source)
 
         logger.debug(
             f"got a store request from %s, storing '%s'='%s' {sender}, {key}, {value}"
@@ -702,24 +1471,77 @@ class ServerService(Service):
                 value,
                 republish_data=False,
                 key_name=key_name,
-                last_write=local_last_write,
+                last_write=from_timestamp(local_last_write),
             )
         else:
             Server.storage.set_value(
-                key, value, metadata=False, last_write=local_last_write
+                key,
+                value,
+                metadata=False,
+                last_write=from_timestamp(local_last_write),
+                storage_class=storage_class,
             )
         return True
 
+    @rpyc.exposed
+    def rpc_check_many(self, sender, nodeid: bytes, entries: bytes):
+        """
+        Tell which of the (key, last_write, is_metadata) entries this node
+        needs, last_write given as a timestamp. Entries and result are
+        encoded with :mod:`~kade_drive.core.wire`.
+        """
+        source = peer_node(nodeid, sender[0], sender[1])
+        # new contacts are welcomed in the background
+        FileSystemProtocol.record_contact(source)
+
+        result = []
+        for key, last_write, is_metadata in wire.decode_check_entries(entries):
+            contains, date = Server.storage.check_if_new_value_exists(key, is_metadata)
+            result.append(
+                it_is_necessary_to_write(from_timestamp(last_write), contains, date)
+            )
+        return wire.encode_flags(result)
+
+    @rpyc.exposed
+    def rpc_store_many(self, sender, nodeid: bytes, entries: bytes, confirm=False):
+        """
+        Store the (key, value, last_write, is_metadata, key_name,
+        storage_class) entries, confirming their integrity right away if
+        confirm. Entries and result are encoded with
+        :mod:`~kade_drive.core.wire`.
+        """
+        source = peer_node(nodeid, sender[0], sender[1])
+        # new contacts are welcomed in the background
+        FileSystemProtocol.record_contact(source)
+
+        entries = wire.decode_store_entries(entries)
+        logger.debug(f"got a store request of {len(entries)} keys from {sender}")
+        result = []
+        for key, value, last_write, is_metadata, key_name, storage_class in entries:
+            try:
+                Server._store_locally(
+                    key,
+                    value,
+                    is_metadata,
+                    from_timestamp(last_write),
+                    key_name,
+                    storage_class,
+                )
+                if confirm:
+                    Server.storage.confirm_integrity(key, is_metadata)
+                result.append(True)
+            except Exception as e:
+                logger.error(f"Error when storing {key} in rpc_store_many, {e}")
+                result.append(False)
+        return wire.encode_flags(result)
+
     @rpyc.exposed
     def rpc_find_value(
         self, sender: tuple[str, str], nodeid: bytes, key: bytes, metadata=True
     ):
-        source = Node(nodeid, sender[0], sender[1])
-        # if a new node is sending the request, give all data it should contain
-        address = (source.ip, source.port)
-        with ServerSession(address[0], address[1]) as conn:
-            # logger.info(f"wellcome_If_new in find_value {address}")
-            FileSystemProtocol.wellcome_if_new(conn, source)
+        source = peer_node(nodeid, sender[0], sender[1])
+        # new contacts are welcomed in the background
+        FileSystemProtocol.record_contact(source)
         # get value from storage
         if not FileSystemProtocol.storage.contains(key, metadata):
             logger.debug(f"Value with key {key} not found, calling rpc_find_node")
@@ -729,7 +1551,9 @@ class ServerService(Service):
 
         value = FileSystemProtocol.storage.get(key, metadata=metadata)
         logger.debug(f"returning value {value}")
-        return {"value": value}
+        if value is None:
+            return self.rpc_find_node(sender, nodeid, key)
+        return wire.encode_value(value)
 
     @rpyc.exposed
     def rpc_ping(self, sender, nodeid: bytes, remote_id):
@@ -743,12 +1567,9 @@ class ServerService(Service):
             bytes: node id if alive, None if not
         """
         logger.debug(f"rpc ping called from {nodeid}, {sender[0]}, {sender[1]}")
-        source = Node(nodeid, sender[0], sender[1])
-        # if a new node is sending the request, give all data it should contain
-        address = (source.ip, source.port)
-        with ServerSession(address[0], address[1]) as conn:
-            logger.info(f"wellcome_If_new in ping {address}")
-            FileSystemProtocol.wellcome_if_new(conn, source)
+        source = peer_node(nodeid, sender[0], sender[1])
+        # new contacts are welcomed in the background
+        FileSystemProtocol.record_contact(source)
         logger.debug("return ping")
         if remote_id is not None and remote_id != FileSystemProtocol.source_node.id:
             return None
@@ -758,14 +1579,11 @@ class ServerService(Service):
     def rpc_find_node(self, sender, nodeid: bytes, key: bytes):
         logger.debug(f"finding neighbors of {int(nodeid.hex(), 16)} in local table")
 
-        source = Node(nodeid, sender[0], sender[1])
+        source = peer_node(nodeid, sender[0], sender[1])
 
         logger.debug(f"node id {nodeid}")
-        # if a new node is sending the request, give all data it should contain
-        address = (source.ip, source.port)
-        with ServerSession(address[0], address[1]) as conn:
-            # logger.info(f"wellcome_If_new in find_node {address}")
-            FileSystemProtocol.wellcome_if_new(conn, source)
+        # new contacts are welcomed in the background
+        FileSystemProtocol.record_contact(source)
         # create a fictional node to perform the search
         logger.debug(f"fictional key {key}")
         logger.debug(f"SEnder [0] Sender [1] {source.ip}, {source.port}")
@@ -773,69 +1591,60 @@ class ServerService(Service):
         # ask for the neighbors of the node
         neighbors = FileSystemProtocol.router.find_neighbors(node, exclude=source)
         logger.debug(f"neighbors of find_node: { neighbors}")
-        return list(map(tuple, neighbors))
+        return wire.encode_nodes(neighbors)
 
     @rpyc.exposed
     def rpc_contains(self, sender, nodeid: bytes, key: bytes, is_metadata=True):
-        source = Node(nodeid, sender[0], sender[1])
-        # if a new node is sending the request, givemsg all data it should contain
-        address = (source.ip, source.port)
-        with ServerSession(address[0], address[1]) as conn:
-            # logger.info(f"wellcome_If_new in contains {address}")
-            FileSystemProtocol.wellcome_if_new(conn, source)
+        source = peer_node(nodeid, sender[0], sender[1])
+        # new contacts are welcomed in the background
+        FileSystemProtocol.record_contact(source)
         # get value from storage
-        return {"value": FileSystemProtocol.storage.contains(key, is_metadata)}
+        return (FileSystemProtocol.storage.contains(key, is_metadata),)
 
     @rpyc.exposed
     def rpc_check_if_new_value_exists(
         self, sender, nodeid: bytes, key: bytes, is_metadata=True
     ):
-        source = Node(nodeid, sender[0], sender[1])
-        # if a new node is sending the request, give all data it should contain
-        address = (source.ip, source.port)
-        with ServerSession(address[0], address[1]) as conn:
-            # logger.info(f"wellcome_If_new in check_if_new_value {address}")
-            FileSystemProtocol.wellcome_if_new(conn, source)
+        source = peer_node(nodeid, sender[0], sender[1])
+        # new contacts are welcomed in the background
+        FileSystemProtocol.record_contact(source)
         # get value from storage
-        return FileSystemProtocol.storage.check_if_new_value_exists(key, is_metadata)
+        contains, date = FileSystemProtocol.storage.check_if_new_value_exists(
+            key, is_metadata
+        )
+        return wire.encode_check_result(contains, to_timestamp(date))
 
     @rpyc.exposed
     def rpc_delete(self, sender, node_id: bytes, key: bytes, is_metadata: bool):
-        source = Node(node_id, sender[0], sender[1])
-        address = (source.ip, source.port)
-        with ServerSession(address[0], address[1]) as conn:
-            # logger.info(f"wellcome_If_new in rpc_delete {address}")
-            FileSystemProtocol.wellcome_if_new(conn, source)
+        source = peer_node(node_id, sender[0], sender[1])
+        # new contacts are welcomed in the background
+        FileSystemProtocol.record_contact(source)
 
-        return {"value": FileSystemProtocol.storage.delete(key, is_metadata)}
+        return (FileSystemProtocol.storage.delete(key, is_metadata),)
 
     @rpyc.exposed
     def rpc_confirm_integrity(
         self, sender, node_id: bytes, key: bytes, is_metadata: bool
     ):
-        source = Node(node_id, sender[0], sender[1])
-        address = (source.ip, source.port)
-        with ServerSession(address[0], address[1]) as conn:
-            # logger.info(f"wellcome_If_new in rpc_confirm_integrity {address}")
-            FileSystemProtocol.wellcome_if_new(conn, source)
+        source = peer_node(node_id, sender[0], sender[1])
+        # new contacts are welcomed in the background
+        FileSystemProtocol.record_contact(source)
 
         try:
             logging.info(f"Trying to confirm integrity with key {key}")
             FileSystemProtocol.storage.confirm_integrity(key, is_metadata)
-            return {"value": True}
+            return (True,)
         except Exception as e:
             logger.error(f"Error when doing rpc_confirm_integrity, {e}")
-            return {"value": False}
+            return (False,)
 
     @rpyc.exposed
     def rpc_get_metadata_list(self, sender, node_id: bytes):
-        source = Node(node_id, sender[0], sender[1])
-        address = (source.ip, source.port)
-        with ServerSession(address[0], address[1]) as conn:
-            # logger.info(f"wellcome_If_new in rpc_confirm_integrity {address}")
-            FileSystemProtocol.wellcome_if_new(conn, source)
+        source = peer_node(node_id, sender[0], sender[1])
+        # new contacts are welcomed in the background
+        FileSystemProtocol.record_contact(source)
 
-        return {"value": Server.storage.get_all_metadata_keys()}
+        return (frozenset(Server.storage.get_all_metadata_keys()),)
 
     @rpyc.exposed
     def set_key(self, key, value, apply_hash_to_key=True):
@@ -848,6 +1657,9 @@ class ServerService(Service):
             raise TypeError(
                 f"Value must be of type int, float, bool, str, or bytes, received {value}"
             )
+        # values travel between nodes as bytes, see core.wire
+        if not isinstance(value, bytes):
+            value = pickle.dumps(value)
         if apply_hash_to_key:
             key = digest(key)
         return Server.set_digest(key, value)
@@ -1,13 +1,23 @@
+import bisect
+import functools
 import heapq
 
+# peers whose Node is shared by peer_node
+PEER_CACHE_SIZE = 4096
+
+
 class Node:
     """
     Simple object to encapsulate the concept of a Node (minimally an ID, but
     also possibly an IP and port if this represents a node on the network).
     This class should generally not be instantiated directly, as it is a low
     level construct mostly used by the router.
+
+    Nodes are equal, and hash, by id.
     """
 
+    __slots__ = ("id", "ip", "port", "long_id")
+
     def __init__(self, node_id: bytes, ip: str | None = None, port: str | None = None):
         """
         Create a Node instance.
@@ -20,7 +30,7 @@ class Node:
         self.id = node_id  # pylint: disable=invalid-name
         self.ip = ip  # pylint: disable=invalid-name
         self.port = port
-        self.long_id = int(node_id.hex(), 16)
+        self.long_id = int.from_bytes(node_id, "big")
 
     def same_home_as(self, node: "Node"):
         return self.ip == node.ip and self.port == node.port
@@ -35,7 +45,7 @@ class Node:
         """
         Enables use of Node as a tuple - i.e., tuple(node) works.
         """
-        return iter([self.id, self.ip, self.port])
+        return iter((self.id, self.ip, self.port))
 
     def __repr__(self):
         return repr([self.long_id, self.ip, self.port])
@@ -44,13 +54,32 @@ class Node:
         return "%s:%s" % (self.ip, str(self.port))
 
     def __hash__(self) -> int:
-        if self.ip:
-            return hash(self.ip)
-        return self.long_id
+        return hash(self.id)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Node):
+            return NotImplemented
+        return self.id == other.id
+
+
+@functools.lru_cache(maxsize=PEER_CACHE_SIZE)
+def peer_node(node_id: bytes, ip: str, port) -> Node:
+    """
+    The Node of a peer, shared by the calls with the same id and address
+    instead of building a new one for every message. The Node must not be
+    modified.
+    """
+    return Node(node_id, ip, port)
+
 
 class NodeHeap:
     """
     A heap of nodes ordered by distance to a given node.
+
+    Nodes are indexed by id, removed nodes stay in the heap as stale entries
+    that are skipped and compacted away once they outnumber the live ones.
+    The sorted view of the maxsize closest nodes is computed on first access,
+    kept up to date by pushes and dropped when one of its nodes is removed.
     """
 
     def __init__(self, node: Node, maxsize: int):
@@ -61,10 +90,21 @@ class NodeHeap:
         @param maxsize: The maximum size that this heap can grow to.
         """
         self.node = node
-        self.heap: list[tuple[int, Node]] = []
+        # (distance, sequence, node), the sequence breaks ties between a
+        # stale entry and the live one of a node pushed again
+        self.heap: list[tuple[int, int, Node]] = []
+        # id -> sequence of the live entry of every node in the heap
+        self._live: dict[bytes, int] = {}
+        self._nodes: dict[bytes, Node] = {}
+        self._sequence = 0
+        # sorted entries of the maxsize closest nodes, None until computed
+        self._top: list[tuple[int, int, Node]] | None = None
         self.contacted = set()
         self.maxsize = maxsize
 
+    def _is_live(self, entry: tuple[int, int, Node]) -> bool:
+        return self._live.get(entry[2].id) == entry[1]
+
     def remove(self, peers):
         """
         Remove a list of peer ids from this heap.  Note that while this
@@ -73,20 +113,21 @@ class NodeHeap:
         removal of nodes may not change the visible size as previously added
         nodes suddenly become visible.
         """
-        peers = set(peers)
-        if not peers:
+        removed = set()
+        for peer_id in peers:
+            if self._live.pop(peer_id, None) is not None:
+                del self._nodes[peer_id]
+                removed.add(peer_id)
+        if not removed:
             return
-        new_heap: list[tuple[int, Node]] = []
-        for distance, node in self.heap:
-            if node.id not in peers:
-                heapq.heappush(new_heap, (distance, node))
-        self.heap = new_heap
+        if self._top is not None and any(e[2].id in removed for e in self._top):
+            self._top = None
+        if len(self.heap) > 2 * len(self._live) + 16:
+            self.heap = [entry for entry in self.heap if self._is_live(entry)]
+            heapq.heapify(self.heap)
 
     def get_node(self, node_id: bytes):
-        for _, node in self.heap:
-            if node.id == node_id:
-                return node
-        return None
+        return self._nodes.get(node_id)
 
     def have_contacted_all(self):
         return len(self.get_uncontacted()) == 0
@@ -98,7 +139,15 @@ class NodeHeap:
         self.contacted.add(node.id)
 
     def popleft(self):
-        return heapq.heappop(self.heap)[1] if self else None
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if self._is_live(entry):
+                node = entry[2]
+                del self._live[node.id]
+                del self._nodes[node.id]
+                self._top = None
+                return node
+        return None
 
     def push(self, nodes):
         """
@@ -110,22 +159,36 @@ class NodeHeap:
             nodes = [nodes]
 
         for node in nodes:
-            if node not in self:
+            if node.id not in self._live:
                 distance = self.node.distance_to(node)
-                heapq.heappush(self.heap, (distance, node))
+                self._sequence += 1
+                self._live[node.id] = self._sequence
+                self._nodes[node.id] = node
+                entry = (distance, self._sequence, node)
+                heapq.heappush(self.heap, entry)
+                self._add_to_top(entry)
+
+    def _add_to_top(self, entry: tuple[int, int, Node]):
+        if self._top is None:
+            return
+        if len(self._top) < self.maxsize or entry < self._top[-1]:
+            bisect.insort(self._top, entry)
+            del self._top[self.maxsize :]
+
+    def _closest(self) -> list[Node]:
+        if self._top is None:
+            live = (entry for entry in self.heap if self._is_live(entry))
+            self._top = heapq.nsmallest(self.maxsize, live)
+        return [entry[2] for entry in self._top]
 
     def __len__(self):
-        return min(len(self.heap), self.maxsize)
+        return min(len(self._live), self.maxsize)
 
     def __iter__(self):
-        nodes = heapq.nsmallest(self.maxsize, self.heap)
-        yield from (item[1] for item in nodes)
+        yield from self._closest()
 
     def __contains__(self, node: Node):
-        for _, other in self.heap:
-            if node.id == other.id:
-                return True
-        return False
+        return node.id in self._live
 
     def get_uncontacted(self):
-        return [n for n in self if n.id not in self.contacted]
+        return [n for n in self._closest() if n.id not in self.contacted]
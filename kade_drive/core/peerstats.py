@@ -0,0 +1,170 @@
+"""
+Round trip times, error rates and load of the peers.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# round trip times kept per peer for the percentiles
+SAMPLES = 64
+
+
+def _address(ip, port) -> tuple[str, int]:
+    return str(ip), int(port)
+
+
+class _Peer:
+    __slots__ = ("rtt", "rtt_var", "error_rate", "in_flight", "samples", "last_seen")
+
+    def __init__(self):
+        self.rtt: float | None = None
+        self.rtt_var = 0.0
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.samples: deque[float] = deque(maxlen=SAMPLES)
+        # wall clock time of the last answer
+        self.last_seen: float | None = None
+
+
+class PeerStats:
+    """
+    Per peer exponentially weighted moving averages of the round trip time,
+    its deviation and the error rate, plus the requests in flight, updated
+    by :meth:`track` around every call.
+
+    :meth:`score` is the expected cost of asking a peer, lower is better, it
+    orders replica reads and breaks ties between peers equally distant to a
+    key. :meth:`timeout` is how long to wait for a peer before giving up,
+    derived from its round trip times like TCP's retransmission timeout.
+    """
+
+    def __init__(
+        self,
+        weight: float = 0.125,
+        default_rtt: float = 0.05,
+        min_timeout: float = 2,
+    ):
+        self.weight = weight
+        self.default_rtt = default_rtt
+        self.min_timeout = min_timeout
+        self._peers: dict[tuple[str, int], _Peer] = {}
+        self._lock = threading.Lock()
+
+    def _peer(self, ip, port) -> _Peer:
+        address = _address(ip, port)
+        peer = self._peers.get(address)
+        if peer is None:
+            peer = self._peers[address] = _Peer()
+        return peer
+
+    @contextmanager
+    def track(self, ip, port):
+        """
+        Count a call to the peer as in flight while the block runs, then
+        record its duration and whether it raised.
+        """
+        started = self.begin(ip, port)
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.end(ip, port, started, ok)
+
+    def begin(self, ip, port) -> float:
+        """
+        Count a call to the peer as in flight, returns the time it started.
+        """
+        with self._lock:
+            self._peer(ip, port).in_flight += 1
+        return time.monotonic()
+
+    def end(self, ip, port, started: float, ok: bool):
+        with self._lock:
+            self._peer(ip, port).in_flight -= 1
+        self.record(ip, port, time.monotonic() - started, ok)
+
+    def record(self, ip, port, rtt: float, ok: bool):
+        """
+        Record a call that took rtt seconds. The duration of failed calls is
+        the timeout rather than the peer's, they only count for the error
+        rate and back the timeout of the peer off.
+        """
+        with self._lock:
+            peer = self._peer(ip, port)
+            peer.error_rate += self.weight * ((0.0 if ok else 1.0) - peer.error_rate)
+            if not ok:
+                peer.rtt_var *= 2
+                return
+            peer.samples.append(rtt)
+            peer.last_seen = time.time()
+            if peer.rtt is None:
+                peer.rtt, peer.rtt_var = rtt, rtt / 2
+                return
+            peer.rtt_var += self.weight * (abs(rtt - peer.rtt) - peer.rtt_var)
+            peer.rtt += self.weight * (rtt - peer.rtt)
+
+    def seed(self, ip, port, rtt: float):
+        """
+        Start the averages of a peer without calls from a round trip time
+        measured before, such as in a previous run.
+        """
+        with self._lock:
+            peer = self._peer(ip, port)
+            if peer.rtt is None:
+                peer.rtt, peer.rtt_var = rtt, rtt / 2
+
+    def last_seen(self, ip, port) -> float | None:
+        """
+        Wall clock time of the last call the peer answered, None if none did.
+        """
+        peer = self._peers.get(_address(ip, port))
+        return None if peer is None else peer.last_seen
+
+    def rtt(self, ip, port) -> float:
+        peer = self._peers.get(_address(ip, port))
+        if peer is None or peer.rtt is None:
+            return self.default_rtt
+        return peer.rtt
+
+    def percentile(self, ip, port, fraction: float = 0.95) -> float:
+        """
+        Round trip time under which fraction of the last calls answered,
+        estimated from the average and deviation while there are few samples.
+        """
+        peer = self._peers.get(_address(ip, port))
+        if peer is None or peer.rtt is None:
+            return self.default_rtt
+        with self._lock:
+            samples = sorted(peer.samples)
+        if len(samples) < 10:
+            return peer.rtt + 2 * peer.rtt_var
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def score(self, ip, port) -> float:
+        """
+        Expected time to get an answer: the round trip time, scaled by the
+        calls already waiting on the peer and by the retries its errors cost.
+        """
+        peer = self._peers.get(_address(ip, port))
+        if peer is None:
+            return self.default_rtt
+        rtt = self.default_rtt if peer.rtt is None else peer.rtt
+        return rtt * (1 + peer.in_flight) / max(1 - peer.error_rate, 0.05)
+
+    def timeout(self, ip, port, maximum: float) -> float:
+        """
+        Round trip time plus four deviations, between min_timeout and maximum.
+        Peers without samples get the maximum.
+        """
+        peer = self._peers.get(_address(ip, port))
+        if peer is None or peer.rtt is None:
+            return maximum
+        return min(max(peer.rtt + 4 * peer.rtt_var, self.min_timeout), maximum)
+
+    def order(self, addresses: list) -> list:
+        """
+        Sort (ip, port) addresses from the best to the worst scored.
+        """
+        return sorted(addresses, key=lambda address: self.score(*address))
@@ -0,0 +1,217 @@
+"""
+Pool of reusable rpyc connections to the peers of the network.
+"""
+import threading
+import time
+import logging
+
+import rpyc
+from rpyc.core.async_ import AsyncResultTimeout
+
+logger = logging.getLogger(__name__)
+
+# errors that mean the connection itself is broken, not the remote call
+CONNECTION_ERRORS = (EOFError, OSError, AsyncResultTimeout)
+
+
+def rpyc_connect(ip: str, port: int) -> rpyc.Connection:
+    # the RPCs between nodes only exchange simple values, see core.wire
+    return rpyc.connect(
+        ip,
+        port=port,
+        config={"allow_pickle": False, "sync_request_timeout": None},
+    )
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of rpyc connections keyed by peer address.
+
+    A borrowed connection is used by a single thread until it is released.
+    Released connections are kept idle, at most max_idle_per_peer per peer,
+    and reused by the next borrower of the same peer after a ping if they
+    were idle for more than health_check_after seconds. No more than
+    max_connections are open at once, borrowers wait for a free slot up to
+    acquire_timeout seconds.
+    """
+
+    def __init__(
+        self,
+        max_idle_per_peer: int = 2,
+        max_connections: int = 128,
+        idle_timeout: float = 60,
+        health_check_after: float = 5,
+        acquire_timeout: float = 10,
+        connect=rpyc_connect,
+    ):
+        self.max_idle_per_peer = max_idle_per_peer
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.acquire_timeout = acquire_timeout
+        self._connect = connect
+        # address -> [(connection, last time it was released)], oldest first
+        self._idle: dict[tuple[str, int], list[tuple[rpyc.Connection, float]]] = {}
+        self._open = 0
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def address_of(ip, port) -> tuple[str, int]:
+        return str(ip), int(port)
+
+    @property
+    def open_connections(self) -> int:
+        return self._open
+
+    def idle_connections(self, ip=None, port=None) -> int:
+        with self._cond:
+            if ip is None:
+                return sum(map(len, self._idle.values()))
+            return len(self._idle.get(self.address_of(ip, port), []))
+
+    def acquire(self, ip, port) -> rpyc.Connection | None:
+        """
+        Borrow a connection to the peer, None if it could not be opened.
+        """
+        address = self.address_of(ip, port)
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            to_close = []
+            reused = None
+            with self._cond:
+                reused = self._pop_idle(address, to_close)
+                if reused is None:
+                    if self._open >= self.max_connections:
+                        oldest = self._pop_oldest_idle()
+                        if oldest is not None:
+                            to_close.append(oldest)
+                            self._open -= 1
+                    if self._open < self.max_connections:
+                        self._open += 1
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            logger.warning(f"connection pool exhausted for {address}")
+                            return None
+                        self._cond.wait(remaining)
+                        continue
+            for conn in to_close:
+                self._close(conn)
+
+            if reused is not None:
+                conn, released = reused
+                if self._is_healthy(conn, released):
+                    return conn
+                self.discard(conn)
+                continue
+
+            try:
+                return self._connect(*address)
+            except CONNECTION_ERRORS as e:
+                logger.warning(f"Failed to connect to {address}, {e}")
+                self._forget()
+                return None
+
+    def release(self, conn: rpyc.Connection, ip, port, healthy=True):
+        """
+        Give back a borrowed connection. Unhealthy connections are closed
+        along with the idle ones of the same peer.
+        """
+        address = self.address_of(ip, port)
+        if not healthy or conn.closed:
+            self.discard(conn)
+            if not healthy:
+                self.evict(ip, port)
+            return
+        with self._cond:
+            idle = self._idle.setdefault(address, [])
+            if len(idle) < self.max_idle_per_peer:
+                idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        self.discard(conn)
+
+    def discard(self, conn: rpyc.Connection):
+        self._close(conn)
+        self._forget()
+
+    def evict(self, ip, port):
+        """
+        Close the idle connections to a peer.
+        """
+        with self._cond:
+            idle = self._idle.pop(self.address_of(ip, port), [])
+        for conn, _ in idle:
+            self.discard(conn)
+
+    def sweep(self):
+        """
+        Close the connections idle for more than idle_timeout seconds.
+        """
+        to_close = []
+        limit = time.monotonic() - self.idle_timeout
+        with self._cond:
+            for address, idle in list(self._idle.items()):
+                to_close.extend(conn for conn, released in idle if released < limit)
+                idle[:] = [(c, r) for c, r in idle if r >= limit]
+                if not idle:
+                    del self._idle[address]
+        for conn in to_close:
+            self.discard(conn)
+
+    def close_all(self):
+        with self._cond:
+            idle = [conn for conns in self._idle.values() for conn, _ in conns]
+            self._idle.clear()
+        for conn in idle:
+            self.discard(conn)
+
+    def _pop_idle(self, address, to_close: list):
+        """
+        Pop the most recently released connection to address, connections
+        idle for too long are moved to to_close. Must hold the lock.
+        """
+        idle = self._idle.get(address)
+        limit = time.monotonic() - self.idle_timeout
+        while idle:
+            conn, released = idle.pop()
+            if released >= limit:
+                return conn, released
+            to_close.append(conn)
+            self._open -= 1
+        return None
+
+    def _pop_oldest_idle(self):
+        """
+        Pop the least recently released idle connection. Must hold the lock.
+        """
+        oldest = None
+        for address, idle in self._idle.items():
+            if idle and (oldest is None or idle[0][1] < self._idle[oldest][0][1]):
+                oldest = address
+        if oldest is None:
+            return None
+        return self._idle[oldest].pop(0)[0]
+
+    def _is_healthy(self, conn: rpyc.Connection, released: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - released < self.health_check_after:
+            return True
+        try:
+            conn.ping(timeout=self.acquire_timeout)
+            return True
+        except Exception:  # pylint: disable=broad-except
+            return False
+
+    def _forget(self):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:  # pylint: disable=broad-except
+            pass
@@ -1,10 +1,17 @@
+import functools
 import random
 import logging
-import rpyc
+import threading
+import time
 
+from kade_drive.core import wire
+from kade_drive.core.cache import LookupCache
+from kade_drive.core.peerstats import PeerStats
 from kade_drive.core.node import Node
+from kade_drive.core.pool import ConnectionPool, CONNECTION_ERRORS
 from kade_drive.core.storage import logger, PersistentStorage
-from kade_drive.core.utils import digest, it_is_necessary_to_write
+from kade_drive.core.transport import is_busy
+from kade_drive.core.utils import digest, from_timestamp, to_timestamp
 
 
 # Create a file handler
@@ -14,6 +21,116 @@ formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 # logger.addHandler(file_handler)
 
+STORE_BATCH_BYTES = 4 * 1024 * 1024
+
+
+def busy_is_no_answer(call):
+    """
+    A busy peer is alive but did not run the call: answer None, like a peer
+    that did not respond, without removing it from the routing table.
+    """
+
+    @functools.wraps(call)
+    def wrapper(conn, node_to_ask, *args, **kwargs):
+        try:
+            return call(conn, node_to_ask, *args, **kwargs)
+        except Exception as e:  # pylint: disable=broad-except
+            if not is_busy(e):
+                raise
+            logger.info(f"{node_to_ask} is busy, {e}")
+            return None
+
+    return wrapper
+
+
+def value_reply(reply):
+    """
+    The {"value": v} answer the crawlers expect from the (v,) tuple answered
+    by the value RPCs, which travels by value and without pickle.
+    """
+    return None if reply is None else {"value": reply[0]}
+
+
+class WelcomeQueue:
+    """
+    Deduplicated, rate limited queue of the contacts to welcome in the
+    background. A node is queued once while pending and is not queued again
+    until cooldown seconds after it was welcomed, the worker welcomes at most
+    rate nodes per second.
+    """
+
+    def __init__(self, welcome, rate: float = 5, cooldown: float = 60, max_pending=1024):
+        self.welcome = welcome
+        self.rate = rate
+        self.cooldown = cooldown
+        self.max_pending = max_pending
+        self._pending: dict[bytes, Node] = {}
+        # node id -> time it was welcomed
+        self._welcomed: dict[bytes, float] = {}
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, node: Node) -> bool:
+        """
+        Queue the node unless it is pending or was welcomed recently.
+        """
+        now = time.monotonic()
+        with self._cond:
+            if node.id in self._pending:
+                return False
+            if now - self._welcomed.get(node.id, -self.cooldown) < self.cooldown:
+                return False
+            if len(self._pending) >= self.max_pending:
+                logger.warning(f"welcome queue full, dropping {node}")
+                return False
+            self._pending[node.id] = node
+            self._cond.notify()
+            return True
+
+    def pop(self, timeout: float | None = None) -> Node | None:
+        with self._cond:
+            if not self._pending and not self._cond.wait_for(
+                lambda: self._pending, timeout
+            ):
+                return None
+            node_id = next(iter(self._pending))
+            return self._pending.pop(node_id)
+
+    def done(self, node: Node):
+        now = time.monotonic()
+        with self._cond:
+            self._welcomed[node.id] = now
+            if len(self._welcomed) > self.max_pending:
+                self._welcomed = {
+                    k: t for k, t in self._welcomed.items() if now - t < self.cooldown
+                }
+
+    def run_pending(self):
+        """
+        Welcome the nodes pending right now, without waiting for new ones.
+        """
+        while (node := self.pop(timeout=0)) is not None:
+            self._welcome(node)
+
+    def run(self):
+        while True:
+            self._welcome(self.pop())
+            sleep_time = 1 / self.rate if self.rate else 0
+            time.sleep(sleep_time)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def _welcome(self, node: Node):
+        try:
+            self.welcome(node)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"Failed to welcome {node}, {e}")
+        finally:
+            self.done(node)
+
 
 class FileSystemProtocol:
     source_node: Node
@@ -21,13 +138,19 @@ class FileSystemProtocol:
     storage: PersistentStorage
     router: None = None
     last_response = None
+    welcome_queue: WelcomeQueue
 
     @staticmethod
-    def init(routing_table, storage: PersistentStorage):
+    def init(
+        routing_table, storage: PersistentStorage, welcome_queue: WelcomeQueue | None = None
+    ):
         FileSystemProtocol.source_node = routing_table.node
         FileSystemProtocol.ksize = routing_table.ksize
         FileSystemProtocol.storage = storage
         FileSystemProtocol.router = routing_table
+        if welcome_queue is None:
+            welcome_queue = WelcomeQueue(FileSystemProtocol.welcome)
+        FileSystemProtocol.welcome_queue = welcome_queue
 
     @staticmethod
     def get_refresh_ids():
@@ -41,6 +164,7 @@ class FileSystemProtocol:
         return ids
 
     @staticmethod
+    @busy_is_no_answer
     def call_store(
         conn,
         node_to_ask: Node,
@@ -49,6 +173,7 @@ class FileSystemProtocol:
         is_metadata=True,
         key_name="NOT DEFINED",
         local_last_write=None,
+        storage_class="replicated",
     ):
         """
         async function to call the find store rpc method
@@ -63,12 +188,97 @@ class FileSystemProtocol:
                 value,
                 is_metadata,
                 key_name,
-                local_last_write,
+                to_timestamp(local_last_write),
+                storage_class,
+            )
+
+        return FileSystemProtocol.process_response(conn, response, node_to_ask)
+
+    @staticmethod
+    @busy_is_no_answer
+    def call_check_many(conn, node_to_ask: Node, entries):
+        """
+        Ask the node which of the (key, last_write, is_metadata) entries it
+        needs, last_write given as a timestamp.
+
+        Returns:
+            A tuple with a bool per entry, True if the node should store it.
+        """
+        address = (node_to_ask.ip, node_to_ask.port)
+        response = None
+        if conn:
+            response = wire.decode_flags(
+                conn.rpc_check_many(
+                    address,
+                    FileSystemProtocol.source_node.id,
+                    wire.encode_check_entries(entries),
+                )
+            )
+
+        return FileSystemProtocol.process_response(conn, response, node_to_ask)
+
+    @staticmethod
+    @busy_is_no_answer
+    def call_store_many(conn, node_to_ask: Node, entries, confirm=False):
+        """
+        Store the (key, value, last_write, is_metadata, key_name,
+        storage_class) entries in the node with a single call, confirming
+        their integrity if confirm.
+
+        Returns:
+            A tuple with a bool per entry, True if it was stored.
+        """
+        address = (node_to_ask.ip, node_to_ask.port)
+        response = None
+        if conn:
+            response = wire.decode_flags(
+                conn.rpc_store_many(
+                    address,
+                    FileSystemProtocol.source_node.id,
+                    wire.encode_store_entries(entries),
+                    confirm,
+                )
             )
 
         return FileSystemProtocol.process_response(conn, response, node_to_ask)
 
     @staticmethod
+    def store_many(
+        conn, node_to_ask: Node, entries, confirm=False, batch_bytes=STORE_BATCH_BYTES
+    ) -> set[bytes] | None:
+        """
+        Send to the node the (key, value, last_write, is_metadata, key_name,
+        storage_class) entries it does not have yet. One check call finds what is missing and
+        the values go in store calls of at most batch_bytes each.
+
+        Returns:
+            The keys the node holds after the call, None if it did not answer.
+        """
+        wanted = FileSystemProtocol.call_check_many(
+            conn, node_to_ask, [(k, lw, m) for k, _, lw, m, *_ in entries]
+        )
+        if wanted is None:
+            return None
+
+        held = {e[0] for e, w in zip(entries, wanted) if not w}
+        batch, size = [], 0
+        pending = [e for e, w in zip(entries, wanted) if w]
+        for i, entry in enumerate(pending):
+            batch.append(entry)
+            size += len(entry[1])
+            if size < batch_bytes and i < len(pending) - 1:
+                continue
+            stored = FileSystemProtocol.call_store_many(
+                conn, node_to_ask, batch, confirm
+            )
+            if stored is None:
+                break
+            held.update(e[0] for e, ok in zip(batch, stored) if ok)
+            batch, size = [], 0
+        return held
+
+    @staticmethod
+    @busy_is_no_answer
     def call_delete(conn, node_to_ask: Node, node_to_find: Node, is_metadata=True):
         """
         async function to call the find store rpc method
@@ -76,13 +286,19 @@ class FileSystemProtocol:
         address = (node_to_ask.ip, node_to_ask.port)
         response = None
         if conn:
-            response = conn.rpc_delete(
-                address, FileSystemProtocol.source_node.id, node_to_find.id, is_metadata
+            response = value_reply(
+                conn.rpc_delete(
+                    address,
+                    FileSystemProtocol.source_node.id,
+                    node_to_find.id,
+                    is_metadata,
+                )
             )
 
         return FileSystemProtocol.process_response(conn, response, node_to_ask)
 
     @staticmethod
+    @busy_is_no_answer
     def call_confirm_integrity(
         conn, node_to_ask: Node, node_to_find: Node, is_metadata=True
     ):
@@ -93,13 +309,19 @@ class FileSystemProtocol:
         response = None
 
         if conn:
-            response = conn.rpc_confirm_integrity(
-                address, FileSystemProtocol.source_node.id, node_to_find.id, is_metadata
+            response = value_reply(
+                conn.rpc_confirm_integrity(
+                    address,
+                    FileSystemProtocol.source_node.id,
+                    node_to_find.id,
+                    is_metadata,
+                )
             )
 
         return FileSystemProtocol.process_response(conn, response, node_to_ask)
 
     @staticmethod
+    @busy_is_no_answer
     def call_get_metadata_list(
         conn, node_to_ask: Node, node_to_find: Node, is_metadata=True
     ):
@@ -109,37 +331,52 @@ class FileSystemProtocol:
         address = (node_to_ask.ip, node_to_ask.port)
         response = None
         if conn:
-            response = conn.rpc_get_metadata_list(
-                address, FileSystemProtocol.source_node.id
+            response = value_reply(
+                conn.rpc_get_metadata_list(address, FileSystemProtocol.source_node.id)
             )
 
         return FileSystemProtocol.process_response(conn, response, node_to_ask)
 
     @staticmethod
+    @busy_is_no_answer
     def call_contains(conn, node_to_ask, node_to_find: Node, is_metadata=True):
         response = None
         if conn:
             address = (node_to_ask.ip, node_to_ask.port)
-            response = conn.rpc_contains(
-                address, FileSystemProtocol.source_node.id, node_to_find.id, is_metadata
+            response = value_reply(
+                conn.rpc_contains(
+                    address,
+                    FileSystemProtocol.source_node.id,
+                    node_to_find.id,
+                    is_metadata,
+                )
             )
 
         return FileSystemProtocol.process_response(conn, response, node_to_ask)
 
     @staticmethod
+    @busy_is_no_answer
     def call_check_if_new_value_exists(
         conn, node_to_ask, node_to_find: Node, is_metadata=True
     ):
         response = None
         if conn:
             address = (node_to_ask.ip, node_to_ask.port)
-            response = conn.rpc_check_if_new_value_exists(
-                address, FileSystemProtocol.source_node.id, node_to_find.id, is_metadata
+            response = wire.decode_check_result(
+                conn.rpc_check_if_new_value_exists(
+                    address,
+                    FileSystemProtocol.source_node.id,
+                    node_to_find.id,
+                    is_metadata,
+                )
             )
+            if response is not None:
+                response = response[0], from_timestamp(response[1])
 
         return FileSystemProtocol.process_response(conn, response, node_to_ask)
 
     @staticmethod
+    @busy_is_no_answer
     def call_find_node(conn, node_to_ask: Node, node_to_find: Node):
         """
         async function to call the find node rpc method
@@ -156,13 +393,16 @@ class FileSystemProtocol:
         )
         response = None
         if conn:
-            response = conn.rpc_find_node(
-                address, FileSystemProtocol.source_node.id, node_to_find.id
+            response = wire.decode_find_response(
+                conn.rpc_find_node(
+                    address, FileSystemProtocol.source_node.id, node_to_find.id
+                )
             )
 
         return FileSystemProtocol.process_response(conn, response, node_to_ask)
 
     @staticmethod
+    @busy_is_no_answer
     def call_find_value(conn, node_to_ask: Node, node_to_find: Node, is_metadata=True):
         """
         async function to call the find value rpc method
@@ -171,27 +411,36 @@ class FileSystemProtocol:
         address = (node_to_ask.ip, node_to_ask.port)
         response = None
         if conn:
-            response = conn.rpc_find_value(
-                address, FileSystemProtocol.source_node.id, node_to_find.id, is_metadata
+            response = wire.decode_find_response(
+                conn.rpc_find_value(
+                    address,
+                    FileSystemProtocol.source_node.id,
+                    node_to_find.id,
+                    is_metadata,
+                )
             )
 
         logger.debug(str(response))
         return FileSystemProtocol.process_response(conn, response, node_to_ask)
 
     @staticmethod
+    @busy_is_no_answer
     def call_find_chunk_location(conn, node_to_ask: Node, node_to_find: Node):
         address = (node_to_ask.ip, node_to_ask.port)
         response = None
 
         if conn:
             logger.debug("calling rpc_find_chunk_location")
-            response = conn.rpc_find_chunk_location(
-                address, FileSystemProtocol.source_node.id, node_to_find.id
+            response = wire.decode_find_response(
+                conn.rpc_find_chunk_location(
+                    address, FileSystemProtocol.source_node.id, node_to_find.id
+                )
             )
         logger.critical("call find chunk %s", str(response))
         return FileSystemProtocol.process_response(conn, response, node_to_ask)
 
     @staticmethod
+    @busy_is_no_answer
     def call_ping(conn, node_to_ask: Node):
         """
         async function to call the ping rpc method
@@ -210,48 +459,77 @@ class FileSystemProtocol:
 
         return FileSystemProtocol.process_response(conn, response, node_to_ask)
 
+    @staticmethod
+    def _is_source(node: Node) -> bool:
+        return str(node.ip) == str(FileSystemProtocol.source_node.ip) and str(
+            node.port
+        ) == str(FileSystemProtocol.source_node.port)
+
+    @staticmethod
+    def record_contact(node: Node):
+        """
+        Record the sender of an inbound request. This is cheap enough for the
+        request path, new nodes are added and welcomed by the welcome queue.
+        """
+        if FileSystemProtocol._is_source(node):
+            return
+        if FileSystemProtocol.router.is_new_node(node):
+            FileSystemProtocol.welcome_queue.record(node)
+
+    @staticmethod
+    def welcome(node: Node):
+        """
+        Add the node to the routing table if it is new and send it the
+        keys/values it should be storing.
+        """
+        if FileSystemProtocol.router.is_new_node(node):
+            FileSystemProtocol.router.add_contact(node)
+        FileSystemProtocol.handoff(node)
+
     @staticmethod
     def wellcome_if_new(conn, node: Node):
         """
-        Given a new node, send it all the keys/values it should be storing,
-        then add it to the routing table.
+        Given a new node, add it to the routing table and queue the handoff
+        of the keys/values it should be storing.
 
         @param node: A new node that just joined (or that we just found out
         about).
-
-        Process:
-        For each key in storage, get k closest nodes.  If newnode is closer
-        than the furtherst in that list, and the node for this server
-        is closer than the closest in that list, then store the key/value
-        on the new node (per section 2.5 of the paper)
         """
         # if the node is in the table, do nothing
         if not FileSystemProtocol.router.is_new_node(node):
             return
 
-        # TODO uncomment this
-        if str(node.ip) == str(FileSystemProtocol.source_node.ip) and str(
-            node.port
-        ) == str(FileSystemProtocol.source_node.port):
+        if FileSystemProtocol._is_source(node):
             logger.debug("called wellcome if new in self")
             return
-        # add node to table
 
+        # add node to table
         FileSystemProtocol.router.add_contact(node)
 
         logger.info(
             f"never seen {node} before, adding to router at {FileSystemProtocol.source_node}"
         )
-        # iterate over storage
+        FileSystemProtocol.welcome_queue.record(node)
 
-        logger.info(f"Adding new Node to contacts {node}")
+    @staticmethod
+    def handoff(node: Node):
+        """
+        Send to a node all the keys/values it should be storing.
 
+        Process:
+        For each key in storage, get k closest nodes.  If newnode is closer
+        than the furtherst in that list, and the node for this server
+        is closer than the closest in that list, then store the key/value
+        on the new node (per section 2.5 of the paper)
+        """
+        entries = []
         for (
             key,
             value,
             is_metadata,
             local_last_write,
             key_name,
+            storage_class,
         ) in FileSystemProtocol.storage:
             logger.debug("entry for")
             # Create fictional node to calculate distance
@@ -277,40 +555,23 @@ class FileSystemProtocol:
                 not neighbors
                 or (new_node_close and this_closest)
                 or len(neighbors) == 1
-            ):
-                logger.debug("calling call_store in wellcome_if_new")
-                with ServerSession(node.ip, node.port) as conn:
-                    node_to_find = Node(key)
-                    response = FileSystemProtocol.call_check_if_new_value_exists(
-                        conn, node, node_to_find, is_metadata
+            ) and value is not None:
+                # erasure fragments stay single copies on the new node
+                entries.append(
+                    (
+                        key,
+                        value,
+                        to_timestamp(local_last_write),
+                        is_metadata,
+                        key_name,
+                        storage_class,
                     )
-                    contains, date = None, None
-                    if response is not None:
-                        contains, date = response
-                    if it_is_necessary_to_write(local_last_write, contains, date):
-                        store_response = FileSystemProtocol.call_store(
-                            conn,
-                            node,
-                            node_to_find,
-                            value,
-                            is_metadata,
-                            key_name,
-                            local_last_write,
-                        )
-                        if store_response:
-                            FileSystemProtocol.call_confirm_integrity(
-                                conn,
-                                node,
-                                node_to_find,
-                                is_metadata,
-                            )
-                        else:
-                            FileSystemProtocol.call_delete(
-                                conn,
-                                node,
-                                node_to_find,
-                                is_metadata,
-                            )
+                )
+
+        if entries:
+            logger.debug(f"sending {len(entries)} keys to {node} in handoff")
+            with ServerSession(node.ip, node.port) as conn:
+                FileSystemProtocol.store_many(conn, node, entries, confirm=True)
 
     @staticmethod
     def process_response(conn, response, node: Node):
@@ -331,25 +592,98 @@ class FileSystemProtocol:
         return response
 
 
-class ServerSession:
-    """Server session context manager."""
+class _TimedRoot:
+    """
+    Root of a pooled connection that records every call in peer_stats, so
+    the round trip times leave out the connection setup and the work done
+    between calls.
+    """
+
+    __slots__ = ("_root", "_ip", "_port")
+
+    def __init__(self, root, ip, port):
+        self._root = root
+        self._ip = ip
+        self._port = port
+
+    def __getattr__(self, name: str):
+        def call(*args, **kwargs):
+            stats = ServerSession.peer_stats
+            started = stats.begin(self._ip, self._port)
+            ok = False
+            try:
+                # with rpyc, getting the method is a call to the peer too
+                result = getattr(self._root, name)(*args, **kwargs)
+                ok = True
+                return result
+            except Exception as e:  # pylint: disable=broad-except
+                # errors raised by the peer are answers too
+                ok = not isinstance(e, CONNECTION_ERRORS)
+                raise
+            finally:
+                stats.end(self._ip, self._port, started, ok)
+
+        return call
+
 
-    def __init__(self, server_ip: str, port: str):
+class ServerSession:
+    """
+    Server session context manager, borrows a connection to the peer from
+    the pool and gives it back on exit. Connections that failed are evicted.
+    With a timeout, calls waiting for the peer longer than its adaptive
+    timeout, at most timeout seconds, raise AsyncResultTimeout and the
+    connection is evicted. Every call is recorded in peer_stats and lookup
+    results naming a peer that failed are dropped from lookup_cache.
+    """
+
+    pool = ConnectionPool()
+    lookup_cache: LookupCache | None = None
+    peer_stats = PeerStats()
+
+    def __init__(self, server_ip: str, port: str, timeout: float | None = None):
         self.server_ip = server_ip
         self.port = port
-        self.server_session: rpyc.Connection | None = None
+        self.timeout = timeout
+        self.server_session = None
 
     def __enter__(self):
+        self.server_session = ServerSession.pool.acquire(self.server_ip, self.port)
+        if self.server_session is None:
+            self._failed()
+            return None
+        if self.timeout is not None:
+            self.server_session._config[
+                "sync_request_timeout"
+            ] = ServerSession.peer_stats.timeout(
+                self.server_ip, self.port, self.timeout
+            )
         try:
-            self.server_session = rpyc.connect(
-                self.server_ip,
-                port=self.port,
-                config={"allow_pickle": True, "sync_request_timeout": None},
+            return _TimedRoot(self.server_session.root, self.server_ip, self.port)
+        except CONNECTION_ERRORS as e:
+            logger.warning(f"Connection to {self.server_ip}:{self.port} failed, {e}")
+            ServerSession.pool.release(
+                self.server_session, self.server_ip, self.port, healthy=False
             )
-            return self.server_session.root
-        except ConnectionRefusedError:
+            self.server_session = None
+            self._failed()
             return None
 
     def __exit__(self, exc_type, exc_value, traceback):
         if self.server_session is not None:
-            self.server_session.close()
+            if self.timeout is not None:
+                self.server_session._config["sync_request_timeout"] = None
+            healthy = exc_type is None or not issubclass(exc_type, CONNECTION_ERRORS)
+            ServerSession.pool.release(
+                self.server_session, self.server_ip, self.port, healthy
+            )
+            self.server_session = None
+            if not healthy:
+                self._forget()
+
+    def _failed(self):
+        ServerSession.peer_stats.record(self.server_ip, self.port, 0, False)
+        self._forget()
+
+    def _forget(self):
+        if ServerSession.lookup_cache is not None:
+            ServerSession.lookup_cache.invalidate(self.server_ip, self.port)
@@ -1,12 +1,15 @@
+import bisect
 import heapq
 import time
 import logging
+import threading
 
+from kade_drive.core.cache import LookupCache
 from kade_drive.core.protocol import FileSystemProtocol, ServerSession
 from itertools import chain
 from collections import OrderedDict
-from kade_drive.core.utils import shared_prefix, bytes_to_bit_string
 from kade_drive.core.node import Node
+from kade_drive.core.xortrie import XorTrie
 
 
 # Create a file handler
@@ -22,6 +25,9 @@ class KBucket:
     K is the number of entries in a bucket, their node IDs are expected to be randomly distributed within the ID-range the bucket covers
     Each node is putted in a bucket based on how far away they are from the source node.
     This way when you are looking for some node you don't have to bother all possible nodes
+
+    The nodes are also published as an immutable tuple, snapshot, replaced
+    after every change so readers can use it while the bucket is modified.
     """
 
     def __init__(
@@ -30,15 +36,24 @@ class KBucket:
         self.range = (rangeLower, rangeUpper)
         self.nodes: OrderedDict[bytes, Node] = OrderedDict()
         self.replacement_nodes: OrderedDict[bytes, Node] = OrderedDict()
+        self.snapshot: tuple[Node, ...] = ()
         self.touch_last_updated()
         self.ksize = ksize
         self.max_replacement_nodes = self.ksize * replacementNodeFactor
+        # for depth: the long id of a node, the OR of the XOR of every other
+        # id with it (None when a removal made it stale) and the id width
+        self._anchor: int | None = None
+        self._spread: int | None = 0
+        self._width = 0
 
     def touch_last_updated(self):
         self.last_updated = time.monotonic()
 
     def get_nodes(self):
-        return list(self.nodes.values())
+        return list(self.snapshot)
+
+    def _publish(self):
+        self.snapshot = tuple(self.nodes.values())
 
     def split(self):
         midpoint: int = (self.range[0] + self.range[1]) // 2
@@ -51,16 +66,24 @@ class KBucket:
 
         return (one, two)
 
-    def remove_node(self, node: Node):
+    def remove_node(self, node: Node) -> Node | None:
+        """
+        Remove the node, returns the replacement node that took its place.
+        """
         if node.id in self.replacement_nodes:
             del self.replacement_nodes[node.id]
 
         if node.id in self.nodes:
             del self.nodes[node.id]
+            self._spread = None
 
             if self.replacement_nodes:
                 newnode_id, newnode = self.replacement_nodes.popitem()
                 self.nodes[newnode_id] = newnode
+                self._publish()
+                return newnode
+            self._publish()
+        return None
 
     def has_in_range(self, node: Node):
         return self.range[0] <= node.long_id <= self.range[1]
@@ -79,8 +102,11 @@ class KBucket:
         if node.id in self.nodes:
             del self.nodes[node.id]
             self.nodes[node.id] = node
+            self._publish()
         elif len(self) < self.ksize:
             self.nodes[node.id] = node
+            self._note_prefix(node)
+            self._publish()
         else:
             if node.id in self.replacement_nodes:
                 del self.replacement_nodes[node.id]
@@ -90,13 +116,33 @@ class KBucket:
             return False
         return True
 
+    def _note_prefix(self, node: Node):
+        if self._spread is None:
+            return
+        if self._anchor is None:
+            self._anchor, self._width = node.long_id, len(node.id) * 8
+        else:
+            self._spread |= self._anchor ^ node.long_id
+
     def depth(self):
-        vals = self.nodes.values()
-        sprefix = shared_prefix([bytes_to_bit_string(n.id) for n in vals])
-        return len(sprefix)
+        """
+        Length of the prefix shared by the ids of the nodes in the bucket.
+
+        The XOR of two ids has set the bits where they differ, so the OR of
+        the XOR of every id with one of them has the highest differing bit as
+        its bit_length. It is updated as nodes are added and recomputed after
+        a removal.
+        """
+        if self._spread is None:
+            self._anchor, self._spread = None, 0
+            for node in self.nodes.values():
+                self._note_prefix(node)
+        if self._anchor is None:
+            return 0
+        return self._width - self._spread.bit_length()
 
     def head(self):
-        return list(self.nodes.values())[0]
+        return self.snapshot[0]
 
     def __getitem__(self, node_id):
         return self.nodes.get(node_id, None)
@@ -107,14 +153,14 @@ class KBucket:
 
 class TableTraverser:
     def __init__(self, table: "RoutingTable", startNode):
-        index = table.get_bucket_for(startNode)
-        logger.debug(f"table.buckets, {table.buckets}, {index}")
-        table.buckets[index].touch_last_updated()
-        logger.debug("nodes in bucket %s", table.buckets[index].nodes.values())
-        self.current_nodes = table.buckets[index].get_nodes()
+        # the buckets as published when the traversal starts
+        buckets, index = table.locate(startNode)
+        logger.debug("table.buckets, %s, %s", buckets, index)
+        buckets[index].touch_last_updated()
+        self.current_nodes = buckets[index].get_nodes()
         logger.debug("current nodes %s", self.current_nodes)
-        self.left_buckets = table.buckets[:index]
-        self.right_buckets = table.buckets[(index + 1) :]
+        self.left_buckets = list(buckets[:index])
+        self.right_buckets = list(buckets[(index + 1) :])
         self.left = True
 
     def __iter__(self):
@@ -151,24 +197,76 @@ class VoidNodeException(Exception):
 
 
 class RoutingTable:
-    def __init__(self, ksize: int, node: Node):
+    """
+    Writers (add_contact, remove_contact, split_bucket, flush) serialize
+    through a lock. The buckets and their upper bounds are published together
+    as one tuple, swapped in once a change is complete, and every bucket
+    publishes its nodes the same way, so readers (find_neighbors,
+    get_bucket_for, TableTraverser) take no lock and never see half a split.
+    """
+
+    def __init__(
+        self,
+        ksize: int,
+        node: Node,
+        lookup_cache: LookupCache | None = None,
+        trie_index: bool = False,
+    ):
         """
         @param node: The node that represents this server.  It won't
         be added to the routing table, but will be needed later to
         determine which buckets to split or not.
 
+        @param lookup_cache: Cache of lookup results, invalidated when a
+        contact is removed or a bucket split.
+
+        @param trie_index: Index the contacts of the buckets in a XorTrie,
+        so find_neighbors returns the exact k closest ones, for tables
+        with many contacts.
         """
         self.node = node
         self.ksize = ksize
+        self._lock = threading.RLock()
+        self._view: tuple[tuple[KBucket, ...], tuple[int, ...]] = ((), ())
+        self.lookup_cache = lookup_cache
+        self.index: XorTrie | None = XorTrie() if trie_index else None
         self.flush()
 
+    @property
+    def buckets(self) -> tuple[KBucket, ...]:
+        return self._view[0]
+
+    @buckets.setter
+    def buckets(self, buckets: list[KBucket]):
+        with self._lock:
+            if self.index is not None:
+                index = XorTrie()
+                for bucket in buckets:
+                    for node in bucket.get_nodes():
+                        index.add(node)
+                self.index = index
+            self._publish(buckets)
+
+    def _publish(self, buckets: list[KBucket]):
+        # upper bound of every bucket, in the same order, for get_bucket_for
+        upper_bounds = tuple(bucket.range[1] for bucket in buckets)
+        self._view = (tuple(buckets), upper_bounds)
+
     def flush(self):
         self.buckets = [KBucket(0, 2**160, self.ksize)]
 
     def split_bucket(self, index: int):
-        one, two = self.buckets[index].split()
-        self.buckets[index] = one
-        self.buckets.insert(index + 1, two)
+        with self._lock:
+            buckets = list(self.buckets)
+            one, two = buckets[index].split()
+            buckets[index : index + 1] = [one, two]
+            if self.index is not None:
+                # replacement nodes may have found room in the new buckets
+                for node in chain(one.get_nodes(), two.get_nodes()):
+                    self.index.add(node)
+            self._publish(buckets)
+            if self.lookup_cache is not None:
+                self.lookup_cache.clear()
 
     def lonely_buckets(self):
         """
@@ -179,51 +277,74 @@ class RoutingTable:
         return [b for b in self.buckets if b.last_updated < hrago]
 
     def remove_contact(self, node: Node):
-        index = self.get_bucket_for(node)
-        self.buckets[index].remove_node(node)
+        with self._lock:
+            index = self.get_bucket_for(node)
+            replacement = self.buckets[index].remove_node(node)
+            if self.index is not None:
+                self.index.remove(node)
+                if replacement is not None:
+                    self.index.add(replacement)
+        if self.lookup_cache is not None:
+            self.lookup_cache.invalidate_node(node)
 
     def is_new_node(self, node: Node):
-        index = self.get_bucket_for(node)
-        return self.buckets[index].is_new_node(node)
+        buckets, index = self.locate(node)
+        return buckets[index].is_new_node(node)
 
     def add_contact(self, node: Node):
+        with self._lock:
+            node_to_ask = self._add_contact(node)
+        if node_to_ask is None:
+            return
+        # the answer adds or removes the head, so ping without the lock
+        addr = (node_to_ask.ip, node_to_ask.port)
+        logger.critical("node_to_ask %s, addr %s", node_to_ask, addr)
+        with ServerSession(addr[0], addr[1]) as conn:
+            FileSystemProtocol.call_ping(conn, node_to_ask)
+
+    def _add_contact(self, node: Node) -> Node | None:
+        """
+        Add the node, returns the head of its bucket if it is full and can
+        not be split, to be pinged. Must hold the lock.
+        """
         index = self.get_bucket_for(node)
         bucket = self.buckets[index]
 
-        logger.debug(f"previous nodes in bucket of index {index}, {bucket.get_nodes()}")
+        logger.debug("previous nodes in bucket of index %s, %s", index, bucket.nodes)
         # this will succeed unless the bucket is full
         if bucket.add_node(node):
-            logger.debug(f"Bucket nodes:  {bucket.get_nodes()}")
-            return
+            if self.index is not None:
+                self.index.add(node)
+            logger.debug("Bucket nodes:  %s", bucket.nodes)
+            return None
 
         # Per section 4.2 of paper, split if the bucket has the node
         # in its range or if the depth is not congruent to 0 mod 5
         if bucket.has_in_range(self.node) or bucket.depth() % 5 != 0:
             self.split_bucket(index)
-            self.add_contact(node)
-        else:
-            node_to_ask = bucket.head()
-            addr = (node_to_ask.ip, node_to_ask.port)
-            logger.critical(f"node_to_ask {node_to_ask}, addr {addr}")
-            with ServerSession(addr[0], addr[1]) as conn:
-                FileSystemProtocol.call_ping(conn, node_to_ask)
+            return self._add_contact(node)
+        return bucket.head()
 
-    def get_bucket_for(self, node: Node):
+    def locate(self, node: Node) -> tuple[tuple[KBucket, ...], int]:
         """
-        Get the index of the bucket that the given node would fall into.
+        The published buckets and the index of the one the node falls into,
+        both from the same version of the table.
         """
+        buckets, upper_bounds = self._view
+        return buckets, self._bucket_index(upper_bounds, node)
 
-        node_index: int | None = None
-        for index, bucket in enumerate(self.buckets):
-            logger.debug(f"node.long_id {node.long_id}")
-            logger.debug(f"bucket.range[1] {bucket.range[1]}")
-            if node.long_id >= bucket.range[1]:
-                continue
+    def get_bucket_for(self, node: Node):
+        """
+        Get the index of the bucket that the given node would fall into: the
+        first one whose upper bound is above the id of the node.
+        """
+        return self._bucket_index(self._view[1], node)
 
-            node_index = index
-            break
+    @staticmethod
+    def _bucket_index(upper_bounds: tuple[int, ...], node: Node) -> int:
+        node_index = bisect.bisect_right(upper_bounds, node.long_id)
         # we should never be here, but make linter happy
-        if node_index is None:
+        if node_index == len(upper_bounds):
             logger.critical(
                 f"VoidNodeException {node} does not have any bucket to fall into"
             )
@@ -237,6 +358,10 @@ class RoutingTable:
         self, node: Node, k: int | None = None, exclude: Node | None = None
     ):
         k = k or self.ksize
+        if self.index is not None:
+            buckets, index = self.locate(node)
+            buckets[index].touch_last_updated()
+            return self.index.closest(node, k, exclude)
         nodes: list[tuple[int, Node]] = []
         for neighbor in TableTraverser(self, node):
             if exclude:
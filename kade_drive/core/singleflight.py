@@ -0,0 +1,71 @@
+"""
+Coalescing of concurrent identical lookups.
+"""
+import threading
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same (operation, key) share one execution:
+    the first caller runs it and the ones arriving while it runs wait for
+    its result, or its exception, instead of running their own.
+    """
+
+    def __init__(self):
+        self._flights: dict[tuple, _Flight] = {}
+        self._lock = threading.Lock()
+        # operation -> [requests, executions]
+        self._counts: dict[str, list[int]] = {}
+
+    def do(self, operation: str, key, function, *args):
+        with self._lock:
+            counts = self._counts.setdefault(operation, [0, 0])
+            counts[0] += 1
+            flight = self._flights.get((operation, key))
+            leader = flight is None
+            if leader:
+                counts[1] += 1
+                flight = self._flights[(operation, key)] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function(*args)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[(operation, key)]
+            flight.done.set()
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def metrics(self) -> dict[str, dict[str, float]]:
+        """
+        Requests, executions and ratio of coalesced requests per operation.
+        """
+        with self._lock:
+            counts = {op: tuple(c) for op, c in self._counts.items()}
+        return {
+            op: {
+                "requests": requests,
+                "executions": executions,
+                "coalesced": requests - executions,
+                "ratio": (requests - executions) / requests if requests else 0.0,
+            }
+            for op, (requests, executions) in counts.items()
+        }
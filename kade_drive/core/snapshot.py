@@ -0,0 +1,110 @@
+"""
+Routing table saved to disk, so a restarted node rejoins by pinging the
+peers it knew instead of crawling the network again.
+"""
+import json
+import logging
+import os
+import time
+
+from kade_drive.core.node import Node
+from kade_drive.core.peerstats import PeerStats
+from kade_drive.core.routing import RoutingTable
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+class RoutingSnapshot:
+    """
+    JSON file with the id and address of this node and, for every contact of
+    its routing table, the id, address, last time it was known alive and
+    round trip time.
+
+    A contact is known alive when it last answered a call or, for the ones
+    that never did in this run, when the snapshot was taken, contacts that
+    stop answering are removed from the table.
+    """
+
+    def __init__(self, path: str, max_age: float = 24 * 3600):
+        """
+        @param max_age: Seconds after which a contact not seen is not loaded.
+        """
+        self.path = path
+        self.max_age = max_age
+
+    def save(
+        self, node: Node, table: RoutingTable, peer_stats: PeerStats | None = None
+    ):
+        """
+        Write the snapshot, replacing the previous one in a single step.
+        Returns the number of contacts saved.
+        """
+        now = time.time()
+        contacts = []
+        for bucket in table.buckets:
+            for contact in bucket.get_nodes():
+                last_seen, rtt = None, None
+                if peer_stats is not None:
+                    last_seen = peer_stats.last_seen(contact.ip, contact.port)
+                    if last_seen is not None:
+                        rtt = peer_stats.rtt(contact.ip, contact.port)
+                contacts.append(
+                    {
+                        "id": contact.id.hex(),
+                        "ip": contact.ip,
+                        "port": contact.port,
+                        "last_seen": last_seen or now,
+                        "rtt": rtt,
+                    }
+                )
+        data = {
+            "version": VERSION,
+            "node": node.id.hex(),
+            "ip": node.ip,
+            "port": node.port,
+            "saved": now,
+            "contacts": contacts,
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temporary, self.path)
+        return len(contacts)
+
+    def load(self) -> tuple[Node | None, list[tuple[Node, float, float | None]]]:
+        """
+        The node that saved the snapshot and its (node, last seen, round trip
+        time) contacts seen within max_age, the most recently seen first. No
+        node and no contacts when there is no readable snapshot.
+        """
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") != VERSION:
+                logger.warning(
+                    f"Ignoring routing snapshot of version {data.get('version')}"
+                )
+                return None, []
+            node = Node(bytes.fromhex(data["node"]), data["ip"], data["port"])
+            oldest = time.time() - self.max_age
+            contacts = [
+                (
+                    Node(bytes.fromhex(entry["id"]), entry["ip"], entry["port"]),
+                    entry["last_seen"],
+                    entry["rtt"],
+                )
+                for entry in data["contacts"]
+                if entry["last_seen"] >= oldest
+            ]
+        except FileNotFoundError:
+            return None, []
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable routing snapshot {self.path}: {e}")
+            return None, []
+        contacts.sort(key=lambda contact: contact[1], reverse=True)
+        return node, contacts
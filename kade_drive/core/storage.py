@@ -12,6 +12,8 @@ import random
 from time import sleep
 from filelock import Timeout, FileLock
 
+from kade_drive.core.manifest import Manifest
+
 # Create a file handler
 # file_handler = logging.FileHandler("log_file.log")
 formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
@@ -98,8 +100,7 @@ class PersistentStorage:
                 )
                 logger.info("Starting to delete chunks")
                 assert chunks_value is not None
-                chunks_value = pickle.loads(chunks_value)
-                for v in chunks_value:
+                for v in self._chunk_keys_of(chunks_value):
                     chunk_str_key = str(base64.urlsafe_b64encode(v))
                     self._delete_data(chunk_str_key, False)
                 logger.info("Chunks deleted")
@@ -113,6 +114,26 @@ class PersistentStorage:
         if timestamp_path.exists():
             os.remove(timestamp_path)
 
+    def _chunk_keys_of(self, metadata_value: bytes):
+        """
+        Get the keys of the chunks or fragments referenced by a metadata value.
+        The sub-manifests of an index are included along with the chunks they
+        reference when they are stored in this node.
+        """
+        try:
+            manifest = Manifest.decode(metadata_value)
+        except ValueError as e:
+            logger.warning(f"metadata to remove is not a valid manifest, {e}")
+            return []
+        keys = manifest.digests()
+        if not manifest.is_index:
+            return keys
+        for sub_key in list(keys):
+            sub = self.get(sub_key, update_timestamp=False, metadata=False)
+            if sub is not None:
+                keys.extend(Manifest.decode(sub).digests())
+        return keys
+
     def _prepare_metadata_for_removal_and_get_value(self, path: Path, str_path: str):
         lock = FileLock(str_path + ".lock")
         value = None
@@ -230,6 +251,7 @@ class PersistentStorage:
         republish_data=False,
         key_name="NOT DEFINED",
         last_write=None,
+        storage_class="replicated",
     ):
         str_key = str(base64.urlsafe_b64encode(key))
         self.ensure_dir_paths()
@@ -246,6 +268,7 @@ class PersistentStorage:
                 "integrity_date": datetime.now(),
                 "key_name": key_name,
                 "last_write": last_write,
+                "storage_class": storage_class,
             }
         )
 
@@ -344,6 +367,17 @@ class PersistentStorage:
             return result["key_name"]
         return None
 
+    def get_storage_class(self, key: bytes, metadata=True):
+        """
+        Get the storage class of a key, "erasure" fragments are stored on a
+        single node and must not be replicated.
+        """
+        str_key = str(base64.urlsafe_b64encode(key))
+        result = self.get_value(str_key, update_timestamp=False, metadata=metadata)
+        if result is None:
+            return None
+        return result.get("storage_class", "replicated")
+
     def get_key_in_bytes(self, key: str):
         path = Path(os.path.join(self.keys_path, key))
         if not path.exists():
@@ -409,6 +443,8 @@ class PersistentStorage:
                         if value is None or not value["integrity"]:
                             logger.info("ignoring bad value in iter older")
                             continue
+                        if value.get("storage_class") == "erasure":
+                            continue
 
                         yield key, value["value"], is_metadata, value[
                             "last_write"
@@ -440,6 +476,7 @@ class PersistentStorage:
         ivalues: list[bytes] = []
         ilast_writes: list = []
         ikey_names: list = []
+        istorage_classes: list = []
         for i, ik in enumerate(ikeys):
             ivalues.append(self.get(ik, update_timestamp=False, metadata=imetadata[i]))
             contains, last_write = self.check_if_new_value_exists(ik, imetadata[i])
@@ -447,4 +484,9 @@ class PersistentStorage:
             ikey_names.append(
                 self.get_key_name(ik, update_timestamp=False, metadata=imetadata[i])
             )
-        return zip(ikeys, ivalues, imetadata, ilast_writes, ikey_names)
+            istorage_classes.append(
+                self.get_storage_class(ik, metadata=imetadata[i]) or "replicated"
+            )
+        return zip(
+            ikeys, ivalues, imetadata, ilast_writes, ikey_names, istorage_classes
+        )
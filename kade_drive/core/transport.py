@@ -0,0 +1,560 @@
+"""
+Asyncio transport for the RPCs between nodes and from clients.
+
+Every message is a frame made of a HEADER with the payload length, the id
+of the request it belongs to and its kind, followed by the payload.
+Requests carry (method, args, kwargs) and are answered by a response or an
+error frame with the same id, so many calls can be in flight over a single
+connection and be answered in any order.
+
+Payloads made only of simple values (bytes, str, numbers, tuples...) are
+encoded with rpyc's brine, like the RPCs between nodes. Anything else, such
+as the lists of the client API, is pickled. Servers refuse pickled
+requests and connections refuse pickled replies unless built with
+allow_pickle, the RPCs between nodes never need it, only the client opts
+in for the replies of its API calls.
+
+The server runs the exposed methods of the service on a fixed thread pool
+instead of a thread per connection. At most max_queued requests wait for a
+worker, the ones beyond are answered right away with a busy frame. The client side runs every connection
+on one background event loop and offers the same `conn.root.method(...)`
+interface as rpyc, so the rest of the code works with either transport.
+"""
+import asyncio
+import atexit
+import itertools
+import logging
+import pickle
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from rpyc.core import brine
+from rpyc.core.async_ import AsyncResultTimeout
+
+logger = logging.getLogger(__name__)
+
+# payload length, request id, kind
+HEADER = struct.Struct(">IQB")
+MAX_FRAME = 256 * 1024 * 1024
+
+KIND_REQUEST = 0
+KIND_RESPONSE = 1
+KIND_ERROR = 2
+KIND_PING = 3
+KIND_BUSY = 4
+
+CODEC_BRINE = b"B"
+CODEC_PICKLE = b"P"
+
+CONNECT_TIMEOUT = 10
+
+
+class RemoteError(Exception):
+    """
+    An exception raised by the remote method.
+    """
+
+
+class ServerBusy(Exception):
+    """
+    The server is saturated and did not run the call. The peer is alive, the
+    call may be retried later or sent to another replica.
+    """
+
+
+def is_busy(error: BaseException) -> bool:
+    # rpyc rebuilds the exceptions of other modules as GenericException
+    # subclasses named after the original class
+    return isinstance(error, ServerBusy) or type(error).__name__.endswith(
+        ".ServerBusy"
+    )
+
+
+class RequestLimiter:
+    """
+    Admission control for servers with a thread per connection: at most
+    workers requests run at once and at most max_queued wait, up to
+    queue_timeout seconds, for their turn. Requests beyond that raise
+    ServerBusy.
+    """
+
+    def __init__(self, workers: int = 64, max_queued: int = 256, queue_timeout=5):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.queued = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            if self.running >= self.workers:
+                if self.queued >= self.max_queued:
+                    self.rejected += 1
+                    raise ServerBusy("too many requests queued")
+                self.queued += 1
+                try:
+                    admitted = self._cond.wait_for(
+                        lambda: self.running < self.workers, self.queue_timeout
+                    )
+                finally:
+                    self.queued -= 1
+                if not admitted:
+                    self.rejected += 1
+                    raise ServerBusy("timed out waiting for a worker")
+            self.running += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._cond:
+            self.running -= 1
+            self._cond.notify()
+
+    def wrap(self, method):
+        def limited(*args, **kwargs):
+            with self:
+                return method(*args, **kwargs)
+
+        return limited
+
+
+def dumps(obj) -> bytes:
+    if brine.dumpable(obj):
+        return CODEC_BRINE + brine.dump(obj)
+    return CODEC_PICKLE + pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+
+def loads(payload: bytes, allow_pickle=False):
+    codec, data = payload[:1], payload[1:]
+    if codec == CODEC_BRINE:
+        return brine.load(data)
+    if codec == CODEC_PICKLE and allow_pickle:
+        return pickle.loads(data)
+    raise ValueError(f"payload codec {codec!r} is not allowed")
+
+
+def encode_frame(request_id: int, kind: int, payload: bytes) -> list[bytes]:
+    if len(payload) > MAX_FRAME:
+        raise ValueError(f"frame of {len(payload)} bytes is too large")
+    return [HEADER.pack(len(payload), request_id, kind), payload]
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[int, int, bytes]:
+    """
+    Read the next (request_id, kind, payload) frame. Raises EOFError when
+    the connection is closed or the peer does not speak the protocol.
+    """
+    try:
+        length, request_id, kind = HEADER.unpack(
+            await reader.readexactly(HEADER.size)
+        )
+        if length > MAX_FRAME:
+            raise EOFError(f"frame of {length} bytes is too large")
+        return request_id, kind, await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError) as e:
+        raise EOFError("connection closed by peer") from e
+
+
+class AsyncioServer:
+    """
+    Serves the exposed methods of service over framed connections, with
+    the same blocking interface as rpyc's ThreadedServer.start().
+    """
+
+    def __init__(
+        self,
+        service,
+        hostname="0.0.0.0",
+        port=8086,
+        max_workers=64,
+        max_queued=256,
+        allow_pickle=False,
+    ):
+        self.service = service
+        self.hostname = hostname
+        self.port = port
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.allow_pickle = allow_pickle
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="rpc"
+        )
+        # requests running or waiting for a worker
+        self.in_flight = 0
+        self.rejected = 0
+        self._tasks = set()
+
+    def start(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        server = await asyncio.start_server(
+            self._serve_connection, self.hostname, self.port
+        )
+        async with server:
+            await server.serve_forever()
+
+    async def _serve_connection(self, reader, writer):
+        service = self.service()
+        write_lock = asyncio.Lock()
+        try:
+            while True:
+                request_id, kind, payload = await read_frame(reader)
+                if kind == KIND_REQUEST:
+                    if self.in_flight >= self.max_workers + self.max_queued:
+                        self.rejected += 1
+                        kind, payload = KIND_BUSY, b""
+                    else:
+                        self.in_flight += 1
+                task = asyncio.create_task(
+                    self._answer(service, writer, write_lock, request_id, kind, payload)
+                )
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except EOFError:
+            pass
+        finally:
+            writer.close()
+
+    async def _answer(self, service, writer, write_lock, request_id, kind, payload):
+        if kind == KIND_PING:
+            kind, payload = KIND_RESPONSE, b""
+        elif kind == KIND_REQUEST:
+            try:
+                kind, payload = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self._dispatch, service, payload
+                )
+            finally:
+                self.in_flight -= 1
+        async with write_lock:
+            try:
+                writer.writelines(encode_frame(request_id, kind, payload))
+                await writer.drain()
+            except ConnectionError:
+                writer.close()
+
+    def _dispatch(self, service, payload: bytes) -> tuple[int, bytes]:
+        try:
+            method, args, kwargs = loads(payload, self.allow_pickle)
+            handler = getattr(service, "exposed_" + method, None)
+            if handler is None:
+                raise AttributeError(f"{method} is not an exposed method")
+            return KIND_RESPONSE, dumps(handler(*args, **dict(kwargs)))
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"RPC failed, {type(e).__name__}: {e}")
+            return KIND_ERROR, dumps(f"{type(e).__name__}: {e}")
+
+
+class _EventLoopThread:
+    """
+    Background event loop shared by the client connections.
+    """
+
+    loop: asyncio.AbstractEventLoop | None = None
+    lock = threading.Lock()
+
+    @staticmethod
+    def get() -> asyncio.AbstractEventLoop:
+        with _EventLoopThread.lock:
+            if _EventLoopThread.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="transport", daemon=True
+                ).start()
+                atexit.register(_EventLoopThread.stop)
+                _EventLoopThread.loop = loop
+            return _EventLoopThread.loop
+
+    @staticmethod
+    def stop():
+        """
+        Close every connection before the interpreter exits.
+        """
+        loop = _EventLoopThread.loop
+        if loop is None:
+            return
+
+        async def cancel_all():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_all(), loop).result(1)
+        except Exception:  # pylint: disable=broad-except
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+
+
+class Multiplexer:
+    """
+    A framed connection to a peer shared by many concurrent calls. Lives on
+    the background event loop, its methods are coroutines.
+    """
+
+    # streams only hold their reader weakly, open connections are kept here
+    # until their reader task ends
+    running: set["Multiplexer"] = set()
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+        self._ids = itertools.count(1)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._write_lock = asyncio.Lock()
+        self._reader_task = asyncio.create_task(self._read_responses())
+        Multiplexer.running.add(self)
+
+    @staticmethod
+    async def open(ip: str, port: int) -> "Multiplexer":
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(ip, port), CONNECT_TIMEOUT
+        )
+        return Multiplexer(reader, writer)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    async def request(self, kind: int, payload: bytes) -> tuple[int, bytes]:
+        if self.closed:
+            raise EOFError("connection closed")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            async with self._write_lock:
+                self.writer.writelines(encode_frame(request_id, kind, payload))
+                await self.writer.drain()
+            return await future
+        except ConnectionError as e:
+            self.close()
+            raise EOFError("connection closed by peer") from e
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _read_responses(self):
+        try:
+            while True:
+                request_id, kind, payload = await read_frame(self.reader)
+                future = self._pending.get(request_id)
+                # the caller may have given up on it already
+                if future is not None and not future.done():
+                    future.set_result((kind, payload))
+        except (EOFError, asyncio.CancelledError):
+            pass
+        finally:
+            self.close()
+            Multiplexer.running.discard(self)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.writer.close()
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(EOFError("connection closed by peer"))
+
+
+class _Root:
+    def __init__(self, connection: "AsyncioConnection"):
+        self._connection = connection
+
+    def __getattr__(self, method: str):
+        def call(*args, **kwargs):
+            return self._connection.call(method, *args, **kwargs)
+
+        return call
+
+
+class AsyncioConnection:
+    """
+    Blocking handle over a multiplexed connection, with the subset of the
+    rpyc.Connection interface used by the nodes and the client. Calls wait
+    for at most _config["sync_request_timeout"] seconds, timeout when it is
+    opened, forever by default. The connection is
+    closed when the handle that opened it is garbage collected.
+    """
+
+    def __init__(
+        self,
+        multiplexer: Multiplexer,
+        loop: asyncio.AbstractEventLoop,
+        owner=False,
+        allow_pickle=False,
+        timeout: float | None = None,
+    ):
+        self.multiplexer = multiplexer
+        self.loop = loop
+        self.owner = owner
+        self.allow_pickle = allow_pickle
+        self._config = {"sync_request_timeout": timeout}
+        self.root = _Root(self)
+
+    def __del__(self):
+        if self.owner and not self.multiplexer.closed and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.multiplexer.close)
+
+    @property
+    def closed(self) -> bool:
+        return self.multiplexer.closed
+
+    def call(self, method: str, *args, **kwargs):
+        payload = dumps((method, args, tuple(kwargs.items())))
+        kind, payload = self._request(KIND_REQUEST, payload)
+        if kind == KIND_BUSY:
+            raise ServerBusy(f"{method} was refused, the server is busy")
+        if kind == KIND_ERROR:
+            raise RemoteError(loads(payload))
+        return loads(payload, self.allow_pickle)
+
+    def ping(self, timeout=3):
+        self._request(KIND_PING, b"", timeout)
+
+    def close(self):
+        if self.multiplexer.closed or self.loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self.multiplexer.close()
+            return
+
+        async def close():
+            self.multiplexer.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(close(), self.loop).result(CONNECT_TIMEOUT)
+        except FutureTimeoutError:
+            pass
+
+    def _request(self, kind: int, payload: bytes, timeout=None):
+        if timeout is None:
+            timeout = self._config["sync_request_timeout"]
+        future = asyncio.run_coroutine_threadsafe(
+            self.multiplexer.request(kind, payload), self.loop
+        )
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError as e:
+            future.cancel()
+            raise AsyncResultTimeout("result expired") from e
+
+
+def asyncio_connect(
+    ip: str, port: int, allow_pickle=False, timeout: float | None = None
+) -> AsyncioConnection:
+    """
+    Open a connection of its own to the server at ip:port, allow_pickle
+    accepts pickled replies and must only be set by clients of the API.
+    Calls wait for at most timeout seconds, forever when it is None.
+    """
+    loop = _EventLoopThread.get()
+    multiplexer = asyncio.run_coroutine_threadsafe(
+        Multiplexer.open(ip, int(port)), loop
+    ).result()
+    return AsyncioConnection(
+        multiplexer, loop, owner=True, allow_pickle=allow_pickle, timeout=timeout
+    )
+
+
+class MultiplexedPool:
+    """
+    Connection pool for the asyncio transport, with the interface of
+    :class:`~kade_drive.core.pool.ConnectionPool`. Every borrower of a peer
+    gets its own handle over the one connection shared with that peer.
+    """
+
+    def __init__(self, idle_timeout: float = 60, connect=asyncio_connect):
+        self.idle_timeout = idle_timeout
+        self._connect = connect
+        # address -> (connection, borrowers, last time it was released)
+        self._connections: dict[tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def address_of(ip, port) -> tuple[str, int]:
+        return str(ip), int(port)
+
+    @property
+    def open_connections(self) -> int:
+        return len(self._connections)
+
+    def idle_connections(self, ip=None, port=None) -> int:
+        with self._lock:
+            if ip is None:
+                return sum(1 for _, b, _ in self._connections.values() if not b)
+            entry = self._connections.get(self.address_of(ip, port))
+            return int(entry is not None and not entry[1])
+
+    def acquire(self, ip, port) -> AsyncioConnection | None:
+        address = self.address_of(ip, port)
+        with self._lock:
+            entry = self._connections.get(address)
+            if entry is not None and not entry[0].closed:
+                entry[1] += 1
+                return AsyncioConnection(entry[0].multiplexer, entry[0].loop)
+        try:
+            conn = self._connect(*address)
+        except (OSError, EOFError, asyncio.TimeoutError) as e:
+            logger.warning(f"Failed to connect to {address}, {e}")
+            return None
+        with self._lock:
+            entry = self._connections.get(address)
+            if entry is not None and not entry[0].closed:
+                # another thread connected first
+                conn.close()
+                entry[1] += 1
+                return AsyncioConnection(entry[0].multiplexer, entry[0].loop)
+            self._connections[address] = [conn, 1, None]
+        return AsyncioConnection(conn.multiplexer, conn.loop)
+
+    def release(self, conn: AsyncioConnection, ip, port, healthy=True):
+        address = self.address_of(ip, port)
+        with self._lock:
+            entry = self._connections.get(address)
+            if entry is None or entry[0].multiplexer is not conn.multiplexer:
+                return
+            entry[1] -= 1
+            entry[2] = time.monotonic()
+        if not healthy or conn.closed:
+            self.evict(ip, port)
+
+    def discard(self, conn: AsyncioConnection):
+        conn.close()
+
+    def evict(self, ip, port):
+        with self._lock:
+            entry = self._connections.pop(self.address_of(ip, port), None)
+        if entry is not None:
+            entry[0].close()
+
+    def sweep(self):
+        limit = time.monotonic() - self.idle_timeout
+        with self._lock:
+            expired = [
+                address
+                for address, (conn, borrowers, released) in self._connections.items()
+                if conn.closed
+                or (not borrowers and released is not None and released < limit)
+            ]
+            closing = [self._connections.pop(address)[0] for address in expired]
+        for conn in closing:
+            conn.close()
+
+    def close_all(self):
+        with self._lock:
+            closing = [entry[0] for entry in self._connections.values()]
+            self._connections.clear()
+        for conn in closing:
+            conn.close()
+
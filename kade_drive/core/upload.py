@@ -0,0 +1,114 @@
+"""
+Bookkeeping for resumable multi-part uploads.
+"""
+import threading
+import time
+import uuid
+import logging
+
+from kade_drive.core.manifest import Manifest, NO_HASH
+
+logger = logging.getLogger(__name__)
+
+
+class UploadSession:
+    """
+    State of a single multi-part upload. The session knows the digest and the
+    length of every part of the file, so parts can arrive in any order and be
+    retried individually until commit publishes the metadata.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        key_name: str,
+        key: str,
+        digests,
+        lengths,
+        file_hash: bytes | None = None,
+    ):
+        self.id = session_id  # pylint: disable=invalid-name
+        self.key_name = key_name
+        self.key = key
+        self.digests: list[bytes] = list(digests)
+        self.lengths: list[int] = list(lengths)
+        self.file_hash = file_hash or NO_HASH
+        # digests already in the network before this session touched them
+        self.present: set[bytes] = set()
+        # digests stored by this session, rolled back if it is abandoned
+        self.stored: set[bytes] = set()
+        self.lock = threading.Lock()
+        self.touch()
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def mark_present(self, digests):
+        self.present.update(digests)
+
+    def mark_stored(self, dkey: bytes):
+        self.stored.add(dkey)
+
+    def missing_parts(self) -> list[int]:
+        done = self.present | self.stored
+        return [i for i, d in enumerate(self.digests) if d not in done]
+
+    def manifest(self) -> Manifest:
+        return Manifest(
+            Manifest.pack_entries(self.digests, self.lengths),
+            total_length=sum(self.lengths),
+            file_hash=self.file_hash,
+            chunk_size=max(self.lengths, default=0),
+        )
+
+    def is_expired(self, ttl: float, now: float | None = None) -> bool:
+        now = time.monotonic() if now is None else now
+        return now - self.last_activity > ttl
+
+
+class UploadSessions:
+    """
+    Thread safe registry of the upload sessions opened on this node.
+    """
+
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+        self._sessions: dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+
+    def begin(
+        self, key_name: str, key: str, digests, lengths, file_hash=None
+    ) -> UploadSession:
+        session = UploadSession(
+            uuid.uuid4().hex, key_name, key, digests, lengths, file_hash
+        )
+        with self._lock:
+            self._sessions[session.id] = session
+        logger.info(f"upload session {session.id} opened for {key_name}")
+        return session
+
+    def get(self, session_id: str) -> UploadSession | None:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.is_expired(self.ttl):
+                return None
+            session.touch()
+            return session
+
+    def finish(self, session_id: str) -> UploadSession | None:
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def collect_expired(self) -> list[UploadSession]:
+        """
+        Remove and return the sessions without activity in the last ttl seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [s for s in self._sessions.values() if s.is_expired(self.ttl, now)]
+            for session in expired:
+                del self._sessions[session.id]
+        return expired
+
+    def __len__(self):
+        return len(self._sessions)
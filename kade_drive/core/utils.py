@@ -3,6 +3,7 @@ General catchall for functions that don't make sense as methods.
 """
 import datetime
 import hashlib
+import itertools
 import operator
 import logging
 import socket
@@ -35,6 +36,26 @@ def shared_prefix(args):
     return args[0][:i]
 
 
+def batched(iterable, size: int):
+    """
+    Yield lists with the items of iterable, size items at most each.
+    """
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def to_timestamp(date: datetime.datetime | None) -> int | None:
+    """
+    Convert a last_write date to whole seconds so it travels by value in RPCs.
+    """
+    return None if date is None else int(date.timestamp())
+
+
+def from_timestamp(timestamp: int | None) -> datetime.datetime | None:
+    return None if timestamp is None else datetime.datetime.fromtimestamp(timestamp)
+
+
 def bytes_to_bit_string(bites):
     bits = [bin(bite)[2:].rjust(8, "0") for bite in bites]
     return "".join(bits)
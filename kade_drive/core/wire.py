@@ -0,0 +1,206 @@
+"""
+Binary encoding of the hot RPCs between nodes.
+
+find_node, find_value, find_chunk_location, the store and check calls
+exchange plain bytes with a fixed schema instead of lists, dicts and
+datetimes, which rpyc would send as remote references (or pickle). Node
+triples are struct packed with their raw id, dates travel as int64
+timestamps and values as raw bytes, so the messages are small, cheap to
+build and need no pickle on the wire.
+
+Every message starts with a tag byte telling its kind.
+"""
+import struct
+
+# tags
+NODES = b"N"
+VALUE = b"V"
+LOCATION = b"L"
+
+# node id, port, ip length, followed by the ip
+NODE = struct.Struct(">20sHB")
+# port, ip length, followed by the ip
+ADDRESS = struct.Struct(">HB")
+COUNT = struct.Struct(">I")
+# key length, last write, is metadata, followed by the key
+CHECK_ENTRY = struct.Struct(">Bq?")
+# key length, last write, is metadata, key name length, value length,
+# storage class length, followed by the key, the key name, the storage class
+# and the value
+STORE_ENTRY = struct.Struct(">Bq?HIB")
+# contains, last write
+CHECK_RESULT = struct.Struct(">?q")
+
+# last write of the entries that have none
+NO_TIMESTAMP = -(2**63)
+
+
+def _timestamp(value: int | None) -> int:
+    return NO_TIMESTAMP if value is None else int(value)
+
+
+def _optional_timestamp(value: int) -> int | None:
+    return None if value == NO_TIMESTAMP else value
+
+
+def encode_nodes(nodes) -> bytes:
+    """
+    Encode (id, ip, port) triples, or Nodes.
+    """
+    parts = [NODES, COUNT.pack(len(nodes))]
+    for node_id, ip, port in map(tuple, nodes):
+        ip = str(ip).encode()
+        parts.append(NODE.pack(node_id, int(port), len(ip)))
+        parts.append(ip)
+    return b"".join(parts)
+
+
+def _decode_nodes(data: memoryview, offset: int) -> list[tuple[bytes, str, int]]:
+    (count,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    nodes = []
+    for _ in range(count):
+        node_id, port, ip_length = NODE.unpack_from(data, offset)
+        offset += NODE.size
+        ip = bytes(data[offset : offset + ip_length]).decode()
+        offset += ip_length
+        nodes.append((node_id, ip, port))
+    return nodes
+
+
+def encode_value(value: bytes) -> bytes:
+    if not isinstance(value, (bytes, bytearray)):
+        raise TypeError(f"values travel as bytes, not {type(value).__name__}")
+    return VALUE + value
+
+
+def encode_location(ip: str, port) -> bytes:
+    ip = str(ip).encode()
+    return LOCATION + ADDRESS.pack(int(port), len(ip)) + ip
+
+
+def decode_find_response(data: bytes | None):
+    """
+    Decode the answer of find_node, find_value or find_chunk_location to the
+    shape the crawlers expect: a list of (id, ip, port) triples, or a dict
+    {"value": v} with the value or the (ip, port) holding the chunk.
+    """
+    if data is None:
+        return None
+    data = bytes(data)
+    tag = data[:1]
+    if tag == VALUE:
+        return {"value": data[1:]}
+    view = memoryview(data)
+    if tag == LOCATION:
+        port, ip_length = ADDRESS.unpack_from(view, 1)
+        start = 1 + ADDRESS.size
+        return {"value": (bytes(view[start : start + ip_length]).decode(), port)}
+    if tag == NODES:
+        return _decode_nodes(view, 1)
+    raise ValueError(f"unknown message tag {tag!r}")
+
+
+def encode_check_entries(entries) -> bytes:
+    """
+    Encode (key, last_write timestamp, is_metadata) entries.
+    """
+    parts = [COUNT.pack(len(entries))]
+    for key, last_write, is_metadata in entries:
+        parts.append(CHECK_ENTRY.pack(len(key), _timestamp(last_write), is_metadata))
+        parts.append(key)
+    return b"".join(parts)
+
+
+def decode_check_entries(data: bytes) -> list[tuple[bytes, int | None, bool]]:
+    view = memoryview(bytes(data))
+    (count,) = COUNT.unpack_from(view, 0)
+    offset = COUNT.size
+    entries = []
+    for _ in range(count):
+        key_length, last_write, is_metadata = CHECK_ENTRY.unpack_from(view, offset)
+        offset += CHECK_ENTRY.size
+        key = bytes(view[offset : offset + key_length])
+        offset += key_length
+        entries.append((key, _optional_timestamp(last_write), is_metadata))
+    return entries
+
+
+def encode_store_entries(entries) -> bytes:
+    """
+    Encode (key, value, last_write timestamp, is_metadata, key_name,
+    storage_class) entries.
+    """
+    parts = [COUNT.pack(len(entries))]
+    for key, value, last_write, is_metadata, key_name, storage_class in entries:
+        key_name = str(key_name).encode()
+        storage_class = storage_class.encode()
+        parts.append(
+            STORE_ENTRY.pack(
+                len(key),
+                _timestamp(last_write),
+                is_metadata,
+                len(key_name),
+                len(value),
+                len(storage_class),
+            )
+        )
+        parts += [key, key_name, storage_class, value]
+    return b"".join(parts)
+
+
+def decode_store_entries(data: bytes):
+    view = memoryview(bytes(data))
+    (count,) = COUNT.unpack_from(view, 0)
+    offset = COUNT.size
+    entries = []
+    for _ in range(count):
+        (
+            key_length,
+            last_write,
+            is_metadata,
+            name_length,
+            value_length,
+            class_length,
+        ) = STORE_ENTRY.unpack_from(view, offset)
+        offset += STORE_ENTRY.size
+        key = bytes(view[offset : offset + key_length])
+        offset += key_length
+        key_name = bytes(view[offset : offset + name_length]).decode()
+        offset += name_length
+        storage_class = bytes(view[offset : offset + class_length]).decode()
+        offset += class_length
+        value = bytes(view[offset : offset + value_length])
+        offset += value_length
+        entries.append(
+            (
+                key,
+                value,
+                _optional_timestamp(last_write),
+                is_metadata,
+                key_name,
+                storage_class,
+            )
+        )
+    return entries
+
+
+def encode_flags(flags) -> bytes:
+    return bytes(map(bool, flags))
+
+
+def decode_flags(data: bytes | None) -> tuple[bool, ...] | None:
+    if data is None:
+        return None
+    return tuple(map(bool, data))
+
+
+def encode_check_result(contains: bool, last_write: int | None) -> bytes:
+    return CHECK_RESULT.pack(contains, _timestamp(last_write))
+
+
+def decode_check_result(data: bytes | None) -> tuple[bool, int | None] | None:
+    if data is None:
+        return None
+    contains, last_write = CHECK_RESULT.unpack(bytes(data))
+    return contains, _optional_timestamp(last_write)
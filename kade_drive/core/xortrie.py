@@ -0,0 +1,156 @@
+"""
+Binary trie over node ids answering k closest queries in XOR distance.
+"""
+from collections.abc import Iterator
+
+from kade_drive.core.node import Node
+
+
+class _Leaf:
+    __slots__ = ("key", "node")
+
+    def __init__(self, key: int, node: Node):
+        self.key = key
+        self.node = node
+
+
+class _Branch:
+    """
+    Keys below agree on every bit above bit and differ on it, children[0]
+    holds the ones with a 0 there.
+    """
+
+    __slots__ = ("bit", "children")
+
+    def __init__(self, bit: int, zero, one):
+        self.bit = bit
+        self.children = [zero, one]
+
+
+class XorTrie:
+    """
+    Path compressed (crit-bit) binary trie of nodes keyed by their long id.
+
+    Below a branch on bit b, the keys whose bit b matches the target's are
+    all closer to it than the others, so walking the trie taking that child
+    first yields the nodes by increasing XOR distance. The k closest ones are
+    the first k leaves of that walk, found in O(k log n) for random ids.
+
+    A change swaps a single child pointer, so a walk running meanwhile sees
+    the trie either before or after it, changes must still be serialized.
+    """
+
+    def __init__(self):
+        self._root: _Leaf | _Branch | None = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, node: Node):
+        leaf = self._nearest_leaf(node.long_id)
+        return leaf is not None and leaf.key == node.long_id
+
+    def __iter__(self) -> Iterator[Node]:
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            item = stack.pop()
+            if isinstance(item, _Leaf):
+                yield item.node
+            else:
+                stack.extend(item.children)
+
+    def _nearest_leaf(self, key: int) -> _Leaf | None:
+        """
+        The leaf reached following the bits of key, the one sharing the
+        longest prefix with it.
+        """
+        item = self._root
+        while isinstance(item, _Branch):
+            item = item.children[(key >> item.bit) & 1]
+        return item
+
+    def add(self, node: Node):
+        """
+        Add the node, replacing the one with the same id if any.
+        """
+        key = node.long_id
+        leaf = self._nearest_leaf(key)
+        if leaf is None:
+            self._root = _Leaf(key, node)
+            self._size = 1
+            return
+        if leaf.key == key:
+            leaf.node = node
+            return
+
+        # the highest bit where the new key leaves the existing ones
+        bit = (leaf.key ^ key).bit_length() - 1
+        new_leaf = _Leaf(key, node)
+        parent, side = None, 0
+        item = self._root
+        while isinstance(item, _Branch) and item.bit > bit:
+            parent, side = item, (key >> item.bit) & 1
+            item = item.children[side]
+        branch = (
+            _Branch(bit, item, new_leaf)
+            if (key >> bit) & 1
+            else _Branch(bit, new_leaf, item)
+        )
+        if parent is None:
+            self._root = branch
+        else:
+            parent.children[side] = branch
+        self._size += 1
+
+    def remove(self, node: Node) -> bool:
+        """
+        Remove the node with the id of node, False if there was none.
+        """
+        key = node.long_id
+        grandparent, parent_side = None, 0
+        parent, side = None, 0
+        item = self._root
+        while isinstance(item, _Branch):
+            grandparent, parent_side = parent, side
+            parent, side = item, (key >> item.bit) & 1
+            item = item.children[side]
+        if item is None or item.key != key:
+            return False
+
+        if parent is None:
+            self._root = None
+        else:
+            sibling = parent.children[1 - side]
+            if grandparent is None:
+                self._root = sibling
+            else:
+                grandparent.children[parent_side] = sibling
+        self._size -= 1
+        return True
+
+    def closest(
+        self, target: Node, k: int, exclude: Node | None = None
+    ) -> list[Node]:
+        """
+        The k nodes closest to target, closest first, leaving out the target
+        itself and the nodes at the same address as exclude.
+        """
+        key = target.long_id
+        result: list[Node] = []
+        stack = [self._root] if self._root is not None else []
+        while stack and len(result) < k:
+            item = stack.pop()
+            if isinstance(item, _Branch):
+                near = (key >> item.bit) & 1
+                # the far side is visited after the whole near side
+                stack.append(item.children[1 - near])
+                stack.append(item.children[near])
+                continue
+            node = item.node
+            if item.key == key:
+                continue
+            if exclude is not None and node.same_home_as(exclude):
+                continue
+            result.append(node)
+        return result
@@ -0,0 +1,55 @@
+import time
+
+from kade_drive.core.cache import CLOSEST, LOCATIONS, LookupCache
+from kade_drive.core.node import Node
+from kade_drive.core.routing import RoutingTable
+from kade_drive.core.utils import digest
+
+
+class TestLookupCache:
+    def test_get_and_expire(self):  # pylint: disable=no-self-use
+        cache = LookupCache(ttl=0.1)
+        nodes = [Node(digest(1), "10.0.0.1", "8086"), Node(digest(2), "10.0.0.2", 8086)]
+        cache.put(CLOSEST, b"key", nodes)
+        cache.put(LOCATIONS, b"key", [("10.0.0.3", 8086)])
+        assert cache.get(CLOSEST, b"key") == nodes
+        assert cache.get(LOCATIONS, b"key") == [("10.0.0.3", 8086)]
+        assert cache.get(CLOSEST, b"other") is None
+        time.sleep(0.15)
+        assert cache.get(CLOSEST, b"key") is None
+        assert len(cache) == 1
+        assert (cache.hits, cache.misses) == (2, 2)
+
+    def test_size_bound(self):  # pylint: disable=no-self-use
+        cache = LookupCache(max_entries=2)
+        for i in range(3):
+            cache.put(LOCATIONS, bytes([i]), [("10.0.0.1", 8086 + i)])
+            # the oldest one is the least recently used
+            cache.get(LOCATIONS, bytes([0]))
+        assert len(cache) == 2
+        assert cache.get(LOCATIONS, bytes([0])) is not None
+        assert cache.get(LOCATIONS, bytes([1])) is None
+
+    def test_invalidate(self):  # pylint: disable=no-self-use
+        cache = LookupCache()
+        peer = Node(digest(1), "10.0.0.1", "8086")
+        cache.put(CLOSEST, b"a", [peer, Node(digest(2), "10.0.0.2", 8086)])
+        cache.put(LOCATIONS, b"b", [("10.0.0.1", 8086)])
+        cache.put(LOCATIONS, b"c", [("10.0.0.2", 8086)])
+        cache.invalidate_node(peer)
+        assert cache.get(CLOSEST, b"a") is None
+        assert cache.get(LOCATIONS, b"b") is None
+        assert cache.get(LOCATIONS, b"c") is not None
+
+    def test_routing_table_invalidates(self):  # pylint: disable=no-self-use
+        cache = LookupCache()
+        table = RoutingTable(2, Node(digest(0), "10.0.0.9", 8086), cache)
+        peers = [Node(digest(i), "10.0.0.1", 8086 + i) for i in range(1, 4)]
+        table.add_contact(peers[0])
+        cache.put(CLOSEST, b"a", peers[:1])
+        cache.put(CLOSEST, b"b", peers[1:2])
+        table.remove_contact(peers[0])
+        assert cache.get(CLOSEST, b"a") is None
+        assert cache.get(CLOSEST, b"b") is not None
+        table.split_bucket(0)
+        assert len(cache) == 0
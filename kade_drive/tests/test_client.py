@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+from kade_drive.client import ClientSession
+from kade_drive.core.dataplane import DataPlaneServer
+
+CHUNKS = {b"chunk": b"value"}
+
+
+@pytest.fixture(scope="module")
+def data_port():
+    server = DataPlaneServer(CHUNKS.get, hostname="127.0.0.1")
+    threading.Thread(target=server.start, daemon=True).start()
+    yield server.port
+    server.close()
+
+
+class FakeRoot:
+    def __init__(self, data_port):
+        self.data_port = data_port
+
+    def get_data_port(self):
+        return self.data_port
+
+    def rpc_get_file_chunk_value(self, key):
+        return CHUNKS.get(key)
+
+
+class FakeConnection:
+    def __init__(self, data_port):
+        self.root = FakeRoot(data_port)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestReadChunk:
+    def test_rpc_connection_is_only_opened_when_needed(
+        self, data_port
+    ):  # pylint: disable=no-self-use
+        session = ClientSession([("127.0.0.1", 8086)], read_timeout=5)
+        opened = []
+
+        def open_connection(ip, port, timeout=None):
+            assert timeout == 5
+            opened.append(FakeConnection(data_port))
+            return opened[-1]
+
+        session._open_connection = open_connection
+        for _ in range(3):
+            assert session._read_chunk(("127.0.0.1", 8086), b"chunk") == b"value"
+        # only the first read asked for the data plane port
+        assert len(opened) == 1
+        assert opened[0].closed
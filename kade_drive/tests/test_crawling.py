@@ -0,0 +1,152 @@
+import threading
+import time
+
+import pytest
+
+from kade_drive.core.crawling import NodeSpiderCrawl, ValueSpiderCrawl
+from kade_drive.core.node import Node
+from kade_drive.core.pool import ConnectionPool
+from kade_drive.core.protocol import ServerSession
+from kade_drive.core.utils import digest
+
+
+class FakeConnection:
+    root = None
+    closed = False
+
+    def __init__(self):
+        self._config = {"sync_request_timeout": None}
+
+    def close(self):
+        self.closed = True
+
+
+class FakeNetwork:
+    """
+    Peers that answer find_node with every other peer after a delay.
+    """
+
+    def __init__(self, delays: dict[int, float]):
+        self.nodes = [Node(digest(port), "127.0.0.1", port) for port in delays]
+        self.delays = delays
+        self.holder = None
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def find_node(self, conn, peer, node):  # pylint: disable=unused-argument
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delays[peer.port])
+        with self.lock:
+            self.active -= 1
+        return [tuple(n) for n in self.nodes if n.id != peer.id]
+
+    # pylint: disable=unused-argument
+    def find_value(self, conn, peer, node, is_metadata):
+        nodes = self.find_node(conn, peer, node)
+        return {"value": b"value"} if peer.port == self.holder else nodes
+
+
+class FakeCrawl(NodeSpiderCrawl):
+    def __init__(self, network, *args):
+        super().__init__(*args)
+        self.network = network
+
+    def find(self):
+        return self._find(self.network.find_node, None)
+
+
+class FakeValueCrawl(ValueSpiderCrawl):
+    def __init__(self, network, *args):
+        super().__init__(*args)
+        self.network = network
+
+    def find(self, is_metadata=True):
+        return self._find(self.network.find_value, is_metadata)
+
+
+@pytest.fixture(autouse=True)
+def fake_pool(monkeypatch):
+    monkeypatch.setattr(
+        ServerSession, "pool", ConnectionPool(connect=lambda ip, port: FakeConnection())
+    )
+
+
+class TestSpiderCrawl:
+    def test_alpha_calls_run_concurrently(self):  # pylint: disable=no-self-use
+        network = FakeNetwork({port: 0.1 for port in range(9000, 9006)})
+        crawl = FakeCrawl(network, Node(digest("key")), network.nodes[:3], 6, 3)
+
+        result = crawl.find()
+        assert network.max_active > 1
+        assert {n.id for n in result} == {n.id for n in network.nodes}
+
+    def test_stalled_peer_times_out(self, monkeypatch):  # pylint: disable=no-self-use
+        monkeypatch.setattr(FakeCrawl, "rpc_timeout", 0.2)
+        delays = {9000: 0.01, 9001: 0.01, 9002: 2}
+        network = FakeNetwork(delays)
+        crawl = FakeCrawl(network, Node(digest("key")), network.nodes, 3, 3)
+
+        start = time.monotonic()
+        result = crawl.find()
+        assert time.monotonic() - start < 1
+        assert 9002 not in [n.port for n in result]
+
+    def test_deadline_returns_partial_result(
+        self, monkeypatch
+    ):  # pylint: disable=no-self-use
+        monkeypatch.setattr(FakeCrawl, "deadline", 0.3)
+        network = FakeNetwork({port: 0.2 for port in range(9000, 9012)})
+        crawl = FakeCrawl(network, Node(digest("key")), network.nodes[:1], 12, 1)
+
+        start = time.monotonic()
+        result = crawl.find()
+        assert time.monotonic() - start < 0.4
+        assert {n.id for n in result} == {n.id for n in network.nodes}
+
+    def test_max_rounds(self, monkeypatch):  # pylint: disable=no-self-use
+        monkeypatch.setattr(FakeCrawl, "max_rounds", 1)
+        network = FakeNetwork({port: 0 for port in range(9000, 9012)})
+        crawl = FakeCrawl(network, Node(digest("key")), network.nodes[:1], 12, 1)
+
+        result = crawl.find()
+        assert len(crawl.nearest.contacted) == 1
+        assert len(result) == 12
+
+    def test_max_in_flight(self, monkeypatch):  # pylint: disable=no-self-use
+        monkeypatch.setattr(FakeCrawl, "max_in_flight", 2)
+        network = FakeNetwork({port: 0.05 for port in range(9000, 9012)})
+        crawl = FakeCrawl(network, Node(digest("key")), network.nodes, 12, 6)
+
+        result = crawl.find()
+        assert network.max_active <= 2
+        assert len(result) == 12
+
+    def test_slow_value_holder_is_waited_for(
+        self, monkeypatch
+    ):  # pylint: disable=no-self-use
+        monkeypatch.setattr(FakeValueCrawl, "max_stale_rounds", 1)
+        delays = {port: 0.01 for port in range(9000, 9020)}
+        delays[9000] = 0.3
+        network = FakeNetwork(delays)
+        network.holder = 9000
+        crawl = FakeValueCrawl(network, Node(digest("key")), network.nodes[:3], 20, 3)
+
+        # the fast peers make the k closest stop changing while the holder
+        # is still answering
+        assert crawl.find() == b"value"
+
+    def test_stops_when_closest_do_not_improve(
+        self, monkeypatch
+    ):  # pylint: disable=no-self-use
+        monkeypatch.setattr(FakeCrawl, "max_stale_rounds", 2)
+        monkeypatch.setattr(FakeCrawl, "max_in_flight", 1)
+        network = FakeNetwork({port: 0 for port in range(9000, 9020)})
+        crawl = FakeCrawl(network, Node(digest("key")), network.nodes, 20, 1)
+
+        # every peer is known from the start, no answer improves the k closest
+        result = crawl.find()
+        assert len(crawl.nearest.contacted) == 2
+        assert len(result) == 20
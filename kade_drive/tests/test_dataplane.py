@@ -0,0 +1,95 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from kade_drive.core.dataplane import DataPlaneClient, DataPlaneServer
+from kade_drive.core.transport import RequestLimiter, ServerBusy
+
+CHUNKS = {b"small": b"value", b"empty": b"", b"big": os.urandom(8 * 1024 * 1024)}
+
+
+@pytest.fixture(scope="module")
+def data_port():
+    server = DataPlaneServer(CHUNKS.get, hostname="127.0.0.1")
+    threading.Thread(target=server.start, daemon=True).start()
+    yield server.port
+    server.close()
+
+
+class FakeRoot:
+    def __init__(self, data_port):
+        self.data_port = data_port
+        self.rpc_reads = 0
+
+    def get_data_port(self):
+        if self.data_port is None:
+            raise AttributeError("get_data_port")
+        return self.data_port
+
+    def rpc_get_file_chunk_value(self, key):
+        self.rpc_reads += 1
+        return CHUNKS.get(key)
+
+
+class TestDataPlane:
+    def test_fetch(self, data_port):  # pylint: disable=no-self-use
+        client = DataPlaneClient()
+        for key, value in CHUNKS.items():
+            assert client.fetch("127.0.0.1", data_port, key) == value
+        assert client.fetch("127.0.0.1", data_port, b"missing") is None
+        # one connection reused for every request
+        assert len(client._idle[("127.0.0.1", data_port)]) == 1
+        client.close_all()
+
+    def test_busy(self):  # pylint: disable=no-self-use
+        limiter = RequestLimiter(workers=0, max_queued=0)
+        server = DataPlaneServer(CHUNKS.get, hostname="127.0.0.1", limiter=limiter)
+        threading.Thread(target=server.start, daemon=True).start()
+        client = DataPlaneClient()
+        with pytest.raises(ServerBusy):
+            client.fetch("127.0.0.1", server.port, b"small")
+        # the connection is still usable
+        limiter.workers = 1
+        assert client.fetch("127.0.0.1", server.port, b"small") == b"value"
+        server.close()
+
+    def test_read_falls_back_to_rpc(self, data_port):  # pylint: disable=no-self-use
+        client = DataPlaneClient()
+        root = FakeRoot(data_port)
+        assert client.read(root, "127.0.0.1", 8086, b"small") == b"value"
+        assert root.rpc_reads == 0
+
+        old_peer = FakeRoot(None)
+        assert client.read(old_peer, "127.0.0.1", 8087, b"small") == b"value"
+        assert old_peer.rpc_reads == 1
+
+    def test_failed_data_plane_is_not_retried_at_once(
+        self, data_port
+    ):  # pylint: disable=no-self-use
+        client = DataPlaneClient(retry_after=60)
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            closed_port = unused.getsockname()[1]
+        root = FakeRoot(closed_port)
+        root.port_requests = 0
+        get_data_port = root.get_data_port
+
+        def counted():
+            root.port_requests += 1
+            return get_data_port()
+
+        root.get_data_port = counted
+        for _ in range(3):
+            assert client.read(root, "127.0.0.1", 8088, b"small") == b"value"
+        assert root.port_requests == 1
+        assert root.rpc_reads == 3
+
+        # once the backoff expires the port is asked again
+        client.retry_after = 0
+        client._retry_at[("127.0.0.1", 8088)] = 0  # pylint: disable=protected-access
+        root.data_port = data_port
+        assert client.read(root, "127.0.0.1", 8088, b"small") == b"value"
+        assert root.port_requests == 2
+        assert root.rpc_reads == 3
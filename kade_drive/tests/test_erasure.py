@@ -0,0 +1,59 @@
+import os
+from itertools import combinations
+
+import pytest
+
+from kade_drive.core.erasure import (
+    ReedSolomon,
+    gf_invert_matrix,
+    gf_mul,
+    gf_inv,
+    pad_fragments,
+)
+
+pytest.importorskip("numpy")
+
+
+class TestGaloisField:
+    def test_inverse(self):  # pylint: disable=no-self-use
+        for a in range(1, 256):
+            assert gf_mul(a, gf_inv(a)) == 1
+
+    def test_invert_matrix(self):  # pylint: disable=no-self-use
+        matrix = [[1, 2, 3], [4, 5, 6], [7, 8, 10]]
+        inverse = gf_invert_matrix(matrix)
+        for i in range(3):
+            for j in range(3):
+                value = 0
+                for k in range(3):
+                    value ^= gf_mul(matrix[i][k], inverse[k][j])
+                assert value == int(i == j)
+
+
+class TestReedSolomon:
+    def test_encode_is_systematic(self):  # pylint: disable=no-self-use
+        codec = ReedSolomon(3, 2)
+        data = [os.urandom(64) for _ in range(3)]
+        parity = codec.encode(data)
+        assert len(parity) == 2
+        assert all(len(p) == 64 for p in parity)
+        assert codec.decode(dict(enumerate(data))) == data
+
+    def test_decode_any_subset(self):  # pylint: disable=no-self-use
+        codec = ReedSolomon(4, 2)
+        data = [os.urandom(100) for _ in range(4)]
+        fragments = dict(enumerate(data + codec.encode(data)))
+        for kept in combinations(range(6), 4):
+            assert codec.decode({i: fragments[i] for i in kept}) == data
+
+    def test_not_enough_fragments(self):  # pylint: disable=no-self-use
+        codec = ReedSolomon(4, 2)
+        data = [os.urandom(10) for _ in range(4)]
+        fragments = dict(enumerate(data + codec.encode(data)))
+        with pytest.raises(ValueError):
+            codec.decode({i: fragments[i] for i in (1, 2, 5)})
+
+    def test_pad_fragments(self):  # pylint: disable=no-self-use
+        fragments, size = pad_fragments([b"abc", b"a"])
+        assert size == 3
+        assert fragments == [b"abc", b"a\0\0"]
@@ -0,0 +1,57 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from kade_drive.core.hedging import HedgeBudget, first_answer
+from kade_drive.core.peerstats import PeerStats
+
+DELAYS = {"slow": 1.0, "fast": 0.0, "empty": 0.0, "broken": 0.0}
+
+
+def read(candidate):
+    time.sleep(DELAYS[candidate])
+    if candidate == "broken":
+        raise EOFError("connection lost")
+    if candidate == "empty":
+        return None
+    return candidate.encode()
+
+
+class TestHedging:
+    def test_slow_replica_is_hedged(self):  # pylint: disable=no-self-use
+        budget = HedgeBudget(ratio=0.1, burst=1)
+        executor = ThreadPoolExecutor(max_workers=4)
+        start = time.monotonic()
+        value = first_answer(["slow", "fast"], read, lambda _: 0.05, budget, executor)
+        assert value == b"fast"
+        assert time.monotonic() - start < 0.5
+        assert budget.hedges == 1
+
+        # the budget is spent, the next read waits for the slow replica
+        value = first_answer(["slow", "fast"], read, lambda _: 0.05, budget, executor)
+        assert value == b"slow"
+        assert budget.hedges == 1
+        assert budget.requests == 2
+
+    def test_failed_reads_go_to_the_next(self):  # pylint: disable=no-self-use
+        executor = ThreadPoolExecutor(max_workers=4)
+        value = first_answer(
+            ["broken", "empty", "fast"], read, lambda _: 10, HedgeBudget(), executor
+        )
+        assert value == b"fast"
+        assert first_answer(["empty"], read, lambda _: 10, HedgeBudget(), executor) is None
+
+    def test_budget_caps_hedge_rate(self):  # pylint: disable=no-self-use
+        budget = HedgeBudget(ratio=0.1, burst=2)
+        hedges = 0
+        for _ in range(100):
+            budget.on_request()
+            hedges += budget.try_hedge()
+        assert hedges <= 2 + 0.1 * 100
+
+    def test_percentile(self):  # pylint: disable=no-self-use
+        stats = PeerStats()
+        assert stats.percentile("10.0.0.1", 8086) == stats.default_rtt
+        for i in range(100):
+            stats.record("10.0.0.1", 8086, i / 1000, True)
+        # only the last 64 samples are kept
+        assert stats.percentile("10.0.0.1", 8086, 0.95) == 0.096
@@ -0,0 +1,84 @@
+import pytest
+
+from kade_drive.core.manifest import (
+    CODEC_REED_SOLOMON,
+    HEADER,
+    Manifest,
+)
+from kade_drive.core.utils import digest
+
+
+def chunks_of(data: bytes, size: int):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class TestManifest:
+    def test_roundtrip(self):  # pylint: disable=no-self-use
+        chunks = chunks_of(bytes(range(256)) * 10, 500)
+        manifest = Manifest.for_chunks(chunks, 500)
+        decoded = Manifest.decode(manifest.encode())
+
+        assert decoded.digests() == [digest(c) for c in chunks]
+        assert decoded.total_length == 2560
+        assert decoded.file_hash == digest(b"".join(chunks))
+        assert decoded.chunk_size == 500
+        assert decoded.entry(5) == (digest(chunks[5]), 60)
+        with pytest.raises(IndexError):
+            decoded.entry(6)
+
+    def test_invalid(self):  # pylint: disable=no-self-use
+        encoded = Manifest.for_chunks([b"a", b"b"]).encode()
+        with pytest.raises(ValueError):
+            Manifest.decode(b"XXXX" + encoded[4:])
+        with pytest.raises(ValueError):
+            Manifest.decode(encoded[:-1])
+        with pytest.raises(ValueError):
+            Manifest.decode(encoded[: HEADER.size - 1])
+
+    def test_split_and_join(self):  # pylint: disable=no-self-use
+        chunks = [bytes([i]) for i in range(10)]
+        manifest = Manifest.for_chunks(chunks)
+
+        same, subs = manifest.split(10)
+        assert same is manifest and subs == []
+
+        index, subs = manifest.split(4)
+        assert index.is_index
+        assert len(subs) == 3
+        assert [count for _, count in index] == [4, 4, 2]
+        assert index.digests() == [digest(s) for s in subs]
+
+        decoded = Manifest.decode(index.encode())
+        joined = decoded.join([Manifest.decode(s) for s in subs])
+        assert not joined.is_index
+        assert joined.digests() == manifest.digests()
+        assert joined.file_hash == manifest.file_hash
+
+    def test_groups(self):  # pylint: disable=no-self-use
+        # 5 chunks of 4 bytes in groups of 2 data + 1 parity fragments
+        digests = [digest(i) for i in range(8)]
+        lengths = [4] * 8
+        manifest = Manifest(
+            Manifest.pack_entries(digests, lengths),
+            total_length=18,
+            codec=CODEC_REED_SOLOMON,
+            chunk_size=4,
+            data_shards=2,
+            parity_shards=1,
+        )
+        groups = list(Manifest.decode(manifest.encode()).groups())
+
+        assert [g[0] for g in groups] == [2, 2, 1]
+        assert [g[2] for g in groups] == [8, 8, 2]
+        assert groups[2][3] == tuple(digests[6:8])
+
+    def test_inline(self):  # pylint: disable=no-self-use
+        manifest = Manifest.inline(b"small file")
+        decoded = Manifest.decode(manifest.encode())
+
+        assert decoded.is_inline
+        assert decoded.payload == b"small file"
+        assert decoded.file_hash == digest(b"small file")
+        assert len(decoded) == 0
+        with pytest.raises(ValueError):
+            Manifest.decode(manifest.encode()[:-1])
@@ -2,7 +2,9 @@ import random
 import hashlib
 
 
-from kade_drive.core.node import Node, NodeHeap
+import pytest
+
+from kade_drive.core.node import Node, NodeHeap, peer_node
 
 
 class TestNode:
@@ -20,6 +22,24 @@ class TestNode:
         ntwo = Node(ridtwo.digest())
         assert none.distance_to(ntwo) == shouldbe
 
+    def test_identity_is_the_id(self):  # pylint: disable=no-self-use
+        first = Node(b"\x01" * 20, "10.0.0.1", 8086)
+        same_id = Node(b"\x01" * 20, "10.0.0.2", 8087)
+        same_home = Node(b"\x02" * 20, "10.0.0.1", 8086)
+        assert first == same_id
+        assert first != same_home
+        assert len({first, same_id, same_home}) == 2
+        assert tuple(first) == (b"\x01" * 20, "10.0.0.1", 8086)
+        with pytest.raises(AttributeError):
+            first.extra = 1
+
+    def test_peer_node_is_interned(self):  # pylint: disable=no-self-use
+        node_id = hashlib.sha1(b"peer").digest()
+        assert peer_node(node_id, "10.0.0.1", 8086) is peer_node(
+            node_id, "10.0.0.1", 8086
+        )
+        assert peer_node(node_id, "10.0.0.2", 8086).ip == "10.0.0.2"
+
 
 class TestNodeHeap:
     def test_max_size(self, mknode):  # pylint: disable=no-self-use
@@ -52,3 +72,26 @@ class TestNodeHeap:
         for index, node in enumerate(heap):
             assert index + 2 == node.long_id
             assert index < 5
+
+    def test_index_and_lazy_removal(self, mknode):  # pylint: disable=no-self-use
+        heap = NodeHeap(mknode(intid=0), 3)
+        nodes = [mknode(intid=x) for x in range(100)]
+        heap.push(nodes)
+        heap.push(nodes[:10])
+        assert nodes[50] in heap
+        assert heap.get_node(nodes[50].id) is nodes[50]
+
+        heap.remove([n.id for n in nodes[:90]])
+        assert nodes[50] not in heap
+        assert heap.get_node(nodes[50].id) is None
+        # stale entries were compacted away
+        assert len(heap.heap) == 10
+        assert [n.long_id for n in heap] == [90, 91, 92]
+
+        # a removed node pushed again is visible once
+        heap.push(nodes[1])
+        assert [n.long_id for n in heap] == [1, 90, 91]
+        heap.remove([nodes[90].id])
+        assert heap.popleft() is nodes[1]
+        assert heap.popleft() is nodes[91]
+        assert heap.get_ids() == [n.id for n in nodes[92:95]]
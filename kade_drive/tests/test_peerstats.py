@@ -0,0 +1,56 @@
+import pytest
+
+from kade_drive.core.peerstats import PeerStats
+
+
+class TestPeerStats:
+    def test_rtt_and_order(self):  # pylint: disable=no-self-use
+        stats = PeerStats(weight=0.5)
+        for _ in range(5):
+            stats.record("10.0.0.1", 8086, 0.2, True)
+            stats.record("10.0.0.2", "8086", 0.01, True)
+        assert stats.rtt("10.0.0.1", 8086) == pytest.approx(0.2)
+        assert stats.rtt("10.0.0.3", 8086) == stats.default_rtt
+        assert stats.order([("10.0.0.1", 8086), ("10.0.0.2", 8086)]) == [
+            ("10.0.0.2", 8086),
+            ("10.0.0.1", 8086),
+        ]
+
+    def test_errors_and_load_lower_the_score(self):  # pylint: disable=no-self-use
+        stats = PeerStats()
+        stats.record("10.0.0.1", 8086, 0.1, True)
+        stats.record("10.0.0.2", 8086, 0.1, True)
+        base = stats.score("10.0.0.1", 8086)
+        stats.record("10.0.0.1", 8086, 0, False)
+        assert stats.score("10.0.0.1", 8086) > base
+
+        with stats.track("10.0.0.2", 8086):
+            assert stats.score("10.0.0.2", 8086) == pytest.approx(2 * base)
+        with pytest.raises(ValueError):
+            with stats.track("10.0.0.2", 8086):
+                raise ValueError()
+        assert stats.score("10.0.0.2", 8086) > base
+
+    def test_timeout(self):  # pylint: disable=no-self-use
+        stats = PeerStats(min_timeout=0.5)
+        assert stats.timeout("10.0.0.1", 8086, 10) == 10
+        stats.record("10.0.0.1", 8086, 0.1, True)
+        assert stats.timeout("10.0.0.1", 8086, 10) == 0.5
+        stats.record("10.0.0.1", 8086, 1, True)
+        timeout = stats.timeout("10.0.0.1", 8086, 10)
+        assert 0.5 < timeout < 10
+        # failures back the timeout off
+        stats.record("10.0.0.1", 8086, 0, False)
+        assert stats.timeout("10.0.0.1", 8086, 10) > timeout
+
+    def test_seed_and_last_seen(self):  # pylint: disable=no-self-use
+        stats = PeerStats(min_timeout=0.5)
+        stats.seed("10.0.0.1", 8086, 0.2)
+        assert stats.rtt("10.0.0.1", 8086) == pytest.approx(0.2)
+        assert stats.timeout("10.0.0.1", 8086, 10) < 10
+        assert stats.last_seen("10.0.0.1", 8086) is None
+        stats.record("10.0.0.1", 8086, 0.1, True)
+        assert stats.last_seen("10.0.0.1", 8086) is not None
+        # measured round trips are not replaced by seeds
+        stats.seed("10.0.0.1", 8086, 5)
+        assert stats.rtt("10.0.0.1", 8086) < 0.2
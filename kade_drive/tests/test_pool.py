@@ -0,0 +1,123 @@
+import time
+
+from kade_drive.core.peerstats import PeerStats
+from kade_drive.core.pool import ConnectionPool
+from kade_drive.core.protocol import ServerSession
+
+
+class FakeConnection:
+    def __init__(self, address, alive=True):
+        self.address = address
+        self.alive = alive
+        self.closed = False
+
+    def ping(self, timeout=3):
+        if not self.alive:
+            raise EOFError("connection closed by peer")
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    opened = []
+
+    def connect(ip, port):
+        conn = FakeConnection((ip, port))
+        opened.append(conn)
+        return conn
+
+    return ConnectionPool(connect=connect, **kwargs), opened
+
+
+class TestConnectionPool:
+    def test_reuse(self):  # pylint: disable=no-self-use
+        pool, opened = make_pool()
+        conn = pool.acquire("127.0.0.1", "8086")
+        pool.release(conn, "127.0.0.1", 8086)
+        assert pool.acquire("127.0.0.1", 8086) is conn
+        assert len(opened) == 1
+        assert pool.open_connections == 1
+
+    def test_max_idle_per_peer(self):  # pylint: disable=no-self-use
+        pool, _ = make_pool(max_idle_per_peer=1)
+        first = pool.acquire("127.0.0.1", 8086)
+        second = pool.acquire("127.0.0.1", 8086)
+        pool.release(first, "127.0.0.1", 8086)
+        pool.release(second, "127.0.0.1", 8086)
+        assert second.closed
+        assert pool.idle_connections("127.0.0.1", 8086) == 1
+        assert pool.open_connections == 1
+
+    def test_health_check(self):  # pylint: disable=no-self-use
+        pool, opened = make_pool(health_check_after=0)
+        conn = pool.acquire("127.0.0.1", 8086)
+        pool.release(conn, "127.0.0.1", 8086)
+        conn.alive = False
+        assert pool.acquire("127.0.0.1", 8086) is opened[1]
+        assert conn.closed
+        assert pool.open_connections == 1
+
+    def test_evict_on_failure(self):  # pylint: disable=no-self-use
+        pool, _ = make_pool()
+        idle = pool.acquire("127.0.0.1", 8086)
+        failed = pool.acquire("127.0.0.1", 8086)
+        pool.release(idle, "127.0.0.1", 8086)
+        pool.release(failed, "127.0.0.1", 8086, healthy=False)
+        assert idle.closed and failed.closed
+        assert pool.open_connections == 0
+
+    def test_global_cap(self):  # pylint: disable=no-self-use
+        pool, _ = make_pool(max_connections=2, acquire_timeout=0.01)
+        first = pool.acquire("127.0.0.1", 8086)
+        pool.acquire("127.0.0.1", 8087)
+        assert pool.acquire("127.0.0.1", 8088) is None
+
+        # idle connections of other peers are closed to make room
+        pool.release(first, "127.0.0.1", 8086)
+        assert pool.acquire("127.0.0.1", 8088) is not None
+        assert first.closed
+        assert pool.open_connections == 2
+
+    def test_sweep(self):  # pylint: disable=no-self-use
+        pool, _ = make_pool(idle_timeout=0)
+        conn = pool.acquire("127.0.0.1", 8086)
+        pool.release(conn, "127.0.0.1", 8086)
+        pool.sweep()
+        assert conn.closed
+        assert pool.open_connections == 0
+
+
+class FakeRoot:
+    def rpc_ping(self):
+        return "pong"
+
+    def rpc_lost(self):
+        raise EOFError("connection closed by peer")
+
+
+class TestServerSession:
+    def test_calls_are_recorded_not_sessions(
+        self, monkeypatch
+    ):  # pylint: disable=no-self-use
+        pool, _ = make_pool()
+        monkeypatch.setattr(ServerSession, "pool", pool)
+        monkeypatch.setattr(ServerSession, "peer_stats", PeerStats())
+        monkeypatch.setattr(FakeConnection, "root", FakeRoot(), raising=False)
+        stats = ServerSession.peer_stats
+
+        with ServerSession("127.0.0.1", 8086) as conn:
+            # work between the calls, like a handoff, is not round trip time
+            time.sleep(0.2)
+            assert conn.rpc_ping() == "pong"
+            assert conn.rpc_ping() == "pong"
+        assert stats.rtt("127.0.0.1", 8086) < 0.1
+        assert stats.last_seen("127.0.0.1", 8086) is not None
+
+        try:
+            with ServerSession("127.0.0.1", 8087) as conn:
+                conn.rpc_lost()
+        except EOFError:
+            pass
+        assert stats.rtt("127.0.0.1", 8087) == stats.default_rtt
+        assert stats.score("127.0.0.1", 8087) > stats.default_rtt
@@ -1,5 +1,7 @@
-from random import shuffle
-from kade_drive.core.routing import KBucket, TableTraverser
+import threading
+from random import randrange, shuffle
+from kade_drive.core.routing import KBucket, RoutingTable, TableTraverser
+from kade_drive.core.utils import shared_prefix, bytes_to_bit_string
 
 
 class TestKBucket:
@@ -78,6 +80,32 @@ class TestKBucket:
         assert list(replacement_nodes.values()) == nodes[k + 1 :]
         assert nodes[k] not in list(replacement_nodes.values())
 
+    def test_depth(self, mknode):  # pylint: disable=no-self-use
+        def string_depth(bucket):
+            bits = [bytes_to_bit_string(n.id) for n in bucket.get_nodes()]
+            return len(shared_prefix(bits))
+
+        bucket = KBucket(0, 2**160, 20)
+        assert bucket.depth() == 0
+        prefix = randrange(2**140) << 20
+        nodes = [
+            mknode(node_id=(prefix | randrange(2**20)).to_bytes(20, "big"))
+            for _ in range(25)
+        ]
+        for node in nodes:
+            bucket.add_node(node)
+            assert bucket.depth() == string_depth(bucket)
+        for node in nodes[:10]:
+            bucket.remove_node(node)
+            assert bucket.depth() == string_depth(bucket)
+        one, two = bucket.split()
+        for half in (one, two):
+            if len(half):
+                assert half.depth() == string_depth(half)
+        single = KBucket(0, 10, 5)
+        single.add_node(mknode(intid=5))
+        assert single.depth() == 32
+
 
 # pylint: disable=too-few-public-methods
 class TestRoutingTable:
@@ -87,6 +115,69 @@ class TestRoutingTable:
         assert len(fake_server.router.buckets) == 1
         assert len(fake_server.router.buckets[0].nodes) == 1
 
+    # pylint: disable=no-self-use
+    def test_get_bucket_for(self, fake_server, mknode):
+        router = fake_server.router
+        for _ in range(200):
+            router.split_bucket(randrange(len(router.buckets)))
+        for node in [mknode() for _ in range(500)] + [mknode(intid=0)]:
+            expected = next(
+                index
+                for index, bucket in enumerate(router.buckets)
+                if node.long_id < bucket.range[1]
+            )
+            assert router.get_bucket_for(node) == expected
+
+    # pylint: disable=no-self-use
+    def test_concurrent_readers_and_writers(self, mknode):
+        # buckets big enough to always split rather than ping their head
+        router = RoutingTable(100, mknode())
+        nodes = [mknode() for _ in range(2000)]
+        errors = []
+        done = threading.Event()
+
+        def write(part):
+            try:
+                for node in part:
+                    router.add_contact(node)
+                for node in part[::3]:
+                    router.remove_contact(node)
+            except Exception as error:  # pylint: disable=broad-except
+                errors.append(error)
+
+        def read():
+            try:
+                while not done.is_set():
+                    buckets, upper_bounds = router._view  # pylint: disable=protected-access
+                    assert len(buckets) == len(upper_bounds)
+                    assert all(
+                        a.range[1] < b.range[0] for a, b in zip(buckets, buckets[1:])
+                    )
+                    target = mknode()
+                    found = router.find_neighbors(target, 20)
+                    assert len(found) == len(set(found)) <= 20
+            except Exception as error:  # pylint: disable=broad-except
+                errors.append(error)
+
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        writers = [threading.Thread(target=write, args=(nodes[i::4],)) for i in range(4)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        assert not errors
+        contacts = [n for bucket in router.buckets for n in bucket.get_nodes()]
+        assert len(contacts) == len(set(contacts))
+        assert all(
+            router.get_bucket_for(node) == index
+            for index, bucket in enumerate(router.buckets)
+            for node in bucket.get_nodes()
+        )
+
 
 # pylint: disable=too-few-public-methods
 class TestTableTraverser:
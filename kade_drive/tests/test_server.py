@@ -1 +1,179 @@
+import pickle
 
+import pytest
+
+from kade_drive.core.config import Config
+from kade_drive.core.network import Server, ServerService
+from kade_drive.core.node import Node
+from kade_drive.core.pool import ConnectionPool
+from kade_drive.core.protocol import FileSystemProtocol, ServerSession
+from kade_drive.core.routing import RoutingTable
+from kade_drive.core.storage import PersistentStorage
+from kade_drive.core.upload import UploadSessions
+from kade_drive.core.utils import digest
+from kade_drive.core.transport import RequestLimiter, ServerBusy
+
+
+class TestServerService:
+    def test_cheap_rpcs_skip_the_limiter(
+        self, monkeypatch
+    ):  # pylint: disable=no-self-use
+        # every worker is taken and nothing may queue
+        limiter = RequestLimiter(workers=0, max_queued=0)
+        monkeypatch.setattr(Server, "limiter", limiter)
+        monkeypatch.setattr(Server, "data_plane", None)
+        resolve = ServerService()._rpyc_getattr  # pylint: disable=protected-access
+
+        assert resolve("get_data_port")() is None
+        with pytest.raises(ServerBusy):
+            resolve("exposed_get")(b"key")
+        assert limiter.rejected == 1
+
+    def test_set_key_stores_bytes(self, monkeypatch):  # pylint: disable=no-self-use
+        stored = {}
+
+        def set_digest(dkey, value):
+            stored[dkey] = value
+            return True
+
+        monkeypatch.setattr(Server, "set_digest", set_digest)
+        service = ServerService()
+        for value in (5, 2.5, True, "text"):
+            assert service.set_key("key", value)
+            assert pickle.loads(stored[digest("key")]) == value
+        assert service.set_key("key", b"raw")
+        assert stored[digest("key")] == b"raw"
+
+
+def storage_in(path) -> PersistentStorage:
+    storage = PersistentStorage()
+    storage.db_path = str(path / "static")
+    storage.values_path = str(path / "static/values")
+    storage.metadata_path = str(path / "static/metadata")
+    storage.keys_path = str(path / "static/keys")
+    storage.timestamp_path = str(path / "timestamps")
+    storage.ensure_dir_paths()
+    return storage
+
+
+class FakeConnection:
+    root = None
+    closed = False
+
+    def __init__(self):
+        self._config = {"sync_request_timeout": None}
+
+    def close(self):
+        self.closed = True
+
+
+class TestRejoin:
+    def test_failed_pings_do_not_stop_the_others(
+        self, monkeypatch
+    ):  # pylint: disable=no-self-use
+        router = RoutingTable(20, Node(digest("me")))
+        monkeypatch.setattr(Server, "config", Config(), raising=False)
+        monkeypatch.setattr(FileSystemProtocol, "router", router)
+        monkeypatch.setattr(
+            ServerSession,
+            "pool",
+            ConnectionPool(connect=lambda ip, port: FakeConnection()),
+        )
+        contacts = [Node(digest(i), "10.0.0.2", 9000 + i) for i in range(6)]
+
+        def ping(conn, node):
+            if node.port % 2:
+                raise EOFError("connection closed by peer")
+            router.add_contact(node)
+            return node.id
+
+        monkeypatch.setattr(FileSystemProtocol, "call_ping", ping)
+        assert Server.rejoin([(node, 0, None) for node in contacts]) == 3
+
+
+class TestHandoff:
+    def test_erasure_fragments_keep_their_class(
+        self, monkeypatch, tmp_path
+    ):  # pylint: disable=no-self-use
+        monkeypatch.chdir(tmp_path)
+        sender = storage_in(tmp_path / "sender")
+        receiver = storage_in(tmp_path / "receiver")
+        sender.set_value(digest("fragment"), b"shard", False, storage_class="erasure")
+        sender.set_value(digest("chunk"), b"chunk", False)
+        sender.confirm_integrity(digest("fragment"), False)
+        sender.confirm_integrity(digest("chunk"), False)
+
+        me = Node(digest("me"), "127.0.0.1", 9000)
+        FileSystemProtocol.init(RoutingTable(20, me), sender)
+        monkeypatch.setattr(Server, "storage", receiver, raising=False)
+        monkeypatch.setattr(FakeConnection, "root", ServerService(), raising=False)
+        monkeypatch.setattr(
+            ServerSession,
+            "pool",
+            ConnectionPool(connect=lambda ip, port: FakeConnection()),
+        )
+
+        FileSystemProtocol.handoff(Node(digest("new"), "127.0.0.1", 9001))
+        assert receiver.get(digest("fragment"), metadata=False) == b"shard"
+        assert receiver.get_storage_class(digest("fragment"), False) == "erasure"
+        assert receiver.get_storage_class(digest("chunk"), False) == "replicated"
+
+
+@pytest.fixture()
+def fake_network(monkeypatch):
+    """
+    Chunks stored and deleted by the server, without a network.
+    """
+    stored = set()
+    config = Config(chunk_size=10, inline_threshold=0, manifest_max_entries=1)
+    monkeypatch.setattr(Server, "config", config, raising=False)
+    monkeypatch.setattr(Server, "upload_sessions", UploadSessions(), raising=False)
+    monkeypatch.setattr(Server, "probe_chunks", lambda dkeys: set())
+    monkeypatch.setattr(Server, "next_last_write", lambda dkey: None)
+    monkeypatch.setattr(Server, "confirm_integrity_of_data", lambda dkey, m: True)
+    monkeypatch.setattr(
+        Server,
+        "set_digest",
+        lambda dkey, value, metadata=True, **kwargs: stored.add(dkey) or True,
+    )
+    monkeypatch.setattr(
+        Server,
+        "set_digest_many",
+        lambda entries, *args: {e[0] for e in entries if not stored.add(e[0])},
+    )
+    monkeypatch.setattr(
+        Server,
+        "delete_data_from_network",
+        lambda key, is_metadata=True: stored.discard(key) or True,
+    )
+    return stored
+
+
+class TestManifestTooLarge:
+    # with one entry per record, three chunks need an index of three entries
+    DATA = b"x" * 10 + b"y" * 10 + b"z" * 10
+
+    def test_upload_file(self, fake_network):  # pylint: disable=no-self-use
+        assert ServerService().upload_file("file", "file", self.DATA) is False
+        assert not fake_network
+
+    def test_commit_upload(self, fake_network):  # pylint: disable=no-self-use
+        service = ServerService()
+        chunks = [self.DATA[i : i + 10] for i in range(0, 30, 10)]
+        session_id, missing = service.begin_upload(
+            "file", "file", [digest(c) for c in chunks], [len(c) for c in chunks]
+        )
+        for index in missing:
+            assert service.upload_part(session_id, index, chunks[index])
+        assert len(fake_network) == 3
+
+        assert service.commit_upload(session_id) is False
+        assert not fake_network
+        assert Server.upload_sessions.get(session_id) is None
+
+    def test_overwrite_file(
+        self, monkeypatch, fake_network
+    ):  # pylint: disable=no-self-use
+        monkeypatch.setattr(Server, "find_metadata", lambda dkey: None)
+        assert ServerService().overwrite_file("file", "file", self.DATA) is False
+        assert not fake_network
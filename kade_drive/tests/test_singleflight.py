@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from kade_drive.core.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_execution(self):  # pylint: disable=no-self-use
+        flights = SingleFlight()
+        executions = []
+
+        def lookup(key):
+            executions.append(key)
+            time.sleep(0.2)
+            return key.upper()
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(flights.do("get", "key", lookup, "key"))
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert executions == ["key"]
+        assert results == ["KEY"] * 5
+        assert flights.in_flight() == 0
+        assert flights.metrics()["get"] == {
+            "requests": 5,
+            "executions": 1,
+            "coalesced": 4,
+            "ratio": 0.8,
+        }
+
+    def test_keys_and_operations_are_independent(self):  # pylint: disable=no-self-use
+        flights = SingleFlight()
+        assert flights.do("get", "a", str.upper, "a") == "A"
+        assert flights.do("get", "b", str.upper, "b") == "B"
+        assert flights.do("chunk_location", "a", str.lower, "A") == "a"
+        assert flights.metrics()["get"]["coalesced"] == 0
+        assert flights.metrics()["chunk_location"]["requests"] == 1
+
+    def test_error_is_shared(self):  # pylint: disable=no-self-use
+        flights = SingleFlight()
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.2)
+            raise EOFError("lost")
+
+        errors = []
+
+        def follower():
+            started.wait()
+            try:
+                flights.do("get", "key", fail)
+            except EOFError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=follower)
+        thread.start()
+        with pytest.raises(EOFError):
+            flights.do("get", "key", fail)
+        thread.join()
+        assert len(errors) == 1
+        # a failed flight is not cached
+        assert flights.do("get", "key", lambda: 1) == 1
@@ -0,0 +1,68 @@
+import json
+import time
+
+from kade_drive.core.node import Node
+from kade_drive.core.peerstats import PeerStats
+from kade_drive.core.routing import RoutingTable
+from kade_drive.core.snapshot import RoutingSnapshot
+from kade_drive.core.utils import digest
+
+
+class TestRoutingSnapshot:
+    def test_save_and_load(self, tmp_path):  # pylint: disable=no-self-use
+        me = Node(digest("me"), "10.0.0.1", 8086)
+        table = RoutingTable(20, me)
+        nodes = [Node(digest(i), "10.0.0.2", 8086 + i) for i in range(10)]
+        for node in nodes:
+            table.add_contact(node)
+        stats = PeerStats()
+        stats.record("10.0.0.2", 8087, 0.25, True)
+
+        snapshot = RoutingSnapshot(str(tmp_path / "routing.json"))
+        assert snapshot.save(me, table, stats) == 10
+        saved, contacts = snapshot.load()
+        assert (saved.id, saved.ip, saved.port) == (me.id, me.ip, me.port)
+        assert {contact.id for contact, _, _ in contacts} == {n.id for n in nodes}
+        # only peers that answered have a round trip time
+        rtts = {(c.ip, c.port): rtt for c, _, rtt in contacts}
+        assert rtts[("10.0.0.2", 8087)] == 0.25
+        assert rtts[("10.0.0.2", 8086)] is None
+
+    def test_old_contacts_and_order(self, tmp_path):  # pylint: disable=no-self-use
+        path = tmp_path / "routing.json"
+        now = time.time()
+        entries = [
+            {
+                "id": digest(i).hex(),
+                "ip": "10.0.0.2",
+                "port": i,
+                "last_seen": seen,
+                "rtt": None,
+            }
+            for i, seen in enumerate([now - 100, now - 7200, now - 10])
+        ]
+        path.write_text(
+            json.dumps(
+                {
+                    "version": 1,
+                    "node": digest("me").hex(),
+                    "ip": "10.0.0.1",
+                    "port": 8086,
+                    "contacts": entries,
+                }
+            )
+        )
+        _, contacts = RoutingSnapshot(str(path), max_age=3600).load()
+        assert [contact.port for contact, _, _ in contacts] == [2, 0]
+
+    def test_missing_or_broken(self, tmp_path):  # pylint: disable=no-self-use
+        path = tmp_path / "routing.json"
+        assert RoutingSnapshot(str(path)).load() == (None, [])
+        path.write_text("{not json")
+        assert RoutingSnapshot(str(path)).load() == (None, [])
+
+    def test_creates_directory(self, tmp_path):  # pylint: disable=no-self-use
+        me = Node(digest("me"), "10.0.0.1", 8086)
+        snapshot = RoutingSnapshot(str(tmp_path / "static" / "routing-8086.json"))
+        assert snapshot.save(me, RoutingTable(20, me)) == 0
+        assert snapshot.load()[0].id == me.id
@@ -0,0 +1,212 @@
+import socket
+import threading
+import time
+
+import pytest
+import rpyc
+from rpyc.core import vinegar
+from rpyc.core.async_ import AsyncResultTimeout
+
+from kade_drive.core.node import Node
+from kade_drive.core.protocol import FileSystemProtocol
+from kade_drive.core.transport import (
+    AsyncioServer,
+    MultiplexedPool,
+    RemoteError,
+    RequestLimiter,
+    ServerBusy,
+    asyncio_connect,
+    is_busy,
+)
+from kade_drive.core.utils import digest
+
+
+@rpyc.service
+class EchoService(rpyc.Service):
+    @rpyc.exposed
+    def echo(self, value, delay=0):
+        time.sleep(delay)
+        return value
+
+    @rpyc.exposed
+    def listing(self):
+        return [1, 2]
+
+    @rpyc.exposed
+    def fail(self):
+        raise ValueError("broken")
+
+    def hidden(self):
+        return "not exposed"
+
+
+@pytest.fixture(scope="module")
+def port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        free_port = s.getsockname()[1]
+    server = AsyncioServer(EchoService, hostname="127.0.0.1", port=free_port)
+    threading.Thread(target=server.start, daemon=True).start()
+    for _ in range(50):
+        try:
+            socket.create_connection(("127.0.0.1", free_port)).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return free_port
+
+
+class TestAsyncioTransport:
+    def test_call(self, port):  # pylint: disable=no-self-use
+        conn = asyncio_connect("127.0.0.1", port)
+        assert conn.root.echo((b"key", (1, 2), None)) == (b"key", (1, 2), None)
+        assert conn.root.echo(value="kw") == "kw"
+        # pickled requests are refused
+        with pytest.raises(RemoteError, match="not allowed"):
+            conn.root.echo((b"key", [1, 2], None))
+        conn.ping()
+        conn.close()
+
+    def test_pickled_replies(self, port):  # pylint: disable=no-self-use
+        conn = asyncio_connect("127.0.0.1", port)
+        with pytest.raises(ValueError, match="not allowed"):
+            conn.root.listing()
+        conn.close()
+        conn = asyncio_connect("127.0.0.1", port, allow_pickle=True)
+        assert conn.root.listing() == [1, 2]
+        conn.close()
+
+    def test_errors(self, port):  # pylint: disable=no-self-use
+        conn = asyncio_connect("127.0.0.1", port)
+        with pytest.raises(RemoteError, match="broken"):
+            conn.root.fail()
+        with pytest.raises(RemoteError, match="not an exposed method"):
+            conn.root.hidden()
+        # the connection is still usable
+        assert conn.root.echo(1) == 1
+
+    def test_multiplexing(self, port):  # pylint: disable=no-self-use
+        conn = asyncio_connect("127.0.0.1", port)
+        results = []
+
+        def call(value, delay):
+            results.append(conn.root.echo(value, delay))
+
+        slow = threading.Thread(target=call, args=("slow", 0.5))
+        slow.start()
+        time.sleep(0.1)
+        start = time.monotonic()
+        call("fast", 0)
+        # answered while the slow call is still running on the same connection
+        assert time.monotonic() - start < 0.3
+        slow.join()
+        assert results == ["fast", "slow"]
+
+    def test_timeout(self, port):  # pylint: disable=no-self-use
+        conn = asyncio_connect("127.0.0.1", port)
+        conn._config["sync_request_timeout"] = 0.1
+        with pytest.raises(AsyncResultTimeout):
+            conn.root.echo(1, 0.5)
+        # a late answer does not break the following calls
+        conn._config["sync_request_timeout"] = None
+        assert conn.root.echo(2) == 2
+
+    def test_timeout_when_opened(self, port):  # pylint: disable=no-self-use
+        conn = asyncio_connect("127.0.0.1", port, timeout=0.1)
+        with pytest.raises(AsyncResultTimeout):
+            conn.root.echo(1, 0.5)
+        assert conn.root.echo(2) == 2
+
+    def test_pool_shares_connection(self, port):  # pylint: disable=no-self-use
+        pool = MultiplexedPool()
+        first = pool.acquire("127.0.0.1", port)
+        second = pool.acquire("127.0.0.1", str(port))
+        assert first.multiplexer is second.multiplexer
+        assert pool.open_connections == 1
+
+        pool.release(first, "127.0.0.1", port)
+        pool.release(second, "127.0.0.1", port, healthy=False)
+        assert pool.open_connections == 0
+        assert first.closed
+        assert pool.acquire("127.0.0.1", port).root.echo(3) == 3
+        pool.close_all()
+
+    def test_connection_refused(self):  # pylint: disable=no-self-use
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            closed_port = s.getsockname()[1]
+        assert MultiplexedPool().acquire("127.0.0.1", closed_port) is None
+
+
+class TestBackpressure:
+    def test_limiter(self):  # pylint: disable=no-self-use
+        limiter = RequestLimiter(workers=1, max_queued=1, queue_timeout=0.1)
+        with limiter:
+            # waits in the queue for the running request, then gives up
+            with pytest.raises(ServerBusy, match="timed out"):
+                with limiter:
+                    pass
+            limiter.queued = 1
+            with pytest.raises(ServerBusy, match="queued"):
+                with limiter:
+                    pass
+            limiter.queued = 0
+        with limiter:
+            assert limiter.running == 1
+        assert limiter.running == 0
+        assert limiter.rejected == 2
+
+    def test_busy_frame(self):  # pylint: disable=no-self-use
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            free_port = s.getsockname()[1]
+        server = AsyncioServer(
+            EchoService,
+            hostname="127.0.0.1",
+            port=free_port,
+            max_workers=1,
+            max_queued=0,
+        )
+        threading.Thread(target=server.start, daemon=True).start()
+        time.sleep(0.2)
+        conn = asyncio_connect("127.0.0.1", free_port)
+
+        slow = threading.Thread(target=conn.root.echo, args=(1, 0.5))
+        slow.start()
+        time.sleep(0.1)
+        with pytest.raises(ServerBusy):
+            conn.root.echo(2)
+        slow.join()
+        assert conn.root.echo(3) == 3
+        assert server.rejected == 1
+
+    def test_busy_peer_is_kept(self, monkeypatch):  # pylint: disable=no-self-use
+        class BusyPeer:
+            def rpc_ping(self, *args):
+                raise ServerBusy("busy")
+
+        class Router:
+            removed = []
+
+            def remove_contact(self, node):
+                self.removed.append(node)
+
+        router = Router()
+        monkeypatch.setattr(
+            FileSystemProtocol, "source_node", Node(digest(0)), raising=False
+        )
+        monkeypatch.setattr(FileSystemProtocol, "router", router)
+        peer = Node(digest(1), "127.0.0.1", 8086)
+        assert FileSystemProtocol.call_ping(BusyPeer(), peer) is None
+        assert not router.removed
+
+    def test_is_busy(self):  # pylint: disable=no-self-use
+        remote = vinegar.load(
+            vinegar.dump(ServerBusy, ServerBusy("busy"), None, False, False),
+            import_custom_exceptions=False,
+            instantiate_custom_exceptions=False,
+            instantiate_oldstyle_exceptions=False,
+        )
+        assert not isinstance(remote, ServerBusy)
+        assert is_busy(remote)
+        assert not is_busy(ValueError("busy"))
@@ -0,0 +1,47 @@
+from kade_drive.core.upload import UploadSessions
+from kade_drive.core.utils import digest
+
+
+class TestUploadSessions:
+    def test_missing_parts(self):  # pylint: disable=no-self-use
+        sessions = UploadSessions()
+        digests = [digest(i) for i in range(5)]
+        session = sessions.begin("file", "file", digests, [1] * 5)
+        assert session.missing_parts() == [0, 1, 2, 3, 4]
+
+        session.mark_present([digests[1], digests[3]])
+        session.mark_stored(digests[4])
+        assert session.missing_parts() == [0, 2]
+
+    def test_repeated_chunks(self):  # pylint: disable=no-self-use
+        sessions = UploadSessions()
+        session = sessions.begin("file", "file", [digest(1), digest(2), digest(1)], [1, 1, 1])
+        session.mark_stored(digest(1))
+        assert session.missing_parts() == [1]
+
+    def test_finish(self):  # pylint: disable=no-self-use
+        sessions = UploadSessions()
+        session = sessions.begin("file", "file", [digest(1)], [1])
+        assert sessions.get(session.id) is session
+        assert sessions.finish(session.id) is session
+        assert sessions.get(session.id) is None
+        assert sessions.finish(session.id) is None
+
+    def test_manifest(self):  # pylint: disable=no-self-use
+        sessions = UploadSessions()
+        session = sessions.begin("file", "file", [digest(1), digest(2)], [500, 20])
+        manifest = session.manifest()
+        assert list(manifest) == [(digest(1), 500), (digest(2), 20)]
+        assert manifest.total_length == 520
+        assert not manifest.has_file_hash
+
+    def test_collect_expired(self):  # pylint: disable=no-self-use
+        sessions = UploadSessions(ttl=10)
+        old = sessions.begin("old", "old", [digest(1)], [1])
+        new = sessions.begin("new", "new", [digest(2)], [1])
+        old.last_activity -= 20
+
+        assert sessions.get(old.id) is None
+        assert sessions.collect_expired() == [old]
+        assert sessions.get(new.id) is new
+        assert len(sessions) == 1
@@ -1,6 +1,13 @@
+import datetime
 import hashlib
 
-from kade_drive.core.utils import digest, shared_prefix
+from kade_drive.core.utils import (
+    batched,
+    digest,
+    from_timestamp,
+    shared_prefix,
+    to_timestamp,
+)
 
 
 class TestUtils:
@@ -23,3 +30,13 @@ class TestUtils:
 
         args = ["hi"]
         assert shared_prefix(args) == "hi"
+
+    def test_batched(self):  # pylint: disable=no-self-use
+        assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+        assert not list(batched([], 3))
+
+    def test_timestamp(self):  # pylint: disable=no-self-use
+        date = datetime.datetime(2023, 5, 1, 10, 30, 15)
+        assert from_timestamp(to_timestamp(date)) == date
+        assert to_timestamp(None) is None
+        assert from_timestamp(None) is None
@@ -0,0 +1,50 @@
+from kade_drive.core.node import Node
+from kade_drive.core.protocol import WelcomeQueue
+from kade_drive.core.utils import digest
+
+
+class TestWelcomeQueue:
+    def test_deduplicates_pending(self):  # pylint: disable=no-self-use
+        welcomed = []
+        queue = WelcomeQueue(welcomed.append)
+        node = Node(digest(1), "127.0.0.1", 8086)
+
+        assert queue.record(node)
+        assert not queue.record(Node(digest(1), "127.0.0.1", 8086))
+        assert queue.record(Node(digest(2), "127.0.0.1", 8087))
+        assert len(queue) == 2
+
+        queue.run_pending()
+        assert [n.id for n in welcomed] == [digest(1), digest(2)]
+        assert len(queue) == 0
+
+    def test_cooldown(self):  # pylint: disable=no-self-use
+        welcomed = []
+        queue = WelcomeQueue(welcomed.append, cooldown=60)
+        node = Node(digest(1), "127.0.0.1", 8086)
+        queue.record(node)
+        queue.run_pending()
+        assert not queue.record(node)
+
+        queue = WelcomeQueue(welcomed.append, cooldown=0)
+        queue.record(node)
+        queue.run_pending()
+        assert queue.record(node)
+
+    def test_failed_welcome_is_done(self):  # pylint: disable=no-self-use
+        def fail(_):
+            raise EOFError("peer went away")
+
+        queue = WelcomeQueue(fail, cooldown=60)
+        node = Node(digest(1), "127.0.0.1", 8086)
+        queue.record(node)
+        queue.run_pending()
+        assert len(queue) == 0
+        assert not queue.record(node)
+
+    def test_max_pending(self):  # pylint: disable=no-self-use
+        queue = WelcomeQueue(lambda _: None, max_pending=1)
+        assert queue.record(Node(digest(1), "127.0.0.1", 8086))
+        assert not queue.record(Node(digest(2), "127.0.0.1", 8087))
+        assert queue.pop(timeout=0).id == digest(1)
+        assert queue.pop(timeout=0) is None
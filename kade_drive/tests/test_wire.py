@@ -0,0 +1,59 @@
+import pytest
+from rpyc.core import brine
+
+from kade_drive.core import wire
+from kade_drive.core.node import Node
+from kade_drive.core.utils import digest
+
+
+class TestWire:
+    def test_nodes(self):  # pylint: disable=no-self-use
+        nodes = [Node(digest(1), "127.0.0.1", "8086"), Node(digest(2), "::1", 8087)]
+        encoded = wire.encode_nodes(nodes)
+        assert brine.dumpable(encoded)
+        assert wire.decode_find_response(encoded) == [
+            (digest(1), "127.0.0.1", 8086),
+            (digest(2), "::1", 8087),
+        ]
+        assert wire.decode_find_response(wire.encode_nodes([])) == []
+        assert wire.decode_find_response(None) is None
+
+    def test_value_and_location(self):  # pylint: disable=no-self-use
+        assert wire.decode_find_response(wire.encode_value(b"data")) == {
+            "value": b"data"
+        }
+        assert wire.decode_find_response(wire.encode_value(b"")) == {"value": b""}
+        assert wire.decode_find_response(
+            wire.encode_location("10.0.0.1", "8086")
+        ) == {"value": ("10.0.0.1", 8086)}
+        with pytest.raises(TypeError):
+            wire.encode_value({"not": "bytes"})
+        with pytest.raises(ValueError):
+            wire.decode_find_response(b"X")
+
+    def test_check_entries(self):  # pylint: disable=no-self-use
+        entries = [(digest(1), 1700000000, True), (digest(2), None, False)]
+        assert wire.decode_check_entries(wire.encode_check_entries(entries)) == entries
+
+    def test_store_entries(self):  # pylint: disable=no-self-use
+        entries = [
+            (digest(1), b"value", 1700000000, True, "file", "replicated"),
+            (digest(2), b"", None, False, "NOT DEFINED", "erasure"),
+        ]
+        assert wire.decode_store_entries(wire.encode_store_entries(entries)) == entries
+
+    def test_flags_and_check_result(self):  # pylint: disable=no-self-use
+        assert wire.decode_flags(wire.encode_flags([True, False, 1])) == (
+            True,
+            False,
+            True,
+        )
+        assert wire.decode_flags(None) is None
+        assert wire.decode_check_result(wire.encode_check_result(True, 1700000000)) == (
+            True,
+            1700000000,
+        )
+        assert wire.decode_check_result(wire.encode_check_result(False, None)) == (
+            False,
+            None,
+        )
@@ -0,0 +1,78 @@
+import random
+import time
+
+from kade_drive.core.node import Node
+from kade_drive.core.routing import RoutingTable
+from kade_drive.core.utils import digest
+from kade_drive.core.xortrie import XorTrie
+
+
+def brute_force(nodes, target: Node, k: int) -> list[Node]:
+    others = [n for n in nodes if n.id != target.id]
+    return sorted(others, key=target.distance_to)[:k]
+
+
+class TestXorTrie:
+    def test_closest_matches_brute_force(self):  # pylint: disable=no-self-use
+        trie = XorTrie()
+        nodes = {}
+        for i in range(2000):
+            node = Node(digest(i), "10.0.0.1", 8086 + i)
+            nodes[node.id] = node
+            trie.add(node)
+        for node in random.sample(list(nodes.values()), 500):
+            assert trie.remove(node)
+            del nodes[node.id]
+        assert not trie.remove(Node(digest("absent")))
+        assert len(trie) == len(nodes) == 1500
+        assert set(trie) == set(nodes.values())
+
+        for i in range(200):
+            target = Node(digest(f"target {i}"))
+            for k in (1, 8, 20):
+                assert trie.closest(target, k) == brute_force(nodes.values(), target, k)
+        # the target itself is left out
+        member = next(iter(nodes.values()))
+        assert trie.closest(member, 5) == brute_force(nodes.values(), member, 5)
+
+    def test_exclude(self):  # pylint: disable=no-self-use
+        trie = XorTrie()
+        nodes = [Node(digest(i), "10.0.0.1", 8086 + i % 2) for i in range(50)]
+        for node in nodes:
+            trie.add(node)
+        exclude = Node(digest("me"), "10.0.0.1", 8086)
+        closest = trie.closest(Node(digest("key")), 10, exclude)
+        assert len(closest) == 10
+        assert all(node.port == 8087 for node in closest)
+
+    def test_faster_than_brute_force(self):  # pylint: disable=no-self-use
+        trie = XorTrie()
+        nodes = [Node(digest(i), "10.0.0.1", 8086) for i in range(20000)]
+        for node in nodes:
+            trie.add(node)
+        targets = [Node(digest(f"target {i}")) for i in range(50)]
+
+        start = time.perf_counter()
+        for target in targets:
+            trie.closest(target, 20)
+        trie_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for target in targets:
+            brute_force(nodes, target, 20)
+        brute_time = time.perf_counter() - start
+        assert trie_time * 10 < brute_time
+
+    def test_routing_table_index(self):  # pylint: disable=no-self-use
+        table = RoutingTable(10000, Node(digest("self")), trie_index=True)
+        nodes = [Node(digest(i), "10.0.0.1", 8086 + i) for i in range(3000)]
+        for node in nodes:
+            table.add_contact(node)
+        for _ in range(30):
+            table.split_bucket(random.randrange(len(table.buckets)))
+        for node in nodes[:1000]:
+            table.remove_contact(node)
+
+        contacts = [n for bucket in table.buckets for n in bucket.get_nodes()]
+        assert len(table.index) == len(contacts)
+        target = Node(digest("key"))
+        assert table.find_neighbors(target, 20) == brute_force(contacts, target, 20)